@@ -0,0 +1,233 @@
+"""Headless batch runner for task suites.
+
+Reads tasks from a JSONL file and runs them concurrently, each session with its own
+browser worker process and so its own Chromium: --concurrency N starts N browser
+processes rather than N contexts in one browser. One result line per task is streamed
+to an output JSONL file. Tasks already recorded in the output file are skipped, so an
+interrupted run resumes where it left off.
+
+Task lines look like:
+    {"id": "export-report", "task": "Export last month's report", "url": "https://example.com",
+     "max_turns": 30, "max_tokens": 200000, "max_seconds": 600}
+Only "task" is required; the id defaults to the line number and must be unique. With
+TRAJECTORY_CACHE=1, "record_trajectory": true stores a finished run for replay.
+
+Ctrl-C cancels the running tasks at their next step and skips the rest. A second
+Ctrl-C stops waiting for them: the browser workers are shut down, so running tasks
+fail at their next browser action, and the process exits once any model call still
+in flight returns.
+
+Usage:
+    python batch.py tasks.jsonl results.jsonl [--concurrency N] [--retry-errors] [--headed]
+"""
+
+import argparse
+import json
+import os
+import queue
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+from core.budget import Budget, BudgetTracker, CancellationToken
+from core.loop import ChatLoop
+from core.messages import ConversationCache
+from core.sender import Sender
+from core.worker import RemoteBrowserManager
+
+INTERRUPTED = "batch interrupted"
+
+
+def load_tasks(path: str) -> list[dict]:
+    """
+    Read and check the task lines.
+
+    Raises:
+        ValueError: for a line without a task, with a bad limit or with an id used before
+    """
+    tasks = []
+    lines_by_id = {}
+    with open(path) as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            task = json.loads(line)
+            task["id"] = str(task.get("id", line_number))
+            if not task.get("task"):
+                raise ValueError(f"Line {line_number}: no task given")
+            if task["id"] in lines_by_id:
+                raise ValueError(f"Line {line_number}: id {task['id']} is already used on line "
+                                 f"{lines_by_id[task['id']]}")
+            try:
+                Budget.from_request(task, Budget())
+            except ValueError as e:
+                raise ValueError(f"Line {line_number}: {str(e)}") from None
+            lines_by_id[task["id"]] = line_number
+            tasks.append(task)
+    return tasks
+
+
+def positive_int(value: str) -> int:
+    """argparse type for a count that must be at least 1."""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{value!r} is not a whole number") from None
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"{number} is not positive")
+    return number
+
+
+def completed_ids(path: str, retry_errors: bool) -> set:
+    """Ids of the tasks that already have a result line in the output file."""
+    if not os.path.exists(path):
+        return set()
+    done = set()
+    with open(path) as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue  # a line cut short by a crash; the task runs again
+            if retry_errors and result.get("status") == "error":
+                continue
+            done.add(result["id"])
+    return done
+
+
+def final_text(messages: list) -> str:
+    """The text of the last assistant message, which usually holds the task's answer."""
+    for message in reversed(messages):
+        if message["role"] == Sender.ASSISSTANT:
+            return "\n".join(block["text"] for block in message["content"] if block.get("type") == "text")
+    return ""
+
+
+class BatchRunner:
+    """Runs tasks on a fixed set of sessions, one ChatLoop and browser worker each."""
+
+    def __init__(self, concurrency: int, output_path: str, headless: bool = True):
+        self.output_path = output_path
+        # Playwright's sync API and BrowserManager are one per process, so every
+        # session gets its own worker process instead of a shared browser
+        self.chat_loops = [ChatLoop(browser_manager=RemoteBrowserManager(headless=headless))
+                           for _ in range(concurrency)]
+        for chat_loop in self.chat_loops:
+            # Every task is a one-off conversation, so none is worth keeping for a next request
+            chat_loop.conversations = ConversationCache(max_sessions=0)
+        self.sessions = queue.Queue()
+        for chat_loop in self.chat_loops:
+            self.sessions.put(chat_loop)
+        self.concurrency = concurrency
+        self._write_lock = threading.Lock()
+        self._tokens: dict[str, CancellationToken] = {}
+        self._stopping = False
+
+    def run_task(self, task: dict) -> dict:
+        if self._stopping:
+            return {}
+        chat_loop = self.sessions.get()
+        cancel_token = CancellationToken()
+        self._tokens[task["id"]] = cancel_token
+        # Limits were checked by load_tasks
+        tracker = BudgetTracker(Budget.from_request(task, chat_loop.budget))
+        result = {"id": task["id"], "started_at": time.time()}
+        try:
+            if task.get("url"):
+                with chat_loop.browser_manager.get_page() as page:
+                    page.goto(task["url"], wait_until="domcontentloaded")
+            messages = chat_loop.get_response(
+                conversation_history=[{"role": Sender.USER, "content": [{"type": "text", "text": task["task"]}]}],
+                session_id=task["id"],
+                cancel_token=cancel_token,
+                tracker=tracker,
+                record_trajectory=bool(task.get("record_trajectory", False)),
+            )
+            result.update(status="stopped" if cancel_token.cancelled else "success",
+                          reason=cancel_token.reason, output=final_text(messages), messages=len(messages))
+        except Exception as e:
+            result.update(status="error", reason=f"{type(e).__name__}: {str(e)}")
+        finally:
+            del self._tokens[task["id"]]
+            self.sessions.put(chat_loop)
+        result.update(seconds=round(tracker.elapsed, 3), turns=tracker.turns, usage=tracker.usage)
+        # Interrupted tasks are left out of the output so a resumed run picks them up again
+        if result.get("reason") != INTERRUPTED:
+            self._write(result)
+        return result
+
+    def _write(self, result: dict) -> None:
+        # A whole line per write and a flush, so a crash never loses a finished task
+        with self._write_lock, open(self.output_path, "a") as f:
+            f.write(json.dumps(result) + "\n")
+            f.flush()
+        print(f"[{result['id']}] {result['status']} in {result['seconds']:.1f}s, "
+              f"{result['turns']} turns, {result['usage']['output_tokens']} output tokens")
+
+    def stop(self, *_) -> None:
+        """Cancel running tasks at their next check and skip the ones not started yet."""
+        if self._stopping:
+            raise KeyboardInterrupt  # a second Ctrl-C stops waiting, see run()
+        print("Stopping: cancelling running tasks, press Ctrl-C again to stop waiting for them")
+        self._stopping = True
+        for cancel_token in list(self._tokens.values()):
+            cancel_token.cancel(INTERRUPTED)
+
+    def run(self, tasks: list[dict]) -> list[dict]:
+        executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        try:
+            results = list(executor.map(self.run_task, tasks))
+        except KeyboardInterrupt:
+            # Leaving a with block would join the task threads; return to shut the workers down instead
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        executor.shutdown()
+        return [result for result in results if result]
+
+    def shutdown(self) -> None:
+        """Stop every session's browser worker, including those of tasks still running."""
+        for chat_loop in self.chat_loops:
+            chat_loop.browser_manager.shutdown()
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("tasks", help="JSONL file of tasks")
+    parser.add_argument("output", help="JSONL file results are appended to")
+    parser.add_argument("--concurrency", type=positive_int, default=4,
+                        help="sessions running at once, each with its own Chromium process")
+    parser.add_argument("--retry-errors", action="store_true", help="run tasks that failed last time again")
+    parser.add_argument("--headed", action="store_true", help="show the browser windows")
+    args = parser.parse_args()
+
+    try:
+        tasks = load_tasks(args.tasks)
+    except ValueError as e:
+        parser.error(f"{args.tasks}: {str(e)}")
+    done = completed_ids(args.output, args.retry_errors)
+    pending = [task for task in tasks if task["id"] not in done]
+    print(f"{len(pending)} of {len(tasks)} tasks to run, {len(done)} already done")
+    if not pending:
+        return
+
+    runner = BatchRunner(min(args.concurrency, len(pending)), args.output, headless=not args.headed)
+    signal.signal(signal.SIGINT, runner.stop)
+    start = time.perf_counter()
+    try:
+        results = runner.run(pending)
+    finally:
+        runner.shutdown()
+
+    by_status = {}
+    for result in results:
+        by_status[result["status"]] = by_status.get(result["status"], 0) + 1
+    summary = ", ".join(f"{count} {status}" for status, count in sorted(by_status.items()))
+    print(f"Ran {len(results)} tasks in {time.perf_counter() - start:.1f}s: {summary}")
+
+
+if __name__ == "__main__":
+    main()
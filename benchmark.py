@@ -0,0 +1,177 @@
+"""Startup and latency benchmarks for the agent.
+
+Usage:
+    python benchmark.py imports [--runs N]
+    python benchmark.py startup [--prompt "open google.com"]
+    python benchmark.py screenshot [--url URL] [--runs N]
+    python benchmark.py pageload [--url URL] [--runs N] [--profiles off,lean,strict]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from dotenv import load_dotenv
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Modules imported by the CLI and Flask entry points
+ENTRY_MODULES = ["core.loop", "main", "mainflask"]
+
+
+def bench_imports(runs: int) -> None:
+    """Time a cold import of each entry module in a fresh interpreter."""
+    snippet = "import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    for module in ENTRY_MODULES:
+        samples = []
+        for _ in range(runs):
+            result = subprocess.run(
+                [sys.executable, "-c", snippet.format(module=module)],
+                cwd=ROOT, capture_output=True, text=True
+            )
+            if result.returncode != 0:
+                print(f"{module}: import failed\n{result.stderr.strip()}")
+                break
+            samples.append(float(result.stdout.strip().splitlines()[-1]))
+        if samples:
+            print(f"{module}: median {statistics.median(samples) * 1000:.1f} ms over {len(samples)} runs")
+
+
+def bench_startup(prompt: str | None) -> None:
+    """Time ChatLoop construction, browser launch and, optionally, the first response."""
+    start = time.perf_counter()
+    from core.loop import ChatLoop
+    imported = time.perf_counter()
+    chat_loop = ChatLoop()
+    constructed = time.perf_counter()
+    print(f"import core.loop: {(imported - start) * 1000:.1f} ms")
+    print(f"ChatLoop(): {(constructed - imported) * 1000:.1f} ms")
+
+    try:
+        if prompt:
+            # The browser launches in parallel with this first model call
+            chat_loop.get_response(conversation_history=[{
+                "role": "user",
+                "content": [{"type": "text", "text": prompt}]
+            }])
+            print(f"time to first response: {(time.perf_counter() - start) * 1000:.1f} ms")
+        else:
+            chat_loop.browser_manager.start()
+            print(f"browser launch: {(time.perf_counter() - constructed) * 1000:.1f} ms")
+    finally:
+        chat_loop.browser_manager.cleanup()
+
+
+def _report(name: str, latencies: list[float], sizes: list[int]) -> None:
+    print(f"{name}: median {statistics.median(latencies) * 1000:.1f} ms, "
+          f"p90 {statistics.quantiles(latencies, n=10)[-1] * 1000:.1f} ms, "
+          f"median {statistics.median(sizes) / 1024:.1f} KiB over {len(latencies)} runs")
+
+
+def bench_screenshot(url: str, runs: int) -> None:
+    """Compare capture latency of page.screenshot() and the CDP screencast frame source."""
+    from core.manager import BrowserManager
+    from core.screencast import ScreencastSource
+
+    manager = BrowserManager(headless=True)
+    try:
+        with manager.get_page() as page:
+            page.goto(url, wait_until="load")
+            # Scroll by a pixel between captures so every source has a fresh frame to deliver
+            nudge = "delta => window.scrollBy(0, delta)"
+
+            latencies, sizes = [], []
+            for i in range(runs):
+                page.evaluate(nudge, 1 if i % 2 else -1)
+                start = time.perf_counter()
+                data = page.screenshot(type="png")
+                latencies.append(time.perf_counter() - start)
+                sizes.append(len(data))
+            _report("page.screenshot", latencies, sizes)
+
+            screencast = ScreencastSource(page, manager.viewport["width"], manager.viewport["height"],
+                                          quality=manager.screencast_quality)
+            screencast.start()
+            screencast.wait_for_frame(after=0.0)
+            latencies, sizes = [], []
+            for i in range(runs):
+                page.evaluate(nudge, 1 if i % 2 else -1)
+                action_time = time.time()
+                start = time.perf_counter()
+                frame = screencast.wait_for_frame(after=action_time)
+                latencies.append(time.perf_counter() - start)
+                sizes.append(len(frame.data) if frame else 0)
+            screencast.stop()
+            _report("screencast", latencies, sizes)
+    finally:
+        manager.cleanup()
+
+
+def bench_pageload(url: str, runs: int, profiles: list[str]) -> None:
+    """Compare page-load time and bytes transferred across resource-blocking profiles."""
+    from core.manager import BrowserManager
+
+    manager = BrowserManager(headless=True)
+    try:
+        with manager.get_page() as page:
+            session = page.context.new_cdp_session(page)
+            transferred = []
+            session.on("Network.loadingFinished", lambda params: transferred.append(params["encodedDataLength"]))
+            session.send("Network.enable")
+            # Every run must fetch everything again, or later profiles would look faster
+            session.send("Network.setCacheDisabled", {"cacheDisabled": True})
+
+            for profile in profiles:
+                manager.set_blocking_profile(profile)
+                latencies, sizes = [], []
+                for _ in range(runs):
+                    page.goto("about:blank")
+                    transferred.clear()
+                    start = time.perf_counter()
+                    page.goto(url, wait_until="load")
+                    latencies.append(time.perf_counter() - start)
+                    sizes.append(sum(transferred))
+                _report(f"load ({profile})", latencies, sizes)
+                print(f"  {manager.blocking_stats()}")
+            session.detach()
+    finally:
+        manager.cleanup()
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    imports_parser = subparsers.add_parser("imports", help="cold import time of the entry modules")
+    imports_parser.add_argument("--runs", type=int, default=5)
+
+    startup_parser = subparsers.add_parser("startup", help="ChatLoop and browser startup time")
+    startup_parser.add_argument("--prompt", help="also time the first response to this prompt")
+
+    screenshot_parser = subparsers.add_parser("screenshot", help="screenshot capture latency per frame source")
+    screenshot_parser.add_argument("--url", default="https://example.com")
+    screenshot_parser.add_argument("--runs", type=int, default=20)
+
+    pageload_parser = subparsers.add_parser("pageload", help="page-load time and bytes per blocking profile")
+    pageload_parser.add_argument("--url", default="https://www.theverge.com")
+    pageload_parser.add_argument("--runs", type=int, default=5)
+    pageload_parser.add_argument("--profiles", default="off,lean,strict",
+                                 help="comma separated blocking profiles to compare")
+
+    args = parser.parse_args()
+    if args.command == "imports":
+        bench_imports(args.runs)
+    elif args.command == "startup":
+        bench_startup(args.prompt)
+    elif args.command == "screenshot":
+        bench_screenshot(args.url, args.runs)
+    elif args.command == "pageload":
+        bench_pageload(args.url, args.runs, args.profiles.split(","))
+
+
+if __name__ == "__main__":
+    main()
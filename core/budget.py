@@ -0,0 +1,115 @@
+import os
+import math
+import time
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+
+class CancellationToken:
+    """
+    Cooperative stop signal for a running task.
+
+    ChatLoop checks it between model calls and between tool actions; whoever holds
+    the token (a stop button, an HTTP endpoint, a budget) can cancel it from any thread.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self.reason: Optional[str] = None
+
+    def cancel(self, reason: str = "cancelled by the user") -> None:
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+
+@dataclass
+class Budget:
+    """Per-task limits; None means unlimited."""
+    max_turns: Optional[int] = None
+    max_tokens: Optional[int] = None
+    max_seconds: Optional[float] = None
+
+    @classmethod
+    def from_env(cls) -> "Budget":
+        def env(name: str, cast):
+            value = os.getenv(name)
+            return cast(value) if value else None
+        return cls(
+            max_turns=env("TASK_MAX_TURNS", int),
+            max_tokens=env("TASK_MAX_TOKENS", int),
+            max_seconds=env("TASK_MAX_SECONDS", float),
+        )
+
+    @classmethod
+    def from_request(cls, data: dict, defaults: "Budget") -> "Budget":
+        """
+        Limits given in a request or task as max_turns, max_tokens and max_seconds,
+        each falling back to the default when absent or null.
+
+        Raises:
+            ValueError: if a limit is not a positive number (a whole one for turns and tokens)
+        """
+        def limit(name: str, whole: bool):
+            value = data.get(name)
+            if value is None:
+                return getattr(defaults, name)
+            if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+                raise ValueError(f"{name} must be a number")
+            try:
+                number = value if isinstance(value, int) else float(value)
+            except ValueError:
+                raise ValueError(f"{name} must be a number") from None
+            fraction = isinstance(number, float) and not number.is_integer()
+            if not math.isfinite(number) or number <= 0 or (whole and fraction):
+                raise ValueError(f"{name} must be a positive {'whole ' if whole else ''}number")
+            return int(number) if whole else number
+        return cls(
+            max_turns=limit("max_turns", whole=True),
+            max_tokens=limit("max_tokens", whole=True),
+            max_seconds=limit("max_seconds", whole=False),
+        )
+
+
+class BudgetTracker:
+    """Counts a task's model turns, tokens and elapsed time against its Budget."""
+
+    def __init__(self, budget: Budget):
+        self.budget = budget
+        self.started = time.monotonic()
+        self.turns = 0
+        self.tokens = 0
+        self.usage = {"input_tokens": 0, "output_tokens": 0,
+                      "cache_read_input_tokens": 0, "cache_creation_input_tokens": 0}
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def add_turn(self, usage) -> None:
+        self.turns += 1
+        if usage is not None:
+            self.tokens += (usage.input_tokens or 0) + (usage.output_tokens or 0)
+            for field in self.usage:
+                self.usage[field] += getattr(usage, field, None) or 0
+
+    def exceeded(self, next_turn: bool = False) -> Optional[str]:
+        """
+        Which limit the task has reached, or None while it is within budget.
+
+        The turn limit only applies before starting another turn, so the tool
+        actions of the last allowed turn still run.
+        """
+        budget = self.budget
+        if next_turn and budget.max_turns is not None and self.turns >= budget.max_turns:
+            return f"turn budget of {budget.max_turns} reached"
+        if budget.max_tokens is not None and self.tokens >= budget.max_tokens:
+            return f"token budget of {budget.max_tokens} reached ({self.tokens} used)"
+        if budget.max_seconds is not None and self.elapsed >= budget.max_seconds:
+            return f"time budget of {budget.max_seconds:.0f}s reached"
+        return None
@@ -12,6 +12,8 @@ from enum import StrEnum
 import time
 from typing import List
 from tools.collection import ToolCollection
+from core.router import BackendRouter
+from core.messages import Conversation
 from anthropic import (
     Anthropic,
     AnthropicBedrock,
@@ -51,10 +53,8 @@ SYSTEM_PROMPT = f"""<SYSTEM_CAPABILITY>
 
 class ClaudeManager:
     def __init__(self):
-        # init helcione
-        self.client = Anthropic(api_key=os.getenv('ANTHROPIC_API_KEY'),
-                                base_url="https://anthropic.helicone.ai",
-                                default_headers={"Helicone-Auth": f"Bearer {os.environ.get('HELICONE_API_KEY')}"})
+        # Anthropic (via helicone), Bedrock and Vertex backends, picked per call by latency
+        self.router = BackendRouter.from_env()
 
         self.system_prompt = SYSTEM_PROMPT
         self.only_n_most_recent_images = 3  # default value
@@ -62,24 +62,29 @@ class ClaudeManager:
 
     def filter_recent_images(self, messages: List[dict], images_to_keep: int = None) -> List[dict]:
         """
-        Filter messages to keep only N most recent images in tool results.
+        Filter messages to keep only N most recent images in tool results and user turns.
         """
         if images_to_keep is None:
             return messages
 
-        # Find all tool result blocks that contain images
-        tool_result_blocks = [
-            item
-            for message in messages
-            for item in (message["content"] if isinstance(message["content"], list) else [])
-            if isinstance(item, dict) and item.get("type") == "tool_result"
-        ]
+        # Find all blocks that hold images: tool results, and user turns carrying
+        # an initial screenshot, oldest first
+        image_containers = []
+        for message in messages:
+            if not isinstance(message["content"], list):
+                continue
+            if any(isinstance(item, dict) and item.get("type") == "image" for item in message["content"]):
+                image_containers.append(message)
+            image_containers.extend(
+                item for item in message["content"]
+                if isinstance(item, dict) and item.get("type") == "tool_result"
+            )
 
         # Count total images
         total_images = sum(
             1
-            for tool_result in tool_result_blocks
-            for content in tool_result.get("content", [])
+            for container in image_containers
+            for content in container.get("content", [])
             if isinstance(content, dict) and content.get("type") == "image"
         )
 
@@ -91,35 +96,45 @@ class ClaudeManager:
         if images_to_remove <= 0:
             return messages
 
-        # Filter images from tool results
-        for tool_result in tool_result_blocks:
-            if isinstance(tool_result.get("content"), list):
+        # Filter images from the oldest blocks first
+        for container in image_containers:
+            if isinstance(container.get("content"), list):
                 new_content = []
-                for content in tool_result.get("content", []):
+                for content in container.get("content", []):
                     if isinstance(content, dict) and content.get("type") == "image":
                         if images_to_remove > 0:
                             images_to_remove -= 1
                             continue
                     new_content.append(content)
-                tool_result["content"] = new_content
+                container["content"] = new_content
 
         return messages
     
-    def call_claude(self, conversation_history: list = None, max_retries: int = 1, only_n_most_recent_images: int = None, tool_collection: ToolCollection = None) -> Dict[str, Any]:
+    def call_claude(self, conversation_history: list | Conversation = None, max_retries: int = 1, only_n_most_recent_images: int = None, tool_collection: ToolCollection = None) -> Dict[str, Any]:
         retry_count = 0
         betas = [COMPUTER_USE_BETA_FLAG]
-        filtered_conversation_history = self.filter_recent_images(conversation_history.copy(), only_n_most_recent_images)
+        if isinstance(conversation_history, Conversation):
+            # Typed history: only messages that changed since the last call get serialized
+            conversation_history.filter_recent_images(only_n_most_recent_images, self.min_removal_threshold)
+        else:
+            filtered_conversation_history = self.filter_recent_images(conversation_history.copy(), only_n_most_recent_images)
         while retry_count < max_retries:
             try:
-                raw_response = self.client.beta.messages.with_raw_response.create(
-                    model="claude-3-5-sonnet-20241022",
+                if isinstance(conversation_history, Conversation):
+                    return self.router.create_preserialized(
+                        messages_json=conversation_history.to_json(),
+                        betas=betas,
+                        max_tokens=4096,
+                        system=self.system_prompt,
+                        tools=tool_collection.to_params(),
+                    )
+                response = self.router.create(
                     max_tokens=4096,
                     system=self.system_prompt,
                     messages=filtered_conversation_history, 
                     betas=betas,
                     tools=tool_collection.to_params(),
                 )
-                response = raw_response.parse()
                 return response
                 
             except (APIStatusError, APIResponseValidationError) as e:
@@ -1,134 +1,442 @@
 import os
+import time
 import threading
-from playwright.sync_api import sync_playwright
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any, Optional
 import logging
-from queue import Queue
 from tools.computer import ComputerTool
+from tools.bash import BashTool
 from core.claude import ClaudeManager
 from core.sender import Sender
 from tools.collection import ToolCollection
 from tools.browsertools import BrowserTool
 from core.manager import BrowserManager
-import streamlit as st
+from core.worker import create_browser_manager
+from utils.utils import hash_distance, perceptual_hash, screenshot_helper
+from utils.cache import ExtractionCache
+from core.metrics import (ACTIVE_SESSIONS, BROWSERS_BUSY, SCREENSHOT_BYTES, TOOL_SECONDS,
+                          record_usage)
+from core.messages import Conversation, ConversationCache, Message, TextBlock, ToolResultBlock, ToolUseBlock
+from core.trajectory import TrajectoryCache, TrajectoryRecorder
+from core.profiler import TurnProfiler
+from core.budget import Budget, BudgetTracker, CancellationToken
+
+# Tools that hold the browser while they run
+BROWSER_TOOLS = ("computer", "browser")
 
-@st.cache_resource
-def get_browser_manager():
-    return BrowserManager(headless=False)
 
 class ChatLoop:
-    def __init__(self):
+    def __init__(self, browser_manager: Optional[BrowserManager] = None):
         """Initialize the chat loop with tools and browser manager."""
         self.claude_manager = ClaudeManager()
         self.only_n_most_recent_images = 1
+        # Opt-in: attach a screenshot of the page to the first user turn so the model can act on turn one
+        self.speculative_screenshot = os.getenv("SPECULATIVE_SCREENSHOT", "0") == "1"
+        self.speculative_stats = {"tasks": 0, "turns_saved": 0}
+        self.extraction_cache = ExtractionCache.from_env()
+        # Default per-task limits from TASK_MAX_TURNS/TOKENS/SECONDS; unlimited when unset
+        self.budget = Budget.from_env()
+        # Opt-in: replay recorded action sequences of repeated tasks (TRAJECTORY_CACHE=1)
+        self.trajectory_cache = TrajectoryCache.from_env()
+        # Typed conversations between a session's requests
+        self.conversations = ConversationCache()
         
-        
-        if not hasattr(st.session_state, 'browser_manager'):
+        # Frontends pass their own manager; otherwise the browser launches alongside the first model call
+        if browser_manager is None:
             print("Creating new browser manager")
-            st.session_state.browser_manager = BrowserManager()
-        
-        
-        # Initialize browser manager first
-        self.browser_manager = st.session_state.browser_manager
+            browser_manager = create_browser_manager()
+        self.browser_manager = browser_manager
         
         # Initialize tools with browser manager
         self.tool_collection = ToolCollection(
             ComputerTool(browser_manager=self.browser_manager),
+            BashTool(),
+            BrowserTool(browser_manager=self.browser_manager, cache=self.extraction_cache),
         )
     
-    def _handle_tool_execution(self, content, messages, render_callback) -> tuple[dict, bool]:
+    def _handle_tool_execution(self, content, session_id: str) -> tuple[Message, bool]:
         """Handle tool execution and create appropriate messages."""
-        tool_block = {
-            "type": "tool_use",
-            "id": content.id,
-            "name": content.name,
-            "input": content.input
-        }
-        
-        tool_result_message = {"role": Sender.USER, "content": []}
+        tool_result_message = Message(Sender.USER)
+        uses_browser = content.name in BROWSER_TOOLS
+        if uses_browser:
+            BROWSERS_BUSY.inc()
+        start = time.perf_counter()
         
         try:
             tool_result = self.tool_collection.run(
                 name=content.name,
-                tool_input=content.input
+                tool_input=content.input,
+                session_id=session_id
             )
-            result_block = self.tool_collection.process_tool_output(
+            if tool_result.image:
+                SCREENSHOT_BYTES.observe(len(tool_result.image), media_type=tool_result.media_type or "image/png")
+            result_block = ToolResultBlock.from_tool_result(
                 tool_result,
                 content.id
             )
-            tool_result_message["content"].append(result_block)
+            tool_result_message.append(result_block)
             return tool_result_message, True
             
         except Exception as e:
-            error_block = {
-                "type": "tool_result",
-                "tool_use_id": content.id,
-                "content": f"Tool execution failed: {str(e)}",
-                "is_error": True
-            }
-            tool_result_message["content"].append(error_block)
+            error_block = ToolResultBlock(
+                content.id,
+                f"Tool execution failed: {str(e)}",
+                is_error=True
+            )
+            tool_result_message.append(error_block)
             return tool_result_message, False
+        finally:
+            TOOL_SECONDS.observe(time.perf_counter() - start, tool=content.name,
+                                 action=content.input.get("action", ""))
+            if uses_browser:
+                BROWSERS_BUSY.dec()
+
+    def _attach_initial_screenshot(self, messages: list) -> bool:
+        """Attach a screenshot, URL and title of the current page to the first user turn."""
+        # Only the opening prompt of a chat; later prompts follow turns that already show the page
+        if len(messages) != 1 or messages[0]["role"] != Sender.USER:
+            return False
+        content = messages[0]["content"]
+        if isinstance(content, str):
+            content = [{"type": "text", "text": content}]
+
+        try:
+            with self.browser_manager.get_page() as page:
+                screenshot_base64 = screenshot_helper(page)
+                url, title = page.url, page.title()
+        except Exception as e:
+            logging.error(f"Failed to take initial screenshot: {str(e)}")
+            return False
+
+        messages[0] = {**messages[0], "content": [
+            *content,
+            {"type": "text", "text": f"The browser is showing \"{title}\" at {url}. Here is a screenshot of it."},
+            {"type": "image", "source": {"type": "base64", "media_type": "image/png", "data": screenshot_base64}},
+        ]}
+        return True
+
+    def _record_speculative_outcome(self, response) -> None:
+        """Count a saved turn when the model did not start by asking for a screenshot anyway."""
+        self.speculative_stats["tasks"] += 1
+        first_tool_use = next((content for content in response.content if content.type == "tool_use"), None)
+        if not (first_tool_use and first_tool_use.input.get("action") == "screenshot"):
+            self.speculative_stats["turns_saved"] += 1
+        print(f"Speculative screenshot: {self.speculative_stats['turns_saved']} turns saved "
+              f"over {self.speculative_stats['tasks']} tasks")
+
+    def _call_claude(self, conversation: Conversation):
+        return self.claude_manager.call_claude(
+            conversation_history=conversation,
+            only_n_most_recent_images=self.only_n_most_recent_images,
+            tool_collection=self.tool_collection
+        )
 
-    def get_response(self, conversation_history: list = None, render_callback=None, max_retries: int = 1) -> list:
-        """Get response from Claude and handle tool executions."""
+    def _call_claude_while_starting_browser(self, conversation: Conversation, profile: TurnProfiler):
+        """Launch the browser in parallel with the first model call."""
+        # Playwright's sync API is bound to the thread that started it, so the browser
+        # launches in this thread while the HTTP call runs in a worker thread.
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(self._call_claude, conversation)
+            # The profiler samples this thread, which is busy with the launch, not the call
+            profile.tag("browser launch")
+            self.browser_manager.start()
+            profile.tag("model call")
+            return future.result()
+
+    def get_response(self, conversation_history: list = None, render_callback=None, max_retries: int = 1,
+                     session_id: str = "default", budget: Optional[Budget] = None,
+                     cancel_token: Optional[CancellationToken] = None,
+                     tracker: Optional[BudgetTracker] = None, record_trajectory: bool = False) -> list:
+        """
+        Get response from Claude and handle tool executions.
+
+        The task stops early when cancel_token is cancelled or the budget (self.budget
+        by default) runs out; the reason is left in cancel_token.reason. Pass a tracker
+        to read the task's turns, token usage and time afterwards. With the trajectory
+        cache on, record_trajectory stores the run for replay once it finishes, so pass
+        it only for tasks whose finishing means success.
+        """
+        cancel_token = cancel_token or CancellationToken()
+        tracker = tracker or BudgetTracker(budget or self.budget)
+        profile = TurnProfiler(session_id)
         messages = conversation_history if conversation_history else []
+        # Typed copy of the history; each message is serialized once and reused every turn,
+        # and the session's messages from its last request are reused as they are
+        conversation = self.conversations.take(session_id, messages)
+        ACTIVE_SESSIONS.inc()
+        try:
+            return self._run_task(messages, conversation, render_callback, session_id, tracker, cancel_token,
+                                  profile, record_trajectory)
+        except BaseException as e:
+            # Interrupted from outside, e.g. Streamlit stopping the script run for a stop button
+            if not isinstance(e, Exception):
+                cancel_token.cancel("interrupted")
+            raise
+        finally:
+            profile.finish()
+            ACTIVE_SESSIONS.dec()
+            self.conversations.put(session_id, conversation)
+            if cancel_token.cancelled:
+                # Only this task's hold is dropped; the browser itself stays up for other sessions
+                self._release_browser()
+            # The in-process frontends never call cleanup(), so the warm-start snapshot is kept here
+            self._save_browser_state()
+
+    def _should_stop(self, tracker: BudgetTracker, cancel_token: CancellationToken, next_turn: bool = False) -> bool:
+        reason = tracker.exceeded(next_turn=next_turn)
+        if reason:
+            cancel_token.cancel(reason)
+        return cancel_token.cancelled
+
+    def _release_browser(self) -> None:
+        try:
+            self.browser_manager.release()
+        except Exception as e:
+            logging.error(f"Failed to release browser: {str(e)}")
+
+    def _recycle_browser_if_needed(self) -> None:
+        if not self.browser_manager.is_started:
+            return
+        try:
+            self.browser_manager.recycle_if_needed()
+        except Exception as e:
+            # The old context may be closed already, so bring the page back from the checkpoint
+            logging.error(f"Failed to recycle browser context: {str(e)}")
+            try:
+                self.browser_manager.recover()
+            except Exception as recover_error:
+                # Shut down; the next model call launches it again
+                logging.error(f"Browser recovery failed: {str(recover_error)}")
+                self.browser_manager.cleanup()
+
+    def _save_browser_state(self) -> None:
+        try:
+            if self.browser_manager.is_started:
+                self.browser_manager.save_state()
+        except Exception as e:
+            logging.error(f"Failed to save browser state: {str(e)}")
+
+    def _screen_hash(self) -> int:
+        """
+        Perceptual hash of the screen, from the frame the previous computer action
+        already captured when there is one, so checks between actions cost no screenshot.
+        """
+        computer = self.tool_collection.tool_map.get("computer")
+        frame = computer.last_frame if computer else None
+        if frame is None:
+            with self.browser_manager.get_page() as page:
+                frame = page.screenshot(type="png")
+        return perceptual_hash(frame)
+
+    def _reset_orphaned_keyframe(self, messages: list) -> None:
+        """Make the next screenshot a full frame if the kept history lost the keyframe deltas refer to."""
+        computer = self.tool_collection.tool_map.get("computer")
+        differ = computer.frame_differ if computer else None
+        if differ is None or differ.keyframe_image is None:
+            return
+        keyframe = differ.keyframe_base64
+        for message in messages:
+            if not isinstance(message["content"], list):
+                continue
+            for block in message["content"]:
+                if not isinstance(block, dict):
+                    continue
+                images = block.get("content") if block.get("type") == "tool_result" else [block]
+                if not isinstance(images, list):
+                    continue
+                if any(isinstance(image, dict) and image.get("type") == "image"
+                       and image["source"].get("data") == keyframe for image in images):
+                    return
+        # Another task's, another session's, or dropped with the older images
+        differ.reset()
+
+    def _task_key(self, messages: list) -> Optional[str]:
+        """Trajectory cache key of a fresh single-prompt task, or None if it cannot be cached."""
+        if self.trajectory_cache is None or len(messages) != 1 or messages[0]["role"] != Sender.USER:
+            return None
+        content = messages[0]["content"]
+        if isinstance(content, str):
+            text = content
+        elif all(isinstance(block, dict) and block.get("type") == "text" for block in content):
+            text = " ".join(block["text"] for block in content)
+        else:
+            return None
+        # The starting URL is part of the key, so the browser launches up front in this mode
+        with self.browser_manager.get_page() as page:
+            return self.trajectory_cache.key(text, page.url)
+
+    def _replay_trajectory(self, key: str, trajectory: dict, messages: list, conversation: Conversation,
+                           render_callback, cancel_token: CancellationToken) -> Optional[list]:
+        """
+        Replay the recorded actions of a task, checking the screen before each one.
+
+        A trajectory that diverges or fails is dropped from the cache, so later runs
+        do not replay a stale prefix; the live run may record it again.
+
+        Returns:
+            None if the whole task was replayed, otherwise the steps that replayed
+            cleanly, after which the live loop continues
+        """
+        start = time.monotonic()
+        replayed = 0
+        for index, step in enumerate(trajectory["steps"]):
+            if cancel_token.cancelled:
+                break
+            distance = hash_distance(self._screen_hash(), step["screen_hash"])
+            if distance > self.trajectory_cache.tolerance:
+                print(f"Trajectory diverged at step {index + 1} ({distance} bits off), handing over to the model")
+                self.trajectory_cache.invalidate(key)
+                break
+            # Recorded as if the model had chosen the action, so a live takeover sees the full history
+            tool_use = ToolUseBlock(f"toolu_replay_{index}", "computer", step["input"])
+            try:
+                tool_result = self.tool_collection.run(name="computer", tool_input=step["input"])
+            except Exception as e:
+                # Nothing of this step is in the history yet, so the model takes over before it
+                logging.error(f"Replayed action failed at step {index + 1}: {str(e)}")
+                self.trajectory_cache.invalidate(key)
+                break
+            turn = [Message(Sender.ASSISSTANT, [tool_use]),
+                    Message(Sender.USER, [ToolResultBlock.from_tool_result(tool_result, tool_use.id)])]
+            if trajectory["final_text"] and index == len(trajectory["steps"]) - 1 and not tool_result.error:
+                turn.append(Message(Sender.ASSISSTANT, [TextBlock(trajectory["final_text"])]))
+            for message in turn:
+                conversation.append(message)
+                messages.append(message.to_param())
+            if render_callback:
+                for position in range(len(messages) - len(turn), len(messages)):
+                    render_callback(messages[position])
+            replayed += 1
+            if tool_result.error:
+                self.trajectory_cache.invalidate(key)
+                break
+
+        self.trajectory_cache.record_replay(trajectory, replayed, time.monotonic() - start)
+        print(f"Trajectory cache: replayed {replayed} of {len(trajectory['steps'])} steps, "
+              f"{self.trajectory_cache.stats()}")
+        if replayed == len(trajectory["steps"]) and messages[-1]["role"] == Sender.ASSISSTANT:
+            return None
+        # A step that failed is in the history, but not among the steps worth recording again
+        clean = replayed - 1 if replayed and tool_result.error else replayed
+        return trajectory["steps"][:clean]
+
+    def _run_task(self, messages: list, conversation: Conversation, render_callback, session_id: str,
+                  tracker: BudgetTracker, cancel_token: CancellationToken, profile: TurnProfiler,
+                  record_trajectory: bool = False) -> list:
+        # Delta frames must not outlive the full frame they refer to in the kept images
+        computer = self.tool_collection.tool_map.get("computer")
+        if computer and computer.frame_differ:
+            computer.frame_differ.max_deltas = max(self.only_n_most_recent_images - 1, 0)
+        # The page may have moved on since the last task's final action
+        if computer:
+            computer.last_frame = None
+        # Replayed actions screenshot before the first turn, so check the keyframe here too
+        self._reset_orphaned_keyframe(messages)
+        # A repeated task replays its recorded actions first; a fresh one is recorded
+        recorder = None
+        task_key = self._task_key(messages)
+        if task_key:
+            trajectory = self.trajectory_cache.get(task_key)
+            steps = []
+            if trajectory is not None:
+                steps = self._replay_trajectory(task_key, trajectory, messages, conversation, render_callback,
+                                                cancel_token)
+                if steps is None:
+                    return messages
+            # A run can also end without tool use by giving up, so only runs the caller
+            # asks for are stored; after a divergence, recording picks up where it happened
+            if record_trajectory:
+                recorder = TrajectoryRecorder(task_key, steps)
+        # The screenshot needs the browser, so in this mode it launches up front
+        speculated = self.speculative_screenshot and self._attach_initial_screenshot(messages)
+        if speculated:
+            conversation.messages[0] = Message.from_param(messages[0])
         
         while True:
             try:
+                if self._should_stop(tracker, cancel_token, next_turn=True):
+                    print(f"Task stopped: {cancel_token.reason}")
+                    return messages
+                # Between turns is the one safe moment to swap a bloated or old context for a fresh one
+                self._recycle_browser_if_needed()
+                profile.begin_turn()
+                # The request drops all but the most recent images; drop the same ones from the
+                # returned history so what frontends keep and persist stays bounded
+                self.claude_manager.filter_recent_images(messages, self.only_n_most_recent_images)
+                self._reset_orphaned_keyframe(messages)
+                
                 # Get response from Claude
-                response = self.claude_manager.call_claude(
-                    conversation_history=messages,
-                    only_n_most_recent_images=self.only_n_most_recent_images,
-                    tool_collection=self.tool_collection
-                )
+                if self.browser_manager.is_started:
+                    response = self._call_claude(conversation)
+                else:
+                    response = self._call_claude_while_starting_browser(conversation, profile)
+                usage = getattr(response, "usage", None)
+                record_usage(usage)
+                tracker.add_turn(usage)
+                if speculated:
+                    self._record_speculative_outcome(response)
+                    speculated = False
                 
-                claude_message = {"role": Sender.ASSISSTANT, "content": []}
-                tool_result_message = None
+                claude_message = Message.from_response(response)
+                tool_result_message = Message(Sender.USER)
                 continue_loop = False
                 
-                # Process each content block from Claude's response
+                # Execute the tools Claude asked for
                 for content in response.content:
-                    if content.type == "text":
-                        claude_message["content"].append({
-                            "type": "text",
-                            "text": content.text
-                        })
-                    elif content.type == "tool_use":
-                        claude_message["content"].append({
-                            "type": "tool_use",
-                            "id": content.id,
-                            "name": content.name,
-                            "input": content.input
-                        })
-                        
-                        # Execute tool and get result
-                        tool_result_message, should_continue = self._handle_tool_execution(
-                            content, messages, render_callback
-                        )
-                        continue_loop = continue_loop or should_continue
+                    if content.type != "tool_use":
+                        continue
+                    if self._should_stop(tracker, cancel_token):
+                        # Every tool use still needs a result for the history to stay valid
+                        tool_result_message.append(ToolResultBlock(
+                            content.id, f"Not executed: task stopped ({cancel_token.reason})", is_error=True
+                        ))
+                        continue
+                    if recorder and recorder.usable:
+                        if content.name == "computer":
+                            recorder.add_step(content.input, self._screen_hash())
+                        else:
+                            recorder.usable = False
+                    # Execute tool and get result
+                    profile.tag(f"{content.name} {content.input.get('action', '')}".strip())
+                    result_message, should_continue = self._handle_tool_execution(content, session_id)
+                    for block in result_message.content:
+                        tool_result_message.append(block)
+                    continue_loop = continue_loop or should_continue
+                    if recorder and not should_continue:
+                        recorder.usable = False
                 
-                # Add Claude's message to history
-                messages.append(claude_message)
+                # Add Claude's message and the tool results to history together, before rendering,
+                # so an interrupted render never leaves a tool use without its result
+                turn = [claude_message] if not tool_result_message.content else [claude_message, tool_result_message]
+                for message in turn:
+                    conversation.append(message)
+                    messages.append(message.to_param())
                 if render_callback:
-                    render_callback(claude_message)
+                    for index in range(len(messages) - len(turn), len(messages)):
+                        render_callback(messages[index])
                 
-                # If no tool was used or tool execution failed, return messages
-                if not tool_result_message:
+                # If no tool was used, return messages
+                if not tool_result_message.content:
+                    if recorder and recorder.usable and recorder.steps and not cancel_token.cancelled:
+                        final_text = "\n".join(block.text for block in claude_message.content
+                                               if isinstance(block, TextBlock))
+                        self.trajectory_cache.put(recorder.key, recorder.finish(final_text))
                     return messages
                 
-                # Add tool result to history
-                messages.append(tool_result_message)
-                if render_callback:
-                    render_callback(tool_result_message)
-                
                 # Continue loop if needed for additional tool actions
-                if not continue_loop:
+                if not continue_loop or cancel_token.cancelled:
+                    if cancel_token.cancelled:
+                        print(f"Task stopped: {cancel_token.reason}")
                     return messages
                 
             except Exception as e:
                 logging.error(f"Failed to get response: {str(e)}")
-                # Clean up browser resources on error
-                self.browser_manager.cleanup()
+                # Bring the browser back to the last checkpoint rather than tearing it down
+                try:
+                    self.browser_manager.recover()
+                except Exception as recover_error:
+                    logging.error(f"Browser recovery failed: {str(recover_error)}")
+                    self.browser_manager.cleanup()
                 raise
     
     def __enter__(self):
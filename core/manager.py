@@ -1,3 +1,4 @@
+import json
 import threading
 import logging
 from typing import Optional
@@ -5,7 +6,21 @@ from playwright.sync_api import sync_playwright, Browser, Page, BrowserContext
 import time
 from contextlib import contextmanager
 from queue import Queue
+from collections import deque
 from dataclasses import dataclass
+import os
+from core.screencast import ScreencastSource
+from core.blocking import BlockingProfile, RequestBlocker, get_profile
+from core.memory import MemoryWatchdog
+from core.metrics import BROWSERS_STARTED, BROWSER_QUEUE_DEPTH
+from utils.utils import DOM_VERSION_SCRIPT, fan_out_extract
+
+DEFAULT_VIEWPORT = {"width": 1280, "height": 800}
+# Cheapest first; each tier is tried only when the ones before it failed
+RECOVERY_TIERS = ("reload", "recreate_page", "recreate_context", "relaunch")
+CHECKPOINT_STATE_INTERVAL = 30.0  # seconds between storage state captures on the same site
+RECOVERY_TIMES_KEPT = 100  # most recent recovery durations per tier, for the mean in recovery_stats()
+DEFAULT_STATE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "awesome_computer_use", "profiles")
 
 class BrowserManager:
     _instance = None
@@ -16,67 +31,361 @@ class BrowserManager:
             cls._instance._initialized = False
             
         return cls._instance
-    def __init__(self, headless: bool = False):
+    def __init__(self, headless: bool = False, lazy_start: bool = False, profile: Optional[str] = None):
+        # Constructing the singleton again must not drop a running browser
+        if self._initialized:
+            return
         self._id = id(self)
         self.playwright = None
         self.browser: Optional[Browser] = None
         self.context: Optional[BrowserContext] = None
         self.page: Optional[Page] = None  # Single page instance
-        self._lock = threading.Lock()
+        self._lock = threading.RLock()
         self.headless = headless
+        self.viewport = dict(DEFAULT_VIEWPORT)
+        # Opt-in: serve screenshots from a CDP screencast instead of page.screenshot()
+        self.use_screencast = os.getenv("SCREENCAST", "0") == "1"
+        self.screencast_quality = int(os.getenv("SCREENCAST_QUALITY", 80))
+        self.screencast: Optional[ScreencastSource] = None
+        # Resource blocking for the context, "off" unless BLOCKING_PROFILE names a profile
+        self.blocking_profile: BlockingProfile = get_profile(os.getenv("BLOCKING_PROFILE", "off"))
+        self.blocker: Optional[RequestBlocker] = None
+        # Warm starts: a named profile restores the cookies and local storage last saved (at each
+        # checkpoint capture, at the end of each task and at cleanup); a user-data directory also
+        # keeps the HTTP cache
+        self.profile_name = profile or os.getenv("BROWSER_PROFILE") or None
+        self.state_dir = os.getenv("BROWSER_STATE_DIR", DEFAULT_STATE_DIR)
+        self.user_data_dir = os.getenv("BROWSER_USER_DATA_DIR") or None
+        # Last known good page state, restored by recover()
+        self.checkpoint: Optional[dict] = None
+        self.recovery_times = {tier: deque(maxlen=RECOVERY_TIMES_KEPT) for tier in RECOVERY_TIERS}
+        self.recoveries = {tier: 0 for tier in RECOVERY_TIERS}
+        self.recovery_failures = {tier: 0 for tier in RECOVERY_TIERS}
+        # Bounds memory on long-running servers by recycling the context between turns
+        self.memory_watchdog = MemoryWatchdog.from_env()
+        self.context_started: Optional[float] = None
         self._initialized = False
         self._main_thread_id = threading.get_ident()  # Store main thread ID
         print(f"BrowserManager initialized with ID {self._id} in thread {self._main_thread_id}")
         
-        # Initialize browser and page immediately in main thread
-        self._initialize_browser()
+        # With lazy_start the browser is launched by start() or the first get_page()
+        if not lazy_start:
+            self._initialize_browser()
+
+    @property
+    def is_started(self) -> bool:
+        return self._initialized
+
+    def start(self) -> None:
+        """Launch the browser if it is not running yet."""
+        with self._lock:
+            self._initialize_browser()
     
-    def _initialize_browser(self) -> None:
+    def _initialize_browser(self, storage_state: Optional[dict] = None) -> None:
         """Initialize the browser if not already initialized."""
         if not self._initialized:
             try:
                 print(f"Initializing browser in main thread {self._main_thread_id}...")
                 self.playwright = sync_playwright().start()
-                self.browser = self.playwright.chromium.launch(
-                    headless=self.headless,
-                    args=['--start-maximized']
-                )
-                self.context = self.browser.new_context(
-                    viewport={"width": 1280, "height": 800}
-                )
-                self.page = self.context.new_page()
+                if self.user_data_dir:
+                    # The persistent context owns its browser; self.browser stays None
+                    self.context = self.playwright.chromium.launch_persistent_context(
+                        self.user_data_dir,
+                        headless=self.headless,
+                        args=['--start-maximized'],
+                        viewport=self.viewport
+                    )
+                else:
+                    self.browser = self.playwright.chromium.launch(
+                        headless=self.headless,
+                        args=['--start-maximized']
+                    )
+                    self.context = self._new_context(storage_state)
+                self.context.add_init_script(DOM_VERSION_SCRIPT)
+                self._apply_blocking()
+                self.context_started = time.time()
+                # A persistent context opens with a page already
+                self.page = self.context.pages[0] if self.context.pages else self.context.new_page()
+                if self.use_screencast:
+                    self._start_screencast()
                 self._initialized = True
+                BROWSERS_STARTED.inc()
                 print("Browser and page successfully initialized")
             except Exception as e:
                 print(f"Failed to initialize browser: {e}")
                 self.cleanup()
                 raise
 
+    @property
+    def state_path(self) -> Optional[str]:
+        """storage_state snapshot file of the named profile, if one is set."""
+        if not self.profile_name:
+            return None
+        return os.path.join(self.state_dir, f"{self.profile_name}.json")
+
+    def _new_context(self, storage_state: Optional[dict] = None) -> BrowserContext:
+        """A context with the session viewport, warmed from the profile snapshot when there is one."""
+        if storage_state is None:
+            storage_state = self._load_state()
+        return self.browser.new_context(viewport=self.viewport, storage_state=storage_state)
+
+    def _load_state(self) -> Optional[dict]:
+        """The profile snapshot, or None when there is none or it cannot be read."""
+        if not self.state_path or not os.path.exists(self.state_path):
+            return None
+        try:
+            with open(self.state_path) as f:
+                storage_state = json.load(f)
+            if not isinstance(storage_state, dict):
+                raise ValueError("not a storage state object")
+        except (OSError, ValueError) as e:
+            # A cold start rather than a browser that fails to launch
+            logging.warning(f"Ignoring browser state in {self.state_path}: {str(e)}")
+            return None
+        print(f"Restoring browser state from {self.state_path}")
+        return storage_state
+
+    def _write_state(self, storage_state: dict) -> None:
+        """Replace the profile snapshot atomically, so a crash mid-write never leaves half a file."""
+        os.makedirs(self.state_dir, exist_ok=True)
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(storage_state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def save_state(self) -> None:
+        """Write the context's cookies and local storage to the profile snapshot."""
+        with self._lock:
+            if not self.context or not self.state_path or self.user_data_dir:
+                return
+            try:
+                self._write_state(self.context.storage_state())
+                print(f"Saved browser state to {self.state_path}")
+            except Exception as e:
+                logging.warning(f"Failed to save browser state: {str(e)}")
+
+    def _apply_blocking(self) -> None:
+        """Route the context's requests through a blocker for the current profile, if it blocks anything."""
+        if self.blocker:
+            self.context.unroute("**/*", self.blocker)
+            self.blocker = None
+        if self.blocking_profile.enabled:
+            self.blocker = RequestBlocker(self.blocking_profile)
+            self.context.route("**/*", self.blocker)
+
+    def set_blocking_profile(self, name: str, block_resource_types: tuple = (), allow_resource_types: tuple = (),
+                             block_domains: tuple = ()) -> None:
+        """
+        Switch the blocking profile of this manager's context, with optional overrides.
+
+        The setting is process-wide: the in-process manager is a singleton, so every
+        session sharing it gets the new profile. With BROWSER_WORKER=1 each session
+        has its own worker and the profile only applies to that session.
+        """
+        with self._lock:
+            self.blocking_profile = get_profile(name).with_overrides(
+                block_resource_types, allow_resource_types, block_domains
+            )
+            if self.context:
+                self._apply_blocking()
+            print(f"Blocking profile set to {self.blocking_profile.name}")
+
+    def blocking_stats(self) -> dict:
+        if self.blocker:
+            return self.blocker.stats()
+        return {"profile": self.blocking_profile.name, "blocked": 0, "allowed": 0}
+
+    def _start_screencast(self) -> None:
+        """(Re)start the screencast frame source on the current page."""
+        if self.screencast:
+            self.screencast.stop()
+        self.screencast = ScreencastSource(
+            self.page,
+            width=self.viewport["width"],
+            height=self.viewport["height"],
+            quality=self.screencast_quality,
+        )
+        self.screencast.start()
+
     @contextmanager
     def get_page(self) -> Page:
-        """Get the singleton page instance."""
-        if not self._initialized or not self.page:
-            raise RuntimeError("Browser not properly initialized")
-        
+        """Get the singleton page instance, launching the browser if needed."""
         current_thread = threading.get_ident()
         print(f"Accessing page from thread {current_thread}")
         
+        BROWSER_QUEUE_DEPTH.inc()
+        with self._lock:
+            BROWSER_QUEUE_DEPTH.dec()
+            self._initialize_browser()
+            if not self.page:
+                raise RuntimeError("Browser not properly initialized")
+            if not self._page_is_healthy():
+                print("Page is not responding, recovering from the last checkpoint...")
+                self.recover()
+            yield self.page
+
+    def release(self) -> None:
+        """
+        Let go of a stopped task's hold on the browser without closing it.
+
+        This does nothing here: a task only holds the in-process browser through the lock
+        in get_page(), which is already released when the task stops, and the shared page
+        is not torn down because other sessions may be using it. A page left broken by the
+        interruption is recovered by the next get_page(). RemoteBrowserManager.release
+        does real work: it waits out a command the stopped task left running in its worker.
+        """
+
+    def _page_is_healthy(self) -> bool:
+        try:
+            return self.page is not None and not self.page.is_closed() and self.page.evaluate("1") == 1
+        except Exception:
+            return False
+
+    def take_checkpoint(self) -> None:
+        """
+        Record the page's URL and scroll position, called after each action that can change the page.
+
+        Storage state costs a round trip through every cookie and origin, so it is
+        only captured when the site changes or the last capture is getting old.
+        """
         with self._lock:
+            if not self._initialized:
+                return
             try:
-                # Verify page is still valid
-                # This will raise if the page is no longer usable
-                self.page.evaluate("1")  
-                yield self.page
+                url = self.page.url
+                scroll = self.page.evaluate("() => [window.scrollX, window.scrollY]")
+                previous = self.checkpoint or {}
+                storage_state = previous.get("storage_state")
+                state_time = previous.get("state_time", 0.0)
+                same_site = previous.get("url", "").split("/")[:3] == url.split("/")[:3]
+                if self.browser and (not same_site or time.time() - state_time > CHECKPOINT_STATE_INTERVAL):
+                    storage_state = self.context.storage_state()
+                    state_time = time.time()
+                    # The capture is already paid for, so the profile snapshot stays as fresh
+                    if self.state_path:
+                        self._write_state(storage_state)
+                self.checkpoint = {"url": url, "scroll": scroll, "storage_state": storage_state,
+                                   "state_time": state_time}
             except Exception as e:
-                print(f"Error accessing page: {e}")
-                # If page is invalid, try to recreate it
+                logging.warning(f"Failed to take checkpoint: {str(e)}")
+
+    def _restore_checkpoint(self) -> None:
+        """Navigate the current page back to the checkpointed URL and scroll position."""
+        if not self.checkpoint or self.checkpoint["url"] == "about:blank":
+            return
+        self.page.goto(self.checkpoint["url"], wait_until="domcontentloaded", timeout=15000)
+        self.page.evaluate("([x, y]) => window.scrollTo(x, y)", self.checkpoint["scroll"])
+
+    def _recover_reload(self) -> None:
+        self.page.reload(wait_until="domcontentloaded", timeout=10000)
+
+    def _recover_recreate_page(self) -> None:
+        old_page = self.page
+        self.page = self.context.new_page()
+        try:
+            old_page.close()
+        except Exception:
+            pass
+        if self.use_screencast:
+            self._start_screencast()
+        self._restore_checkpoint()
+
+    def _recover_recreate_context(self) -> None:
+        if not self.browser:
+            raise RuntimeError("a persistent context can only be recovered by relaunching")
+        old_context = self.context
+        try:
+            old_context.close()
+        except Exception:
+            pass
+        self.context = self._new_context((self.checkpoint or {}).get("storage_state"))
+        self.context.add_init_script(DOM_VERSION_SCRIPT)
+        self.blocker = None
+        self._apply_blocking()
+        self.context_started = time.time()
+        self.page = self.context.new_page()
+        if self.use_screencast:
+            self._start_screencast()
+        self._restore_checkpoint()
+
+    def _recover_relaunch(self) -> None:
+        self.cleanup()
+        self._initialize_browser((self.checkpoint or {}).get("storage_state"))
+        self._restore_checkpoint()
+
+    def recover(self) -> Optional[str]:
+        """
+        Bring the page back to the last checkpoint with the cheapest tier that works:
+        reload, recreate the page, recreate the context, relaunch the browser.
+
+        Returns:
+            The tier that recovered the page, or None if it was healthy already
+        """
+        with self._lock:
+            if not self._initialized or self._page_is_healthy():
+                return None
+            for tier in RECOVERY_TIERS:
+                start = time.perf_counter()
                 try:
-                    print("Attempting to recreate page...")
-                    self.page = self.context.new_page()
-                    yield self.page
-                except Exception as recreate_error:
-                    print(f"Failed to recreate page: {recreate_error}")
-                    raise
+                    getattr(self, f"_recover_{tier}")()
+                    recovered = self._page_is_healthy()
+                except Exception as e:
+                    logging.warning(f"Recovery by {tier} failed: {str(e)}")
+                    recovered = False
+                elapsed = time.perf_counter() - start
+                if recovered:
+                    self.recovery_times[tier].append(elapsed)
+                    self.recoveries[tier] += 1
+                    print(f"Browser recovered by {tier} in {elapsed * 1000:.0f} ms")
+                    return tier
+                self.recovery_failures[tier] += 1
+            raise RuntimeError("Browser could not be recovered")
+
+    def recycle_if_needed(self) -> Optional[str]:
+        """
+        Swap in a fresh context when the browser uses too much memory or the context
+        is too old, carrying over storage state and the current URL. Call between turns.
+
+        Returns:
+            Why the context was recycled, or None if it was kept
+        """
+        with self._lock:
+            if not self._initialized:
+                return None
+            reason = self.memory_watchdog.recycle_reason(self.context_started)
+            if reason is None:
+                return None
+            start = time.perf_counter()
+            # Force a fresh storage state capture so nothing since the last one is lost
+            if self.checkpoint:
+                self.checkpoint["state_time"] = 0.0
+            self.take_checkpoint()
+            if self.browser:
+                self._recover_recreate_context()
+            else:
+                self._recover_relaunch()
+            self.memory_watchdog.recycles += 1
+            print(f"Recycled browser context ({reason}) in {(time.perf_counter() - start) * 1000:.0f} ms")
+            return reason
+
+    def memory_stats(self) -> dict:
+        return self.memory_watchdog.stats()
+
+    def recovery_stats(self) -> dict:
+        return {
+            tier: {
+                "recoveries": self.recoveries[tier],
+                "failures": self.recovery_failures[tier],
+                "mean_seconds": sum(times) / len(times) if times else 0.0,
+            }
+            for tier, times in self.recovery_times.items()
+        }
+
+    def fan_out(self, urls: list[str], mode: str = "text", timeout: float = 30.0) -> list[dict]:
+        """Extract several URLs concurrently in extra pages of the current context."""
+        with self._lock:
+            self._initialize_browser()
+            return fan_out_extract(self.context, urls, mode=mode, timeout=timeout)
 
     def cleanup(self) -> None:
         """Clean up browser resources."""
@@ -86,7 +395,10 @@ class BrowserManager:
                 
             print(f"Starting browser cleanup in thread {threading.get_ident()}...")
             
+            self.save_state()
             try:
+                if self.screencast:
+                    self.screencast.stop()
                 if self.page:
                     self.page.close()
                 if self.context:
@@ -99,11 +411,15 @@ class BrowserManager:
             except Exception as e:
                 print(f"Error during cleanup: {e}")
             finally:
+                self.screencast = None
+                self.blocker = None
+                self.context_started = None
                 self.page = None
                 self.context = None
                 self.browser = None
                 self.playwright = None
                 self._initialized = False
+                BROWSERS_STARTED.dec()
 
     def __enter__(self):
         return self
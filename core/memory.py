@@ -0,0 +1,74 @@
+import os
+import time
+from typing import Optional
+
+import psutil
+
+# Process names of Chromium's browser, renderer, GPU and utility processes
+BROWSER_PROCESS_NAMES = ("chrome", "chromium", "headless_shell")
+
+
+def _rss(process: psutil.Process) -> int:
+    try:
+        return process.memory_info().rss
+    except (psutil.NoSuchProcess, psutil.AccessDenied):
+        return 0
+
+
+class MemoryWatchdog:
+    """
+    Samples the RSS of this Python process and of the Chromium processes it started,
+    and decides when a long-lived browser context is due to be recycled.
+
+    Chromium's processes hang off the Playwright driver, so they are found among the
+    descendants of this process; other children such as the bash tool's shell are
+    left out by name.
+    """
+
+    def __init__(self, max_browser_rss_mb: float = 1500, max_context_age: float = 3600,
+                 min_context_age: float = 300):
+        self.max_browser_rss = max_browser_rss_mb * 1024 * 1024  # 0 disables the check
+        self.max_context_age = max_context_age  # seconds, 0 disables the check
+        # A context younger than this is never recycled for memory, so one that starts out
+        # near the limit (it is checked every turn) is not swapped again on every turn
+        self.min_context_age = min_context_age
+        self.recycles = 0
+        self.last_sample: dict = {}
+        self._process = psutil.Process(os.getpid())
+
+    @classmethod
+    def from_env(cls) -> "MemoryWatchdog":
+        return cls(
+            max_browser_rss_mb=float(os.getenv("BROWSER_MAX_RSS_MB", 1500)),
+            max_context_age=float(os.getenv("BROWSER_MAX_CONTEXT_AGE", 3600)),
+            min_context_age=float(os.getenv("BROWSER_MIN_CONTEXT_AGE", 300)),
+        )
+
+    def sample(self) -> dict:
+        """Current RSS in bytes of this process and of all browser processes it started."""
+        browser_rss = 0
+        for child in self._process.children(recursive=True):
+            try:
+                name = child.name().lower()
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+            if any(browser_name in name for browser_name in BROWSER_PROCESS_NAMES):
+                browser_rss += _rss(child)
+        self.last_sample = {"python_rss": _rss(self._process), "browser_rss": browser_rss, "time": time.time()}
+        return self.last_sample
+
+    def recycle_reason(self, context_started: Optional[float]) -> Optional[str]:
+        """Why the context should be recycled now, or None if it can stay."""
+        age = time.time() - context_started if context_started is not None else None
+        if age is not None and self.max_context_age and age > self.max_context_age:
+            return f"context is {age:.0f}s old"
+        if age is not None and age < self.min_context_age:
+            return None
+        if self.max_browser_rss:
+            browser_rss = self.sample()["browser_rss"]
+            if browser_rss > self.max_browser_rss:
+                return f"browser RSS is {browser_rss / 1024 / 1024:.0f} MiB"
+        return None
+
+    def stats(self) -> dict:
+        return {**self.last_sample, "recycles": self.recycles}
@@ -0,0 +1,318 @@
+"""
+Typed, compact conversation model.
+
+Messages and blocks are slotted objects with stable ids. Each one caches its API
+JSON fragment, so a request body is built by joining the cached fragments of the
+conversation and only new (or edited) messages pay serialization cost. Frontends
+keep working with plain dicts through to_param() and Conversation.from_params();
+ConversationCache keeps a session's typed messages between requests, so their ids
+and fragments survive the round trip through the frontend's dicts.
+"""
+
+import base64
+import json
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Any, Iterable, List, Optional
+
+from core.sender import Sender
+from tools.base import ToolResult
+
+
+def _dumps(value: Any) -> bytes:
+    # Same settings httpx uses for json= request bodies
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), allow_nan=False).encode("utf-8")
+
+
+class Block:
+    """A content block of a message."""
+
+    __slots__ = ("_json",)
+    type: str = ""
+
+    def __init__(self):
+        self._json: Optional[bytes] = None
+
+    def to_param(self) -> dict:
+        raise NotImplementedError
+
+    def to_json(self) -> bytes:
+        if self._json is None:
+            self._json = _dumps(self.to_param())
+        return self._json
+
+
+class TextBlock(Block):
+    __slots__ = ("text",)
+    type = "text"
+
+    def __init__(self, text: str):
+        super().__init__()
+        self.text = text
+
+    def to_param(self) -> dict:
+        return {"type": "text", "text": self.text}
+
+
+class ImageBlock(Block):
+    """An image held as raw bytes, base64 encoded once when first serialized."""
+
+    __slots__ = ("_data", "_base64", "media_type")
+    type = "image"
+
+    def __init__(self, data: bytes | memoryview | None = None, media_type: str = "image/png",
+                 base64_data: Optional[str] = None):
+        super().__init__()
+        self._data = data
+        self._base64 = base64_data
+        self.media_type = media_type
+
+    @property
+    def data(self) -> bytes | memoryview:
+        if self._data is None:
+            self._data = base64.b64decode(self._base64)
+        return self._data
+
+    @property
+    def base64_data(self) -> str:
+        if self._base64 is None:
+            self._base64 = base64.b64encode(self._data).decode("utf-8")
+        return self._base64
+
+    def to_param(self) -> dict:
+        return {
+            "type": "image",
+            "source": {"type": "base64", "media_type": self.media_type, "data": self.base64_data},
+        }
+
+
+class ToolUseBlock(Block):
+    __slots__ = ("id", "name", "input")
+    type = "tool_use"
+
+    def __init__(self, id: str, name: str, input: dict):
+        super().__init__()
+        self.id = id
+        self.name = name
+        self.input = input
+
+    def to_param(self) -> dict:
+        return {"type": "tool_use", "id": self.id, "name": self.name, "input": self.input}
+
+
+class ToolResultBlock(Block):
+    __slots__ = ("tool_use_id", "content", "is_error")
+    type = "tool_result"
+
+    def __init__(self, tool_use_id: str, content: List[Block] | str, is_error: bool = False):
+        super().__init__()
+        self.tool_use_id = tool_use_id
+        self.content = content
+        self.is_error = is_error
+
+    @classmethod
+    def from_tool_result(cls, tool_result: ToolResult, tool_use_id: str) -> "ToolResultBlock":
+        """Same layout as ToolCollection.process_tool_output, keeping the image as raw bytes."""
+        content: List[Block] = []
+        if tool_result.error:
+            content.append(TextBlock(tool_result.error))
+        elif tool_result.output:
+            content.append(TextBlock(tool_result.output))
+        if tool_result.image:
+            content.append(ImageBlock(tool_result.image, tool_result.media_type or "image/png"))
+        return cls(tool_use_id, content, is_error=bool(tool_result.error))
+
+    def to_param(self) -> dict:
+        content = self.content if isinstance(self.content, str) else [block.to_param() for block in self.content]
+        return {"type": "tool_result", "content": content, "tool_use_id": self.tool_use_id, "is_error": self.is_error}
+
+    def to_json(self) -> bytes:
+        if self._json is None:
+            if isinstance(self.content, str):
+                content = _dumps(self.content)
+            else:
+                content = b"[" + b",".join(block.to_json() for block in self.content) + b"]"
+            self._json = (b'{"type":"tool_result","content":' + content +
+                          b',"tool_use_id":' + _dumps(self.tool_use_id) +
+                          b',"is_error":' + _dumps(self.is_error) + b"}")
+        return self._json
+
+
+def block_from_param(param: dict | str) -> Block:
+    """Build a block from its API dict form."""
+    if isinstance(param, str):
+        return TextBlock(param)
+    block_type = param.get("type")
+    if block_type == "text":
+        return TextBlock(param["text"])
+    if block_type == "image":
+        source = param["source"]
+        return ImageBlock(media_type=source.get("media_type", "image/png"), base64_data=source["data"])
+    if block_type == "tool_use":
+        return ToolUseBlock(param["id"], param["name"], param["input"])
+    if block_type == "tool_result":
+        content = param.get("content", [])
+        if not isinstance(content, str):
+            content = [block_from_param(item) for item in content]
+        return ToolResultBlock(param["tool_use_id"], content, is_error=param.get("is_error", False))
+    raise ValueError(f"Unsupported content block type: {block_type}")
+
+
+class Message:
+    """
+    A conversation turn with an id and a cached JSON fragment.
+
+    The id is fixed when the message is built and lasts as long as the object, which
+    ConversationCache keeps across requests.
+    """
+
+    __slots__ = ("id", "role", "content", "_json")
+
+    def __init__(self, role: str, content: Optional[List[Block]] = None, id: Optional[str] = None):
+        self.id = id or uuid.uuid4().hex
+        self.role = role
+        self.content: List[Block] = content if content is not None else []
+        self._json: Optional[bytes] = None
+
+    @classmethod
+    def from_param(cls, param: dict) -> "Message":
+        content = param["content"]
+        if isinstance(content, str):
+            content = [content]
+        return cls(param["role"], [block_from_param(block) for block in content])
+
+    @classmethod
+    def from_response(cls, response) -> "Message":
+        """Build an assistant message from the SDK response, keeping text and tool use blocks."""
+        content: List[Block] = []
+        for block in response.content:
+            if block.type == "text":
+                content.append(TextBlock(block.text))
+            elif block.type == "tool_use":
+                content.append(ToolUseBlock(block.id, block.name, block.input))
+        return cls(Sender.ASSISSTANT, content)
+
+    def append(self, block: Block) -> None:
+        self.content.append(block)
+        self._json = None
+
+    def invalidate(self) -> None:
+        """Drop the cached fragment after editing the content in place."""
+        self._json = None
+
+    def to_param(self) -> dict:
+        return {"role": self.role, "content": [block.to_param() for block in self.content]}
+
+    def to_json(self) -> bytes:
+        if self._json is None:
+            self._json = (b'{"role":' + _dumps(str(self.role)) + b',"content":[' +
+                          b",".join(block.to_json() for block in self.content) + b"]}")
+        return self._json
+
+
+class Conversation:
+    """An ordered list of messages that serializes by joining cached fragments."""
+
+    __slots__ = ("messages",)
+
+    def __init__(self, messages: Optional[Iterable[Message]] = None):
+        self.messages: List[Message] = list(messages or [])
+
+    @classmethod
+    def from_params(cls, params: Iterable[dict]) -> "Conversation":
+        return cls(Message.from_param(param) for param in params)
+
+    def append(self, message: Message) -> None:
+        self.messages.append(message)
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    def __iter__(self):
+        return iter(self.messages)
+
+    def to_params(self) -> List[dict]:
+        return [message.to_param() for message in self.messages]
+
+    def to_json(self) -> bytes:
+        return b"[" + b",".join(message.to_json() for message in self.messages) + b"]"
+
+    def filter_recent_images(self, images_to_keep: Optional[int], min_removal_threshold: int = 2) -> None:
+        """
+        Drop all but the N most recent images, like ClaudeManager.filter_recent_images.
+
+        Only messages that actually lose an image have their cached fragment rebuilt.
+        """
+        if images_to_keep is None:
+            return
+
+        # (message, block list holder) pairs for every place images live, oldest first
+        containers = []
+        for message in self.messages:
+            if any(isinstance(block, ImageBlock) for block in message.content):
+                containers.append((message, message))
+            containers.extend(
+                (message, block) for block in message.content
+                if isinstance(block, ToolResultBlock) and not isinstance(block.content, str)
+            )
+
+        total_images = sum(
+            isinstance(block, ImageBlock) for _, holder in containers for block in holder.content
+        )
+        images_to_remove = total_images - images_to_keep
+        # Remove in chunks for better cache behavior
+        images_to_remove -= images_to_remove % min_removal_threshold
+
+        for message, holder in containers:
+            if images_to_remove <= 0:
+                break
+            new_content = []
+            for block in holder.content:
+                if isinstance(block, ImageBlock) and images_to_remove > 0:
+                    images_to_remove -= 1
+                    continue
+                new_content.append(block)
+            if len(new_content) != len(holder.content):
+                holder.content = new_content
+                holder._json = None
+                message.invalidate()
+
+
+class ConversationCache:
+    """
+    Typed conversations kept between requests, by session id.
+
+    Frontends send the whole history as dicts with every request. Messages equal to
+    what the session's last request ended with are reused, keeping their ids and cached
+    fragments; only the rest are built anew. A conversation is taken out while its task
+    runs, so two tasks never share one.
+    """
+
+    def __init__(self, max_sessions: int = 64):
+        self.max_sessions = max_sessions
+        # session id -> (conversation, its messages as dicts when it was put back)
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, session_id: str, params: List[dict]) -> Conversation:
+        """The typed form of params, reusing the session's matching leading messages."""
+        with self._lock:
+            entry = self._entries.pop(session_id, None)
+        reused: List[Message] = []
+        if entry is not None:
+            conversation, kept_params = entry
+            for message, param, kept_param in zip(conversation.messages, params, kept_params):
+                if param != kept_param:
+                    break
+                reused.append(message)
+        return Conversation(reused + [Message.from_param(param) for param in params[len(reused):]])
+
+    def put(self, session_id: str, conversation: Conversation) -> None:
+        """Keep a finished task's conversation for the session's next request."""
+        entry = (conversation, conversation.to_params())
+        with self._lock:
+            self._entries[session_id] = entry
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self.max_sessions:
+                self._entries.popitem(last=False)
@@ -0,0 +1,182 @@
+"""
+Process-wide metrics in the Prometheus text format.
+
+Each metric keeps its own small lock held only for a dict update, so recording on
+the hot path never waits on a scrape or on unrelated metrics. Rendering copies the
+values under the same locks and formats them outside.
+"""
+
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    type: str = ""
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        return "\n".join(lines + self.samples())
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, key)} {value}" for key, value in values]
+
+
+class Gauge(Metric):
+    """A value that goes up and down, or is read from a function at scrape time."""
+
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._function: Optional[Callable[[], float]] = None
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        self._function = function
+
+    def samples(self) -> List[str]:
+        if self._function is not None:
+            try:
+                return [f"{self.name} {float(self._function())}"]
+            except Exception:
+                return []
+        with self._lock:
+            values = list(self._values.items())
+        if not values and not self.labelnames:
+            values = [((), 0)]
+        return [f"{self.name}{_labels(self.labelnames, key)} {value}" for key, value in values]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: a count per bucket (not cumulative), then the sum and the count
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            counts[index] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = [(key, list(counts)) for key, counts in self._values.items()]
+        lines = []
+        for key, counts in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket_labels = _labels(self.labelnames, key, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {counts[-2]}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {counts[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self.metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+MODEL_CALL_SECONDS = REGISTRY.register(Histogram(
+    "agent_model_call_seconds", "Latency of model calls by backend and outcome.", ("backend", "outcome")))
+TOOL_SECONDS = REGISTRY.register(Histogram(
+    "agent_tool_seconds", "Latency of tool executions by tool and action.", ("tool", "action")))
+SCREENSHOT_BYTES = REGISTRY.register(Histogram(
+    "agent_screenshot_bytes", "Size of screenshots sent to the model.", ("media_type",), buckets=SIZE_BUCKETS))
+# No session label: session ids come from clients, and every new one would be another time series
+TOKENS = REGISTRY.register(Counter(
+    "agent_tokens_total", "Model tokens by kind (input, output, cache_read, cache_creation).", ("kind",)))
+ACTIVE_SESSIONS = REGISTRY.register(Gauge(
+    "agent_active_sessions", "Sessions with a task in progress."))
+BROWSERS_STARTED = REGISTRY.register(Gauge(
+    "agent_browsers_started", "Browsers currently running."))
+BROWSERS_BUSY = REGISTRY.register(Gauge(
+    "agent_browsers_busy", "Browser tool executions in progress."))
+BROWSER_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "agent_browser_queue_depth", "Callers waiting for a browser lock."))
+
+
+def record_usage(usage) -> None:
+    """Add the token counts of a response's usage to the totals."""
+    if usage is None:
+        return
+    for kind, field in (("input", "input_tokens"), ("output", "output_tokens"),
+                        ("cache_read", "cache_read_input_tokens"),
+                        ("cache_creation", "cache_creation_input_tokens")):
+        value = getattr(usage, field, None)
+        if value:
+            TOKENS.inc(value, kind=kind)
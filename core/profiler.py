@@ -0,0 +1,159 @@
+"""
+On-demand sampling profiler for agent sessions.
+
+arm() requests a profile of the next N turns of a session, from the PROFILE_TURNS
+environment variable at startup or the Flask /api/profile endpoint. While armed, a
+background thread samples the stack of the thread running the task every few
+milliseconds, tagged with the turn and what it is doing (the model call or a tool
+action), and writes the samples in collapsed-stack format, which flamegraph.pl and
+speedscope both open. When nothing is armed, a turn costs one dict check.
+"""
+
+import os
+import re
+import sys
+import logging
+import time
+import threading
+from collections import Counter
+from typing import Optional
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+DEFAULT_INTERVAL_MS = 5.0
+
+
+def _interval_from_env() -> float:
+    value = os.getenv("PROFILE_INTERVAL_MS")
+    try:
+        interval = float(value) if value else DEFAULT_INTERVAL_MS
+        if not 0 < interval < float("inf"):
+            raise ValueError
+    except ValueError:
+        logging.warning(f"Ignoring PROFILE_INTERVAL_MS={value!r}: not a positive number")
+        interval = DEFAULT_INTERVAL_MS
+    return interval / 1000
+
+
+SAMPLE_INTERVAL = _interval_from_env()
+
+# Turns left to profile by session id; "*" matches any session
+_armed: dict[str, int] = {}
+_armed_lock = threading.Lock()
+
+
+def arm(session_id: str, turns: int) -> None:
+    with _armed_lock:
+        _armed[session_id] = turns
+
+
+def _take_turn(session_id: str) -> bool:
+    """Use up one armed turn of the session, if it has any."""
+    if not _armed:
+        return False
+    with _armed_lock:
+        key = session_id if session_id in _armed else "*" if "*" in _armed else None
+        if key is None:
+            return False
+        _armed[key] -= 1
+        if _armed[key] <= 0:
+            del _armed[key]
+        return True
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    # ";" separates frames and " " the count in collapsed stacks
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+
+
+class SamplingProfiler:
+    """Samples one thread's stack on an interval, keyed by the current tag."""
+
+    def __init__(self, thread_id: int, interval: float = SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.tag = ""
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join([self.tag] + stack[::-1])] += 1
+
+    def write_collapsed(self, path: str) -> None:
+        with open(path, "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class TurnProfiler:
+    """Profiles the armed turns of one task; a no-op for turns that are not armed."""
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.turn = 0
+        self.first_turn = 0
+        self.last_turn = 0
+        self.profiler: Optional[SamplingProfiler] = None
+
+    def begin_turn(self) -> None:
+        self.turn += 1
+        if not _take_turn(self.session_id):
+            self.finish()
+            return
+        if self.profiler is None:
+            self.first_turn = self.turn
+            self.profiler = SamplingProfiler(threading.get_ident())
+            self.profiler.start()
+        self.last_turn = self.turn
+        self.tag("model call")
+
+    def tag(self, activity: str) -> None:
+        if self.profiler is not None:
+            self.profiler.tag = f"turn {self.turn};{activity}"
+
+    def finish(self) -> Optional[str]:
+        """Stop sampling and write the profile; returns its path."""
+        if self.profiler is None:
+            return None
+        self.profiler.stop()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        session = re.sub(r"[^\w.-]", "_", self.session_id)
+        path = os.path.join(PROFILE_DIR, f"{session}-{time.strftime('%Y%m%d-%H%M%S')}"
+                                         f"-turns{self.first_turn}-{self.last_turn}.collapsed")
+        self.profiler.write_collapsed(path)
+        print(f"Wrote profile of session {self.session_id} to {path}")
+        self.profiler = None
+        return path
+
+
+def _arm_from_env() -> None:
+    """Arm PROFILE_TURNS turns of PROFILE_SESSION (any session by default); a bad value only warns."""
+    value = os.getenv("PROFILE_TURNS")
+    if not value:
+        return
+    try:
+        turns = int(value)
+        if turns <= 0:
+            raise ValueError
+    except ValueError:
+        logging.warning(f"Ignoring PROFILE_TURNS={value!r}: not a positive whole number")
+        return
+    arm(os.getenv("PROFILE_SESSION", "*"), turns)
+
+
+_arm_from_env()
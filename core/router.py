@@ -0,0 +1,252 @@
+import os
+import re
+import time
+import logging
+import json
+import threading
+from collections import deque
+from statistics import median
+from typing import Any, List, Optional
+
+from anthropic import (
+    Anthropic,
+    AnthropicBedrock,
+    AnthropicVertex,
+    APIConnectionError,
+    APIStatusError,
+    DefaultHttpxClient,
+)
+from anthropic.types.beta import BetaMessage
+
+from core.metrics import MODEL_CALL_SECONDS
+
+# Model identifiers differ per provider for the same underlying model
+DEFAULT_MODELS = {
+    "anthropic": "claude-3-5-sonnet-20241022",
+    "bedrock": "anthropic.claude-3-5-sonnet-20241022-v2:0",
+    "vertex": "claude-3-5-sonnet-v2@20241022",
+}
+
+# Status codes that mean "this backend is unhealthy right now, try another one"
+FAILOVER_STATUS_CODES = {408, 409, 429}
+
+
+class RawJSON:
+    """An already serialized JSON value, spliced into the request body as is."""
+
+    __slots__ = ("data",)
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+
+def _dumps(value: Any) -> bytes:
+    # Same settings httpx uses for json= request bodies
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), allow_nan=False).encode("utf-8")
+
+
+def encode_body(body: dict) -> bytes:
+    """Encode a request body the way httpx does, splicing in RawJSON values where they stand."""
+    fields = (_dumps(key) + b":" + (value.data if isinstance(value, RawJSON) else _dumps(value))
+              for key, value in body.items())
+    return b"{" + b",".join(fields) + b"}"
+
+
+class PreserializedHttpxClient(DefaultHttpxClient):
+    """
+    httpx client that sends request bodies holding RawJSON values without re-encoding them.
+
+    The body stays a plain dict so the SDK, Bedrock and Vertex clients can still rewrite
+    its other fields.
+    """
+
+    def build_request(self, method, url, *, json=None, **kwargs):
+        if isinstance(json, dict) and any(isinstance(value, RawJSON) for value in json.values()):
+            return super().build_request(method, url, content=encode_body(json), **kwargs)
+        return super().build_request(method, url, json=json, **kwargs)
+
+
+def _is_failover_error(error: Exception) -> bool:
+    """Return True if the error should move the call to the next backend."""
+    if isinstance(error, APIConnectionError):
+        return True
+    if isinstance(error, APIStatusError):
+        # 5xx covers both server errors and 529 overloaded
+        return error.status_code >= 500 or error.status_code in FAILOVER_STATUS_CODES
+    return False
+
+
+class Backend:
+    """A configured API endpoint with rolling latency and error statistics."""
+
+    def __init__(self, name: str, client: Any, model: str, window: int = 50):
+        self.name = name
+        self.client = client
+        self.model = model
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)  # True for success, False for failure
+        self.cooldown_until = 0.0
+
+    @property
+    def p50(self) -> Optional[float]:
+        return median(self.latencies) if self.latencies else None
+
+    @property
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    @property
+    def score(self) -> float:
+        """Expected latency used for ranking; lower is better."""
+        if not self.outcomes:
+            return 0.0  # never tried, so probe it
+        if not self.latencies:
+            return float("inf")
+        return self.p50 * (1 + self.error_rate)
+
+    def is_healthy(self, now: float) -> bool:
+        return now >= self.cooldown_until
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "model": self.model,
+            "p50": self.p50,
+            "error_rate": self.error_rate,
+            "calls": len(self.outcomes),
+            "cooling_down": not self.is_healthy(time.monotonic()),
+        }
+
+
+class BackendRouter:
+    """Routes each model call to the fastest healthy backend and fails over on errors."""
+
+    def __init__(self, backends: List[Backend], max_error_rate: float = 0.5,
+                 min_samples: int = 3, cooldown: float = 30.0):
+        if not backends:
+            raise ValueError("BackendRouter needs at least one backend")
+        self.backends = backends
+        self.max_error_rate = max_error_rate
+        self.min_samples = min_samples
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "BackendRouter":
+        """
+        Build a router from the CLAUDE_BACKENDS environment variable.
+
+        CLAUDE_BACKENDS is a comma separated list of providers (anthropic, bedrock,
+        vertex) in order of preference. It defaults to the Helicone proxied
+        Anthropic client on its own.
+        """
+        names = [name.strip() for name in os.getenv("CLAUDE_BACKENDS", "anthropic").split(",") if name.strip()]
+        # With several backends, failing over is faster than the SDK's own retries
+        max_retries = 0 if len(names) > 1 else 2
+        return cls([make_backend(name, max_retries=max_retries) for name in names])
+
+    def ranked(self) -> List[Backend]:
+        """Healthy backends by rolling p50 latency (weighted by error rate), then the ones cooling down."""
+        now = time.monotonic()
+        with self._lock:
+            healthy = [b for b in self.backends if b.is_healthy(now)]
+            cooling = [b for b in self.backends if not b.is_healthy(now)]
+        healthy.sort(key=lambda b: b.score)
+        cooling.sort(key=lambda b: b.cooldown_until)
+        return healthy + cooling
+
+    def record(self, backend: Backend, latency: float, ok: bool) -> None:
+        with self._lock:
+            backend.outcomes.append(ok)
+            if ok:
+                backend.latencies.append(latency)
+                return
+            if len(backend.outcomes) >= self.min_samples and backend.error_rate >= self.max_error_rate:
+                backend.cooldown_until = time.monotonic() + self.cooldown
+
+    def create(self, **kwargs) -> Any:
+        """Call beta.messages.create on the best backend, failing over on 5xx/overload."""
+        return self._call(lambda backend: backend.client.beta.messages.with_raw_response.create(
+            model=backend.model, **kwargs
+        ).parse())
+
+    def create_preserialized(self, messages_json: bytes, betas: List[str], **kwargs) -> BetaMessage:
+        """
+        Like create(), but with the messages given as an already serialized JSON array.
+
+        This skips the SDK's per-call transform and re-encoding of the whole history.
+        """
+        def send(backend: Backend) -> BetaMessage:
+            # Keys sorted by name, the order the SDK sends create() parameters in, so the
+            # body is byte for byte the one create() would send
+            body = dict(sorted({"model": backend.model, "messages": RawJSON(messages_json), **kwargs}.items()))
+            return backend.client.post(
+                "/v1/messages?beta=true",
+                body=body,
+                cast_to=BetaMessage,
+                options={"headers": {"anthropic-beta": ",".join(betas)}, "timeout": 600},
+            )
+        return self._call(send)
+
+    def _call(self, send) -> Any:
+        last_error = None
+        for backend in self.ranked():
+            start = time.monotonic()
+            try:
+                response = send(backend)
+            except Exception as e:
+                MODEL_CALL_SECONDS.observe(time.monotonic() - start, backend=backend.name, outcome="error")
+                if not _is_failover_error(e):
+                    raise
+                self.record(backend, time.monotonic() - start, ok=False)
+                logging.warning(f"Backend {backend.name} failed, failing over: {str(e)}")
+                last_error = e
+                continue
+            elapsed = time.monotonic() - start
+            self.record(backend, elapsed, ok=True)
+            MODEL_CALL_SECONDS.observe(elapsed, backend=backend.name, outcome="ok")
+            return response
+        raise last_error
+
+    def stats(self) -> List[dict]:
+        with self._lock:
+            return [backend.stats() for backend in self.backends]
+
+
+def make_backend(name: str, max_retries: int = 2) -> Backend:
+    """
+    Create a backend from a name like "anthropic", "bedrock:us-west-2" or "vertex:europe-west1".
+
+    The part after the colon is the region for Bedrock and Vertex, and just a label for
+    Anthropic. <NAME>_MODEL and <NAME>_BASE_URL override the model and endpoint, e.g.
+    ANTHROPIC_LOCAL_BASE_URL for "anthropic:local", falling back to the provider prefix.
+    """
+    provider, _, region = name.partition(":")
+    prefixes = [re.sub(r"[^A-Z0-9]", "_", name.upper()), provider.upper()]
+
+    def env(suffix: str) -> Optional[str]:
+        return next((os.getenv(f"{prefix}_{suffix}") for prefix in prefixes if os.getenv(f"{prefix}_{suffix}")), None)
+
+    model = env("MODEL") or DEFAULT_MODELS.get(provider, DEFAULT_MODELS["anthropic"])
+    base_url = env("BASE_URL")
+
+    if provider == "anthropic":
+        client = Anthropic(api_key=os.getenv('ANTHROPIC_API_KEY'),
+                           base_url=base_url or "https://anthropic.helicone.ai",
+                           default_headers={"Helicone-Auth": f"Bearer {os.environ.get('HELICONE_API_KEY')}"},
+                           max_retries=max_retries,
+                           http_client=PreserializedHttpxClient())
+    elif provider == "bedrock":
+        # Credentials (and the region, unless given) come from the usual AWS environment
+        client = AnthropicBedrock(aws_region=region or None, base_url=base_url, max_retries=max_retries,
+                                  http_client=PreserializedHttpxClient())
+    elif provider == "vertex":
+        # Project (and the region, unless given) come from ANTHROPIC_VERTEX_PROJECT_ID and CLOUD_ML_REGION
+        region_kwargs = {"region": region} if region else {}
+        client = AnthropicVertex(base_url=base_url, max_retries=max_retries,
+                                 http_client=PreserializedHttpxClient(), **region_kwargs)
+    else:
+        raise ValueError(f"Unknown backend: {name}")
+    return Backend(name, client, model)
@@ -0,0 +1,88 @@
+import base64
+import time
+import logging
+from collections import deque
+from dataclasses import dataclass
+from typing import Optional
+
+from playwright.sync_api import Page
+
+
+@dataclass(frozen=True)
+class ScreencastFrame:
+    """A single frame pushed by Chromium's screencast."""
+    timestamp: float  # seconds since the epoch, as reported by the compositor
+    data: bytes
+    media_type: str
+
+
+class ScreencastSource:
+    """
+    Frame source backed by a CDP Page.startScreencast session.
+
+    Chromium pushes a frame whenever the page repaints, so the latest frame is always
+    at hand instead of forcing a capture and PNG encode per screenshot. Frames are
+    only delivered while Playwright is pumping events, which wait_for_frame does.
+    """
+
+    def __init__(self, page: Page, width: int, height: int, quality: int = 80,
+                 image_format: str = "jpeg", buffer_size: int = 4):
+        self.page = page
+        self.width = width
+        self.height = height
+        self.quality = quality
+        self.image_format = image_format
+        self.frames: deque[ScreencastFrame] = deque(maxlen=buffer_size)
+        self._session = None
+
+    @property
+    def media_type(self) -> str:
+        return f"image/{self.image_format}"
+
+    def start(self) -> None:
+        self._session = self.page.context.new_cdp_session(self.page)
+        self._session.on("Page.screencastFrame", self._on_frame)
+        self._session.send("Page.startScreencast", {
+            "format": self.image_format,
+            "quality": self.quality,
+            "maxWidth": self.width,
+            "maxHeight": self.height,
+        })
+
+    def stop(self) -> None:
+        if self._session is None:
+            return
+        try:
+            self._session.send("Page.stopScreencast")
+            self._session.detach()
+        except Exception as e:
+            logging.warning(f"Failed to stop screencast: {str(e)}")
+        finally:
+            self._session = None
+            self.frames.clear()
+
+    def _on_frame(self, params: dict) -> None:
+        timestamp = params.get("metadata", {}).get("timestamp") or time.time()
+        self.frames.append(ScreencastFrame(timestamp, base64.b64decode(params["data"]), self.media_type))
+        # Chromium stops sending frames until the previous one is acknowledged
+        self._session.send("Page.screencastFrameAck", {"sessionId": params["sessionId"]})
+
+    def latest(self) -> Optional[ScreencastFrame]:
+        return self.frames[-1] if self.frames else None
+
+    def wait_for_frame(self, after: float, timeout: float = 1.0, poll_ms: int = 20) -> Optional[ScreencastFrame]:
+        """
+        Wait for the first frame newer than the `after` timestamp.
+
+        Chromium only sends frames on repaint, so None after the timeout means the page
+        has not changed since latest(), which the caller can fall back to.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            newer = next((frame for frame in self.frames if frame.timestamp > after), None)
+            if newer is not None:
+                return newer
+            if time.monotonic() >= deadline:
+                return None
+            # Lets Playwright dispatch pending screencast events
+            self.page.wait_for_timeout(poll_ms)
@@ -0,0 +1,141 @@
+"""
+Trajectory cache for repeated tasks.
+
+A task recorded on request (record_trajectory) that finished using only computer
+actions is stored as its action sequence, with a perceptual hash of the screen before
+each action. The next time the same task starts from the same URL, ChatLoop replays
+the actions without calling the model and checks the screen against the recorded hash
+before every step; at the first step that diverges, the stale recording is dropped and
+the live model loop takes over from there, recording again if asked to.
+
+Recorded actions include typed text, so a cache file of login flows holds credentials
+and should be kept private.
+"""
+
+import os
+import re
+import json
+import time
+import logging
+import threading
+from typing import Optional
+
+from utils.cache import normalize_url
+
+DEFAULT_HASH_TOLERANCE = 24  # differing bits out of 256 still counted as the same screen
+
+
+def normalize_task(text: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation."""
+    return re.sub(r"\s+", " ", text).strip().lower().rstrip(".!?")
+
+
+class TrajectoryRecorder:
+    """Collects the steps of a live run so it can be stored once the task succeeds."""
+
+    def __init__(self, key: str, steps: list = ()):
+        self.key = key
+        # Steps already replayed when recording resumes after a divergence
+        self.steps = list(steps)
+        self.usable = True  # cleared when the run uses a tool that cannot be replayed
+        self.started = time.monotonic()
+        self._last_step = self.started
+
+    def add_step(self, tool_input: dict, screen_hash: int) -> None:
+        now = time.monotonic()
+        # Time since the previous step: the model call that chose this action plus the action
+        self.steps.append({"input": tool_input, "screen_hash": screen_hash, "seconds": now - self._last_step})
+        self._last_step = now
+
+    def finish(self, final_text: str) -> dict:
+        return {
+            "steps": self.steps,
+            "final_text": final_text,
+            "final_seconds": time.monotonic() - self._last_step,
+            "recorded_at": time.time(),
+        }
+
+
+class TrajectoryCache:
+    """Recorded trajectories by task and starting URL, optionally persisted to a JSON file."""
+
+    def __init__(self, path: Optional[str] = None, tolerance: int = DEFAULT_HASH_TOLERANCE):
+        self.path = path
+        self.tolerance = tolerance
+        self._trajectories: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.partial_hits = 0
+        self.misses = 0
+        self.steps_replayed = 0
+        self.time_saved = 0.0
+        if path and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self._trajectories = json.load(f)
+            except (OSError, ValueError) as e:
+                logging.warning(f"Failed to load trajectory cache: {str(e)}")
+
+    @classmethod
+    def from_env(cls) -> Optional["TrajectoryCache"]:
+        """The cache configured by TRAJECTORY_CACHE=1 and TRAJECTORY_CACHE_PATH, or None when off."""
+        if os.getenv("TRAJECTORY_CACHE", "0") != "1":
+            return None
+        return cls(
+            path=os.getenv("TRAJECTORY_CACHE_PATH") or None,
+            tolerance=int(os.getenv("TRAJECTORY_HASH_TOLERANCE", DEFAULT_HASH_TOLERANCE)),
+        )
+
+    @staticmethod
+    def key(task: str, start_url: str) -> str:
+        return f"{normalize_url(start_url)} {normalize_task(task)}"
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            trajectory = self._trajectories.get(key)
+            if trajectory is None:
+                self.misses += 1
+            return trajectory
+
+    def put(self, key: str, trajectory: dict) -> None:
+        with self._lock:
+            self._trajectories[key] = trajectory
+            if not self.path:
+                return
+            try:
+                tmp_path = f"{self.path}.tmp"
+                with open(tmp_path, "w") as f:
+                    json.dump(self._trajectories, f)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                logging.warning(f"Failed to save trajectory cache: {str(e)}")
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._trajectories.pop(key, None)
+
+    def record_replay(self, trajectory: dict, steps_replayed: int, replay_seconds: float) -> None:
+        """Count a replay and the live time it saved, estimated from the recorded step times."""
+        complete = steps_replayed == len(trajectory["steps"])
+        saved = sum(step["seconds"] for step in trajectory["steps"][:steps_replayed])
+        if complete:
+            saved += trajectory["final_seconds"]
+            self.hits += 1
+        elif steps_replayed:
+            self.partial_hits += 1
+        else:
+            self.misses += 1
+        self.steps_replayed += steps_replayed
+        self.time_saved += max(saved - replay_seconds, 0.0)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.partial_hits + self.misses
+        return {
+            "trajectories": len(self._trajectories),
+            "hits": self.hits,
+            "partial_hits": self.partial_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "steps_replayed": self.steps_replayed,
+            "time_saved_seconds": round(self.time_saved, 3),
+        }
@@ -0,0 +1,278 @@
+"""
+Out-of-process browser worker.
+
+RemoteBrowserManager runs a BrowserManager in a dedicated process and talks to it
+over a pipe with a small command protocol, so the web process is free of browser
+load and several workers can spread across cores. Screenshot frames come back
+through a shared memory buffer instead of being pickled through the pipe.
+"""
+
+import os
+import logging
+import weakref
+import threading
+import multiprocessing
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+from typing import Any, Optional
+
+from core.manager import DEFAULT_VIEWPORT, BrowserManager
+from core.metrics import BROWSER_QUEUE_DEPTH
+
+FRAME_BUFFER_SIZE = 16 * 1024 * 1024  # bytes, enough for a PNG of a large viewport
+
+# Plain values that can be sent back as they are; Playwright objects are not
+_PLAIN_TYPES = (type(None), bool, int, float, str, bytes, list, dict, tuple)
+
+
+def _resolve(page, path: tuple) -> Any:
+    target = page
+    for name in path:
+        target = getattr(target, name)
+    return target
+
+
+def _plain(value: Any) -> Any:
+    return value if isinstance(value, _PLAIN_TYPES) else None
+
+
+def _handle(manager: BrowserManager, frames: shared_memory.SharedMemory, command: str, payload: Any) -> Any:
+    if command == "start":
+        return manager.start()
+    if command == "cleanup":
+        return manager.cleanup()
+    if command == "is_started":
+        return manager.is_started
+    if command == "fan_out":
+        return manager.fan_out(**payload)
+    if command == "set_blocking_profile":
+        return manager.set_blocking_profile(**payload)
+    if command == "blocking_stats":
+        return manager.blocking_stats()
+    if command == "save_state":
+        return manager.save_state()
+    if command == "take_checkpoint":
+        return manager.take_checkpoint()
+    if command == "recover":
+        return manager.recover()
+    if command == "recovery_stats":
+        return manager.recovery_stats()
+    if command == "recycle_if_needed":
+        return manager.recycle_if_needed()
+    if command == "memory_stats":
+        return manager.memory_stats()
+
+    with manager.get_page() as page:
+        if command == "get":
+            return _plain(_resolve(page, payload))
+        if command == "call":
+            path, args, kwargs = payload
+            return _plain(_resolve(page, path)(*args, **kwargs))
+        if command == "screenshot":
+            data = page.screenshot(**payload)
+            if len(data) > frames.size:
+                return ("bytes", data)
+            frames.buf[:len(data)] = data
+            return ("frame", len(data))
+    raise ValueError(f"Unknown worker command: {command}")
+
+
+def _worker_main(conn, frame_buffer_name: str, headless: bool, profile: Optional[str] = None,
+                 manager_class: type = BrowserManager) -> None:
+    """Entry point of the worker process."""
+    # The parent owns the buffer and unlinks it; spawned children share its resource tracker
+    frames = shared_memory.SharedMemory(name=frame_buffer_name)
+    manager = manager_class(headless=headless, lazy_start=True, profile=profile)
+    try:
+        while True:
+            command, payload = conn.recv()
+            if command == "shutdown":
+                break
+            try:
+                conn.send(("ok", _handle(manager, frames, command, payload)))
+            except Exception as e:
+                conn.send(("error", f"{type(e).__name__}: {str(e)}"))
+    except EOFError:
+        pass  # parent went away
+    finally:
+        manager.cleanup()
+        frames.close()
+
+
+def _stop_worker(conn, process, frames: shared_memory.SharedMemory, lock) -> None:
+    """Stop a worker process and release its frame buffer; holds no reference to the manager."""
+    try:
+        if process.is_alive():
+            with lock:
+                conn.send(("shutdown", None))
+            process.join(timeout=10)
+        if process.is_alive():
+            process.terminate()
+    except (OSError, EOFError) as e:
+        logging.warning(f"Error stopping browser worker: {str(e)}")
+    finally:
+        frames.close()
+        frames.unlink()
+
+
+class _RemoteMember:
+    """Proxy for an attribute path on the worker's page, e.g. page.mouse.move."""
+
+    def __init__(self, worker: "RemoteBrowserManager", path: tuple):
+        self._worker = worker
+        self._path = path
+
+    def __getattr__(self, name: str) -> "_RemoteMember":
+        return _RemoteMember(self._worker, self._path + (name,))
+
+    def __call__(self, *args, **kwargs) -> Any:
+        return self._worker.request("call", (self._path, args, kwargs))
+
+
+class RemotePage(_RemoteMember):
+    """Page proxy covering what the tools use: methods by path, plus a few properties."""
+
+    def __init__(self, worker: "RemoteBrowserManager"):
+        super().__init__(worker, ())
+
+    @property
+    def url(self) -> str:
+        return self._worker.request("get", ("url",))
+
+    @property
+    def viewport_size(self) -> Optional[dict]:
+        return self._worker.request("get", ("viewport_size",))
+
+    def screenshot(self, **kwargs) -> bytes:
+        return self._worker.screenshot(**kwargs)
+
+
+class RemoteBrowserManager:
+    """
+    BrowserManager lookalike whose browser lives in a dedicated worker process.
+
+    The worker is started with the spawn method, which re-imports the parent's main
+    module in the child; frontends must therefore not create one at import time of
+    a script run directly. The worker stops on shutdown(), when the manager is
+    garbage collected (e.g. with the Streamlit session holding it) or at exit.
+    """
+
+    def __init__(self, headless: bool = False, frame_buffer_size: int = FRAME_BUFFER_SIZE,
+                 profile: Optional[str] = None, manager_class: type = BrowserManager):
+        self.viewport = dict(DEFAULT_VIEWPORT)
+        self.screencast = None  # frames come through the shared buffer instead
+        self._lock = threading.RLock()
+        # Set while a command's reply is outstanding; still set if the caller was interrupted
+        self._awaiting_reply = False
+        self._frames = shared_memory.SharedMemory(create=True, size=frame_buffer_size)
+
+        # spawn, not fork: the parent may already hold threads and Playwright state
+        context = multiprocessing.get_context("spawn")
+        self._conn, child_conn = context.Pipe()
+        self._process = context.Process(
+            target=_worker_main,
+            args=(child_conn, self._frames.name, headless, profile, manager_class),
+            daemon=True,
+        )
+        self._process.start()
+        child_conn.close()
+        # Unlike atexit.register(self.shutdown), this does not keep the manager alive
+        self._finalizer = weakref.finalize(self, _stop_worker, self._conn, self._process, self._frames, self._lock)
+        print(f"Browser worker started with pid {self._process.pid}")
+
+    def request(self, command: str, payload: Any = None) -> Any:
+        BROWSER_QUEUE_DEPTH.inc()
+        with self._lock:
+            BROWSER_QUEUE_DEPTH.dec()
+            self._discard_stale_reply()
+            self._conn.send((command, payload))
+            self._awaiting_reply = True
+            status, value = self._conn.recv()
+            self._awaiting_reply = False
+        if status == "error":
+            raise RuntimeError(f"Browser worker error: {value}")
+        return value
+
+    def _discard_stale_reply(self) -> None:
+        """Read the reply of a command whose caller was interrupted, so replies stay in step."""
+        if self._awaiting_reply:
+            self._conn.recv()
+            self._awaiting_reply = False
+
+    def release(self) -> None:
+        """Wait out any command a stopped task left running, leaving this session's worker idle."""
+        with self._lock:
+            self._discard_stale_reply()
+
+    def screenshot(self, **kwargs) -> bytes:
+        with self._lock:
+            kind, value = self.request("screenshot", kwargs)
+            # Copy out while holding the lock, before the next frame overwrites the buffer
+            return bytes(self._frames.buf[:value]) if kind == "frame" else value
+
+    @property
+    def is_started(self) -> bool:
+        return self.request("is_started")
+
+    def start(self) -> None:
+        self.request("start")
+
+    def fan_out(self, urls: list[str], mode: str = "text", timeout: float = 30.0) -> list[dict]:
+        return self.request("fan_out", {"urls": urls, "mode": mode, "timeout": timeout})
+
+    def set_blocking_profile(self, name: str, block_resource_types: tuple = (), allow_resource_types: tuple = (),
+                             block_domains: tuple = ()) -> None:
+        self.request("set_blocking_profile", {
+            "name": name,
+            "block_resource_types": tuple(block_resource_types),
+            "allow_resource_types": tuple(allow_resource_types),
+            "block_domains": tuple(block_domains),
+        })
+
+    def blocking_stats(self) -> dict:
+        return self.request("blocking_stats")
+
+    def save_state(self) -> None:
+        self.request("save_state")
+
+    def take_checkpoint(self) -> None:
+        self.request("take_checkpoint")
+
+    def recover(self) -> Optional[str]:
+        return self.request("recover")
+
+    def recovery_stats(self) -> dict:
+        return self.request("recovery_stats")
+
+    def recycle_if_needed(self) -> Optional[str]:
+        return self.request("recycle_if_needed")
+
+    def memory_stats(self) -> dict:
+        return self.request("memory_stats")
+
+    @contextmanager
+    def get_page(self):
+        with self._lock:
+            yield RemotePage(self)
+
+    def cleanup(self) -> None:
+        """Close the browser; the worker process stays up and relaunches it on demand."""
+        if self._process.is_alive():
+            self.request("cleanup")
+
+    def shutdown(self) -> None:
+        """Stop the worker process and release the frame buffer; later calls do nothing."""
+        self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+
+def create_browser_manager(headless: bool = False, profile: Optional[str] = None):
+    """A worker-backed manager with BROWSER_WORKER=1, otherwise the in-process one."""
+    if os.getenv("BROWSER_WORKER", "0") == "1":
+        return RemoteBrowserManager(headless=headless, profile=profile)
+    return BrowserManager(headless=headless, lazy_start=True, profile=profile)
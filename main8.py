@@ -2,29 +2,83 @@ import streamlit as st
 from core.loop import ChatLoop
 from anthropic.types import Message, MessageParam, ContentBlock, TextBlockParam, ImageBlockParam, ToolUseBlockParam, ToolResultBlockParam, Usage
 import os
+import base64
+import hashlib
+import uuid
+from io import BytesIO
+from PIL import Image
 from dotenv import load_dotenv
 from core.claude import BetaTextBlockParam, BetaToolUseBlockParam, BetaToolResultBlockParam
 from core.sender import Sender
+from core.worker import create_browser_manager
+from core.blocking import PROFILES
+from core.budget import CancellationToken
 # Load environment variables
 load_dotenv()
 
-def render_message(message):
+THUMBNAIL_WIDTH = 320
+
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def thumbnail(image_hash: str, _image_base64: str) -> bytes:
+    """Downscaled PNG of a screenshot, cached by image hash so reruns skip the decode."""
+    image = Image.open(BytesIO(base64.b64decode(_image_base64)))
+    image.thumbnail((THUMBNAIL_WIDTH, THUMBNAIL_WIDTH))
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def render_image(block, key: str):
+    """Show a cached thumbnail, with the full-size image loaded on demand."""
+    image_base64 = block["source"]["data"]
+    image_hash = hashlib.sha1(image_base64.encode()).hexdigest()
+    st.image(thumbnail(image_hash, image_base64), width=THUMBNAIL_WIDTH)
+    if st.toggle("Full size", key=f"full-{key}-{image_hash}"):
+        st.image(base64.b64decode(image_base64))
+
+
+def render_message(message, index: int):
     """Callback function to render messages and tool outputs"""
     with st.chat_message(message["role"]):
-        for block in message["content"]:
+        for block_index, block in enumerate(message["content"]):
+            key = f"{index}-{block_index}"
             if block["type"] == "text":
                 st.markdown(block["text"])
+            elif block["type"] == "image":
+                render_image(block, key)
             elif block["type"] == "tool_use":
                 st.code(f"Tool Use: {block['name']}\nInput: {block['input']}")
             elif block["type"] == "tool_result":
-                tool_result = st.session_state.tools.get(block["tool_use_id"])
-                if tool_result:
-                    if tool_result.output:
-                        st.code(tool_result.output)
-                    if tool_result.error:
-                        st.error(tool_result.error)
-                    if hasattr(tool_result, 'screenshot') and tool_result.screenshot:
-                        st.image(tool_result.screenshot)
+                content = block.get("content", [])
+                if isinstance(content, str):
+                    content = [{"type": "text", "text": content}]
+                for item_index, item in enumerate(content):
+                    if item["type"] == "text":
+                        if block.get("is_error"):
+                            st.error(item["text"])
+                        else:
+                            st.code(item["text"])
+                    elif item["type"] == "image":
+                        render_image(item, f"{key}-{item_index}")
+
+
+def render_history(messages):
+    """Render the last few messages, with older ones loaded a page at a time."""
+    window = st.session_state.history_window
+    visible_start = max(len(messages) - window * st.session_state.history_pages, 0)
+
+    if visible_start > 0:
+        if st.button(f"Show {min(window, visible_start)} earlier messages ({visible_start} hidden)"):
+            st.session_state.history_pages += 1
+            st.rerun()
+    elif st.session_state.history_pages > 1:
+        if st.button("Collapse earlier messages"):
+            st.session_state.history_pages = 1
+            st.rerun()
+
+    for index in range(visible_start, len(messages)):
+        render_message(messages[index], index)
 
 # Configure Streamlit page
 st.set_page_config(
@@ -38,14 +92,34 @@ st.set_page_config(
 if 'messages' not in st.session_state:
     st.session_state.messages = []
 
+# Labels this session's token usage in the metrics
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex[:12]
+
+
+# Streamlit has no session-end hook; with BROWSER_WORKER=1 the session's worker process
+# stops when the session state holding its manager is dropped and garbage collected
+if 'browser_manager' not in st.session_state:
+    print("Creating new browser manager")
+    st.session_state.browser_manager = create_browser_manager()
 
 if 'chat_loop' not in st.session_state:
-    st.session_state.chat_loop = ChatLoop()
+    st.session_state.chat_loop = ChatLoop(browser_manager=st.session_state.browser_manager)
 
 # Initialize session states
 if 'only_n_most_recent_images' not in st.session_state:
     st.session_state.only_n_most_recent_images = 1
 
+if 'history_window' not in st.session_state:
+    st.session_state.history_window = 10
+
+if 'history_pages' not in st.session_state:
+    st.session_state.history_pages = 1
+
+# The profile belongs to the browser manager, which outside worker mode every session shares
+if 'blocking_profile' not in st.session_state:
+    st.session_state.blocking_profile = st.session_state.browser_manager.blocking_stats()["profile"]
+
 # Add a sidebar configuration
 with st.sidebar:
     st.number_input(
@@ -57,12 +131,43 @@ with st.sidebar:
         help="To reduce tokens, only keep this many recent images in the conversation"
     )
     
+    st.checkbox(
+        "Attach a screenshot to the first message",
+        value=st.session_state.chat_loop.speculative_screenshot,
+        key="speculative_screenshot",
+        help="Saves the model round-trip it usually spends asking for a screenshot"
+    )
+    
+    st.selectbox(
+        "Resource blocking",
+        options=list(PROFILES),
+        key="blocking_profile",
+        on_change=lambda: st.session_state.browser_manager.set_blocking_profile(st.session_state.blocking_profile),
+        help="Block ads, trackers, fonts and video so pages load and settle faster. "
+             "Applies to the shared browser, so to every session unless BROWSER_WORKER=1"
+    )
+    
+    st.number_input(
+        "Show last N messages",
+        min_value=1,
+        max_value=100,
+        key="history_window",
+        help="Older messages are loaded on demand so reruns stay fast in long sessions"
+    )
+    
     # Update chat loop with new value
     st.session_state.chat_loop.only_n_most_recent_images = st.session_state.only_n_most_recent_images
+    st.session_state.chat_loop.speculative_screenshot = st.session_state.speculative_screenshot
     
 # Display chat history
-for message in st.session_state.messages:
-    render_message(message)
+render_history(st.session_state.messages)
+
+def render_appended_message(message):
+    """Render callback for get_response; a turn's messages are appended before they are rendered."""
+    messages = st.session_state.messages
+    index = next(i for i in range(len(messages) - 1, -1, -1) if messages[i] is message)
+    render_message(message, index)
+
 
 # Chat input and message flow
 if prompt := st.chat_input("What would you like me to do?"):
@@ -74,14 +179,24 @@ if prompt := st.chat_input("What would you like me to do?"):
         }]
     }
     st.session_state.messages.append(user_message)
-    render_message(user_message)
+    render_message(user_message, len(st.session_state.messages) - 1)
+
+    # Clicking stop makes Streamlit interrupt this run at its next render; the loop treats
+    # that as a cancellation and releases its hold on the browser on its way out
+    cancel_token = CancellationToken()
+    st.session_state.cancel_token = cancel_token
+    st.button("Stop", on_click=lambda: st.session_state.cancel_token.cancel())
 
-    # Pass the render_message callback to Claude manager
+    # Pass the render_message callback to Claude manager; it runs right after each message is appended
     with st.spinner("Processing..."):
         final_messages = st.session_state.chat_loop.get_response(
             conversation_history=st.session_state.messages,
-            render_callback=render_message
+            render_callback=render_appended_message,
+            session_id=st.session_state.session_id,
+            cancel_token=cancel_token
         )
     
     st.session_state.messages = final_messages
+    if cancel_token.cancelled:
+        st.info(f"Stopped: {cancel_token.reason}")
     
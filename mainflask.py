@@ -1,8 +1,13 @@
-from flask import Flask, request, jsonify, session
+from flask import Flask, request, jsonify, session, Response
 from flask_cors import CORS
 from core.loop import ChatLoop
 from core.sender import Sender
+from core.metrics import REGISTRY
+from core.budget import Budget, CancellationToken
+from core import profiler
+import hmac
 import os
+import threading
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -11,14 +16,39 @@ app = Flask(__name__)
 app.secret_key = os.urandom(24)  # for session management
 CORS(app)
 
-# Global chat loop instance
-chat_loop = ChatLoop()
+# Global chat loop instance, created on first use: with BROWSER_WORKER=1 it spawns a worker
+# process, which re-imports this module when it is run as a script
+_chat_loop = None
+_chat_loop_lock = threading.Lock()
+
+def get_chat_loop() -> ChatLoop:
+    global _chat_loop
+    with _chat_loop_lock:
+        if _chat_loop is None:
+            _chat_loop = ChatLoop()
+        return _chat_loop
+
+# Cancellation tokens of the tasks in progress, by session id; one task per session at a time
+active_tasks = {}
+active_tasks_lock = threading.Lock()
 
 @app.route('/api/chat', methods=['POST'])
 def chat():
+    chat_loop = get_chat_loop()
     data = request.json
     prompt = data.get('message')
     conversation_history = data.get('conversation_history', [])
+    session_id = data.get('session_id', 'default')
+    # Per-request limits override the defaults from the environment
+    try:
+        budget = Budget.from_request(data, chat_loop.budget)
+    except ValueError as e:
+        return jsonify({"status": "error", "error": str(e)}), 400
+    cancel_token = CancellationToken()
+    with active_tasks_lock:
+        if session_id in active_tasks:
+            return jsonify({"status": "error", "error": f"A task is already in progress for session {session_id}"}), 409
+        active_tasks[session_id] = cancel_token
     
     # Create user message
     user_message = {
@@ -35,10 +65,15 @@ def chat():
     # Get response from chat loop
     try:
         final_messages = chat_loop.get_response(
-            conversation_history=conversation_history
+            conversation_history=conversation_history,
+            session_id=session_id,
+            budget=budget,
+            cancel_token=cancel_token,
+            record_trajectory=bool(data.get('record_trajectory', False))
         )
         return jsonify({
-            "status": "success",
+            "status": "stopped" if cancel_token.cancelled else "success",
+            "reason": cancel_token.reason,
             "messages": final_messages
         })
     except Exception as e:
@@ -46,16 +81,71 @@ def chat():
             "status": "error",
             "error": str(e)
         }), 500
+    finally:
+        with active_tasks_lock:
+            del active_tasks[session_id]
+
+@app.route('/api/stop', methods=['POST'])
+def stop():
+    session_id = (request.json or {}).get('session_id', 'default')
+    cancel_token = active_tasks.get(session_id)
+    if cancel_token is None:
+        return jsonify({"status": "error", "error": f"No task in progress for session {session_id}"}), 404
+    cancel_token.cancel()
+    return jsonify({"status": "success"})
 
 @app.route('/api/config', methods=['POST'])
 def update_config():
+    chat_loop = get_chat_loop()
     data = request.json
     try:
         n_images = data.get('only_n_most_recent_images', 1)
         chat_loop.only_n_most_recent_images = n_images
+        if 'speculative_screenshot' in data:
+            chat_loop.speculative_screenshot = bool(data['speculative_screenshot'])
+        if 'blocking_profile' in data:
+            chat_loop.browser_manager.set_blocking_profile(
+                data['blocking_profile'],
+                block_resource_types=data.get('block_resource_types', ()),
+                allow_resource_types=data.get('allow_resource_types', ()),
+                block_domains=data.get('block_domains', ()),
+            )
         return jsonify({"status": "success"})
     except Exception as e:
         return jsonify({"status": "error", "error": str(e)}), 500
 
+@app.route('/api/stats', methods=['GET'])
+def stats():
+    chat_loop = get_chat_loop()
+    return jsonify({
+        "extraction_cache": chat_loop.extraction_cache.stats(),
+        "speculative_screenshot": chat_loop.speculative_stats,
+        "blocking": chat_loop.browser_manager.blocking_stats(),
+        "recovery": chat_loop.browser_manager.recovery_stats(),
+        "memory": chat_loop.browser_manager.memory_stats(),
+        "trajectory_cache": chat_loop.trajectory_cache.stats() if chat_loop.trajectory_cache else None
+    })
+
+@app.route('/api/profile', methods=['POST'])
+def profile():
+    # Disabled unless PROFILE_TOKEN is set; callers send it as a bearer token
+    expected = os.getenv('PROFILE_TOKEN')
+    scheme, _, provided = request.headers.get('Authorization', '').partition(' ')
+    if not expected or scheme != 'Bearer' or not hmac.compare_digest(provided, expected):
+        return jsonify({"status": "error", "error": "Unauthorized"}), 403
+    data = request.json or {}
+    turns = data.get('turns', 5)
+    if isinstance(turns, bool) or not isinstance(turns, int) or turns <= 0:
+        return jsonify({"status": "error", "error": "turns must be a positive whole number"}), 400
+    session_id = data.get('session_id', 'default')
+    if not isinstance(session_id, str):
+        return jsonify({"status": "error", "error": "session_id must be a string"}), 400
+    profiler.arm(session_id, turns)
+    return jsonify({"status": "success", "turns": turns, "output_dir": profiler.PROFILE_DIR})
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
 if __name__ == '__main__':
     app.run(debug=False, host='127.0.0.1', port=5000)
\ No newline at end of file
@@ -0,0 +1,96 @@
+import threading
+
+import pytest
+
+from tools.base import ToolError
+from tools.bash import BashTool
+from tools.collection import ToolCollection
+
+
+@pytest.fixture
+def bash():
+    tool = BashTool(timeout=1.0)
+    yield tool
+    tool.stop()
+
+
+def test_output_and_errors_are_split_at_the_sentinel(bash):
+    result = bash(command="echo out; echo err >&2")
+    assert (result.output, result.error) == ("out", "err")
+    # The next command's output starts clean, with nothing left over from the last one
+    assert bash(command="printf 'a\\nb\\n'").output == "a\nb"
+
+
+def test_state_carries_over_between_calls(bash):
+    bash(command="cd /tmp && export GREETING=hi")
+    assert bash(command="pwd; echo $GREETING").output == "/tmp\nhi"
+
+
+def test_timeout_kills_and_restarts_the_shell(bash):
+    bash(command="export GREETING=hi")
+    with pytest.raises(ToolError, match="timed out"):
+        bash(command="sleep 5")
+    # A fresh shell: the hung command and the old environment are gone
+    assert bash(command="echo ${GREETING:-none}").output == "none"
+
+
+def test_restart_starts_a_fresh_shell(bash):
+    bash(command="export GREETING=hi")
+    assert bash(restart=True).system == "tool has been restarted."
+    assert bash(command="echo ${GREETING:-none}").output == "none"
+
+
+def test_no_command(bash):
+    with pytest.raises(ToolError, match="no command"):
+        bash()
+
+
+def test_sessions_are_isolated_and_run_concurrently(bash):
+    results = {}
+
+    def work(session_id, directory):
+        bash(command=f"cd {directory}", session_id=session_id)
+        results[session_id] = bash(command="sleep 0.2; pwd", session_id=session_id).output
+
+    threads = [threading.Thread(target=work, args=args) for args in (("a", "/tmp"), ("b", "/"))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == {"a": "/tmp", "b": "/"}
+
+
+def test_calls_of_one_session_take_turns(bash):
+    errors = []
+
+    def work():
+        try:
+            bash(command="sleep 0.1; echo done", session_id="shared")
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=work) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+
+
+def test_least_recently_used_shell_is_stopped():
+    tool = BashTool(timeout=1.0, max_sessions=2)
+    try:
+        for session_id in ("a", "b", "c"):
+            tool(command=f"export NAME={session_id}", session_id=session_id)
+        assert list(tool._sessions) == ["b", "c"]
+        assert tool(command="echo ${NAME:-none}", session_id="a").output == "none"
+    finally:
+        tool.stop()
+
+
+def test_collection_passes_the_session_the_model_cannot_choose(bash):
+    tools = ToolCollection(bash)
+    tools.run(name="bash", tool_input={"command": "export NAME=mine"}, session_id="mine")
+    result = tools.run(name="bash", tool_input={"command": "echo ${NAME:-none}", "session_id": "mine"},
+                       session_id="other")
+    assert result.output == "none"
@@ -0,0 +1,61 @@
+import argparse
+import json
+
+import pytest
+
+from batch import completed_ids, final_text, load_tasks, positive_int
+
+
+def write_lines(path, lines):
+    path.write_text("\n".join(json.dumps(line) for line in lines) + "\n")
+    return str(path)
+
+
+def test_load_tasks_defaults_ids_to_line_numbers(tmp_path):
+    path = write_lines(tmp_path / "tasks.jsonl", [{"task": "a"}, {"id": "b", "task": "b"}])
+    assert [task["id"] for task in load_tasks(path)] == ["1", "b"]
+
+
+def test_load_tasks_rejects_duplicate_ids(tmp_path):
+    path = write_lines(tmp_path / "tasks.jsonl", [{"id": "x", "task": "a"}, {"id": "x", "task": "b"}])
+    with pytest.raises(ValueError, match="Line 2: id x is already used on line 1"):
+        load_tasks(path)
+
+
+def test_load_tasks_rejects_default_id_clash(tmp_path):
+    path = write_lines(tmp_path / "tasks.jsonl", [{"id": "2", "task": "a"}, {"task": "b"}])
+    with pytest.raises(ValueError, match="already used"):
+        load_tasks(path)
+
+
+@pytest.mark.parametrize("task", [{"id": "x"}, {"task": "a", "max_turns": 0}, {"task": "a", "max_seconds": "soon"}])
+def test_load_tasks_rejects_bad_lines(tmp_path, task):
+    with pytest.raises(ValueError, match="Line 1"):
+        load_tasks(write_lines(tmp_path / "tasks.jsonl", [task]))
+
+
+def test_completed_ids_skips_cut_lines_and_retried_errors(tmp_path):
+    path = tmp_path / "results.jsonl"
+    path.write_text(json.dumps({"id": "a", "status": "success"}) + "\n"
+                    + json.dumps({"id": "b", "status": "error"}) + "\n"
+                    + '{"id": "c", "sta')
+    assert completed_ids(str(path), retry_errors=False) == {"a", "b"}
+    assert completed_ids(str(path), retry_errors=True) == {"a"}
+    assert completed_ids(str(tmp_path / "missing.jsonl"), retry_errors=False) == set()
+
+
+def test_final_text_uses_last_assistant_message():
+    messages = [
+        {"role": "assistant", "content": [{"type": "text", "text": "first"}]},
+        {"role": "user", "content": [{"type": "tool_result"}]},
+        {"role": "assistant", "content": [{"type": "text", "text": "done"}, {"type": "tool_use"}]},
+    ]
+    assert final_text(messages) == "done"
+    assert final_text([]) == ""
+
+
+def test_positive_int_rejects_zero_and_below():
+    assert positive_int("3") == 3
+    for value in ["0", "-2", "two", "1.5"]:
+        with pytest.raises(argparse.ArgumentTypeError):
+            positive_int(value)
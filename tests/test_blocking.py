@@ -0,0 +1,82 @@
+import pytest
+
+from core.blocking import PROFILES, RequestBlocker, get_profile
+
+
+class FakeRoute:
+    def __init__(self):
+        self.outcome = None
+
+    def continue_(self):
+        self.outcome = "continued"
+
+    def abort(self, error_code=None):
+        self.outcome = "aborted"
+
+
+class FakeFrame:
+    def __init__(self, page_url="https://news.example.com/", parent=None):
+        self.parent_frame = parent
+        self.page = type("Page", (), {"url": page_url})()
+
+
+class FakeRequest:
+    def __init__(self, url, resource_type="script", navigation=False, frame=None):
+        self.url = url
+        self.resource_type = resource_type
+        self.navigation = navigation
+        self.frame = frame or FakeFrame()
+
+    def is_navigation_request(self):
+        return self.navigation
+
+
+def handle(profile: str, request: FakeRequest) -> str:
+    route = FakeRoute()
+    RequestBlocker(get_profile(profile))(route, request)
+    return route.outcome
+
+
+def test_off_profile_installs_no_route():
+    assert not PROFILES["off"].enabled
+    assert PROFILES["lean"].enabled and PROFILES["strict"].enabled
+
+
+@pytest.mark.parametrize("profile, url, resource_type, outcome", [
+    ("lean", "https://cdn.example.com/font.woff2", "font", "aborted"),
+    ("lean", "https://stats.g.doubleclick.net/x.js", "script", "aborted"),
+    ("lean", "https://cdn.other.com/app.js", "script", "continued"),
+    ("strict", "https://cdn.other.com/app.js", "script", "aborted"),
+    ("strict", "https://static.example.com/app.js", "script", "continued"),
+])
+def test_blocking_decisions(profile, url, resource_type, outcome):
+    assert handle(profile, FakeRequest(url, resource_type)) == outcome
+
+
+def test_never_blocks_main_frame_navigation():
+    request = FakeRequest("https://ads.doubleclick.net/", "document", navigation=True)
+    assert handle("strict", request) == "continued"
+
+
+def test_handler_error_lets_request_through():
+    class DetachedFrame(FakeFrame):
+        @property
+        def page(self):
+            raise RuntimeError("frame was detached")
+
+        @page.setter
+        def page(self, value):
+            pass
+
+    request = FakeRequest("https://cdn.other.com/app.js", frame=DetachedFrame())
+    assert handle("strict", request) == "continued"
+
+
+def test_overrides():
+    profile = get_profile("lean").with_overrides(block_resource_types=["image"], allow_resource_types=["font"],
+                                                 block_domains=["example.org"])
+    assert profile.resource_types == {"media", "image"}
+    assert "example.org" in profile.domains
+    assert get_profile("lean").resource_types == {"media", "font"}
+    with pytest.raises(ValueError):
+        get_profile("unknown")
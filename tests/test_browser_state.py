@@ -0,0 +1,92 @@
+import json
+import logging
+
+import pytest
+
+from core.manager import BrowserManager
+
+STATE = {"cookies": [{"name": "sid", "value": "abc", "domain": "example.com", "path": "/"}], "origins": []}
+
+
+class FakeContext:
+    def __init__(self, state=STATE):
+        self.state = state
+
+    def storage_state(self):
+        return self.state
+
+
+class FakeBrowser:
+    def __init__(self):
+        self.storage_states = []
+
+    def new_context(self, viewport, storage_state=None):
+        self.storage_states.append(storage_state)
+        return FakeContext()
+
+
+class FakePage:
+    def __init__(self, url):
+        self.url = url
+
+    def evaluate(self, script):
+        return [0, 0]
+
+
+@pytest.fixture
+def manager(monkeypatch, tmp_path):
+    monkeypatch.setenv("BROWSER_STATE_DIR", str(tmp_path))
+    monkeypatch.delenv("BROWSER_USER_DATA_DIR", raising=False)
+    # A fresh instance of the singleton, without launching a browser
+    monkeypatch.setattr(BrowserManager, "_instance", None)
+    manager = BrowserManager(lazy_start=True, profile="work")
+    manager.browser = FakeBrowser()
+    monkeypatch.setattr(BrowserManager, "_instance", None)
+    return manager
+
+
+def test_save_and_restore_round_trip(manager, tmp_path):
+    manager.context = FakeContext()
+    manager.save_state()
+    assert json.loads((tmp_path / "work.json").read_text()) == STATE
+    assert not (tmp_path / "work.json.tmp").exists()
+    manager._new_context()
+    assert manager.browser.storage_states == [STATE]
+
+
+def test_missing_state_is_a_cold_start(manager):
+    manager._new_context()
+    assert manager.browser.storage_states == [None]
+
+
+@pytest.mark.parametrize("content", ["{", "[]"])
+def test_corrupt_state_is_a_cold_start(manager, tmp_path, caplog, content):
+    (tmp_path / "work.json").write_text(content)
+    with caplog.at_level(logging.WARNING):
+        manager._new_context()
+    assert manager.browser.storage_states == [None]
+    assert "Ignoring browser state" in caplog.text
+
+
+def test_checkpoint_capture_refreshes_the_snapshot(manager, tmp_path):
+    manager.context = FakeContext()
+    manager.page = FakePage("https://example.com/inbox")
+    manager._initialized = True
+    manager.take_checkpoint()
+    assert json.loads((tmp_path / "work.json").read_text()) == STATE
+    # Same site within the capture interval: no new capture and no write
+    (tmp_path / "work.json").unlink()
+    manager.page = FakePage("https://example.com/settings")
+    manager.take_checkpoint()
+    assert not (tmp_path / "work.json").exists()
+
+
+def test_no_profile_writes_nothing(monkeypatch, tmp_path):
+    monkeypatch.setenv("BROWSER_STATE_DIR", str(tmp_path))
+    monkeypatch.delenv("BROWSER_PROFILE", raising=False)
+    monkeypatch.setattr(BrowserManager, "_instance", None)
+    manager = BrowserManager(lazy_start=True)
+    monkeypatch.setattr(BrowserManager, "_instance", None)
+    manager.context = FakeContext()
+    manager.save_state()
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,131 @@
+import math
+import threading
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+
+from core import budget as budget_module
+from core.budget import Budget, BudgetTracker, CancellationToken
+
+
+def usage(input_tokens=0, output_tokens=0, **extra):
+    return SimpleNamespace(input_tokens=input_tokens, output_tokens=output_tokens, **extra)
+
+
+def test_cancellation_token_keeps_first_reason():
+    token = CancellationToken()
+    assert not token.cancelled and token.reason is None
+    token.cancel("budget")
+    token.cancel("user")
+    assert token.cancelled and token.reason == "budget"
+
+
+def test_cancellation_token_across_threads():
+    token = CancellationToken()
+    thread = threading.Thread(target=token.cancel)
+    thread.start()
+    thread.join()
+    assert token.reason == "cancelled by the user"
+
+
+def test_turn_limit_only_applies_before_next_turn():
+    tracker = BudgetTracker(Budget(max_turns=2))
+    tracker.add_turn(usage())
+    tracker.add_turn(usage())
+    assert tracker.exceeded() is None
+    assert tracker.exceeded(next_turn=True) == "turn budget of 2 reached"
+
+
+def test_token_limit_counts_input_and_output():
+    tracker = BudgetTracker(Budget(max_tokens=100))
+    tracker.add_turn(usage(60, 30, cache_read_input_tokens=500))
+    assert tracker.exceeded() is None
+    tracker.add_turn(usage(5, 5))
+    assert tracker.exceeded().startswith("token budget of 100 reached")
+    assert tracker.usage == {"input_tokens": 65, "output_tokens": 35,
+                             "cache_read_input_tokens": 500, "cache_creation_input_tokens": 0}
+
+
+def test_time_limit(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(budget_module.time, "monotonic", lambda: now[0])
+    tracker = BudgetTracker(Budget(max_seconds=10))
+    now[0] += 9
+    assert tracker.exceeded() is None
+    now[0] += 1
+    assert tracker.exceeded() == "time budget of 10s reached"
+
+
+def test_unlimited_by_default(monkeypatch):
+    for name in ("TASK_MAX_TURNS", "TASK_MAX_TOKENS", "TASK_MAX_SECONDS"):
+        monkeypatch.delenv(name, raising=False)
+    tracker = BudgetTracker(Budget.from_env())
+    for _ in range(1000):
+        tracker.add_turn(usage(1000, 1000))
+    assert tracker.exceeded(next_turn=True) is None
+
+
+def test_from_env(monkeypatch):
+    monkeypatch.setenv("TASK_MAX_TURNS", "5")
+    monkeypatch.setenv("TASK_MAX_SECONDS", "1.5")
+    monkeypatch.delenv("TASK_MAX_TOKENS", raising=False)
+    assert Budget.from_env() == Budget(max_turns=5, max_tokens=None, max_seconds=1.5)
+
+
+def test_from_request_coerces_and_falls_back():
+    defaults = Budget(max_turns=10, max_tokens=1000, max_seconds=60.0)
+    assert Budget.from_request({"max_turns": "5", "max_seconds": 2, "max_tokens": None}, defaults) == \
+        Budget(max_turns=5, max_tokens=1000, max_seconds=2.0)
+    assert Budget.from_request({}, defaults) == defaults
+
+
+@pytest.mark.parametrize("data", [
+    {"max_turns": "five"}, {"max_turns": 0}, {"max_turns": -3}, {"max_turns": 2.5}, {"max_turns": True},
+    {"max_tokens": [100]}, {"max_seconds": "nan"}, {"max_seconds": math.inf}, {"max_seconds": -1},
+])
+def test_from_request_rejects_bad_values(data):
+    with pytest.raises(ValueError):
+        Budget.from_request(data, Budget())
+
+
+class FakeBrowserManager:
+    viewport = {"width": 1024, "height": 768}
+    screencast = None
+    is_started = True
+
+    def __init__(self):
+        self.released = 0
+        self.cleaned_up = 0
+        self.saved = 0
+
+    @contextmanager
+    def get_page(self):
+        yield None
+
+    def recycle_if_needed(self):
+        return None
+
+    def release(self):
+        self.released += 1
+
+    def save_state(self):
+        self.saved += 1
+
+    def cleanup(self):
+        self.cleaned_up += 1
+
+
+def test_cancelled_task_releases_without_tearing_down_the_browser(monkeypatch):
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test")
+    from core.loop import ChatLoop
+
+    manager = FakeBrowserManager()
+    chat_loop = ChatLoop(browser_manager=manager)
+    token = CancellationToken()
+    token.cancel()
+    messages = [{"role": "user", "content": [{"type": "text", "text": "hi"}]}]
+    assert chat_loop.get_response(messages, cancel_token=token) == messages
+    assert (manager.released, manager.cleaned_up) == (1, 0)
+    # The warm-start snapshot is kept at the end of every task
+    assert manager.saved == 1
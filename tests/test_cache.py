@@ -0,0 +1,161 @@
+import json
+import shutil
+import subprocess
+
+import pytest
+
+from utils import cache as cache_module
+from utils.cache import ExtractionCache, normalize_url
+from utils.utils import FINGERPRINT_SCRIPT
+
+
+def result(url: str, content: str = "page text", fingerprint: str = "v1") -> dict:
+    return {"url": url, "title": "Title", "content": content, "fingerprint": fingerprint}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, "time", lambda: now[0])
+    return now
+
+
+@pytest.mark.parametrize("url, expected", [
+    ("HTTPS://Example.COM/a?b=2&a=1#frag", "https://example.com/a?a=1&b=2"),
+    ("https://example.com:443", "https://example.com/"),
+    ("http://example.com:8080/x", "http://example.com:8080/x"),
+    ("https://example.com/?utm_source=x&id=3&fbclid=y", "https://example.com/?id=3"),
+])
+def test_normalize_url(url, expected):
+    assert normalize_url(url) == expected
+
+
+def test_hit_by_normalized_url_and_mode():
+    cache = ExtractionCache()
+    cache.put("https://example.com/a?x=1", "text", result("https://example.com/a?x=1"))
+    assert cache.get("https://EXAMPLE.com/a?x=1#top", "text")["content"] == "page text"
+    assert cache.get("https://example.com/a?x=1", "outline") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_fingerprint_mismatch_misses():
+    cache = ExtractionCache()
+    cache.put("https://example.com", "text", result("https://example.com", fingerprint="v1"))
+    assert cache.get("https://example.com", "text", fingerprint="v2") is None
+    assert cache.get("https://example.com", "text", fingerprint="v1") is not None
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = ExtractionCache(ttl=60)
+    cache.put("https://example.com", "text", result("https://example.com"))
+    clock[0] += 59
+    assert cache.get("https://example.com", "text") is not None
+    clock[0] += 2
+    assert cache.get("https://example.com", "text") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_evicts_least_recently_used_over_max_bytes():
+    cache = ExtractionCache(max_bytes=25)
+    for name in ("a", "b"):
+        cache.put(f"https://{name}.example", "text", result(f"https://{name}.example", "x" * 10))
+    cache.get("https://a.example", "text")  # a is now the most recently used
+    cache.put("https://c.example", "text", result("https://c.example", "x" * 10))
+    assert cache.get("https://b.example", "text") is None
+    assert cache.get("https://a.example", "text") is not None
+    assert cache.stats()["bytes"] == 20
+
+
+def test_skips_errors_and_oversized_results():
+    cache = ExtractionCache(max_bytes=5)
+    cache.put("https://a.example", "text", {"url": "https://a.example", "error": "timeout"})
+    cache.put("https://b.example", "text", result("https://b.example", "x" * 10))
+    assert cache.stats()["entries"] == 0
+
+
+def test_replacing_an_entry_keeps_byte_count():
+    cache = ExtractionCache()
+    cache.put("https://a.example", "text", result("https://a.example", "x" * 10))
+    cache.put("https://a.example", "text", result("https://a.example", "x" * 4))
+    assert cache.stats()["bytes"] == 4
+
+
+def test_persists_entries_in_lru_order(tmp_path, clock):
+    path = str(tmp_path / "cache.json")
+    cache = ExtractionCache(ttl=60, max_bytes=100, path=path)
+    cache.put("https://old.example", "text", result("https://old.example"))
+    clock[0] += 30
+    cache.put("https://new.example", "text", result("https://new.example"))
+    cache.save()
+
+    clock[0] += 40  # the first entry is now past its TTL
+    loaded = ExtractionCache(ttl=60, max_bytes=100, path=path)
+    assert loaded.get("https://old.example", "text") is None
+    assert loaded.get("https://new.example", "text") is not None
+
+
+def test_stats():
+    cache = ExtractionCache()
+    cache.put("https://a.example", "text", result("https://a.example", "abc"))
+    cache.get("https://a.example", "text")
+    cache.get("https://b.example", "text")
+    assert cache.stats() == {"entries": 1, "bytes": 3, "hits": 1, "misses": 1, "hit_rate": 0.5, "bytes_saved": 3}
+
+
+NODE = shutil.which("node")
+
+# Minimal page globals for running the fingerprint script outside a browser
+FAKE_PAGE_JS = """
+const [loads] = JSON.parse(process.argv[1]);
+const results = [];
+for (const load of loads) {
+    const window = {};
+    if (load.counter) window.__domVersion = 0;
+    let text = load.text;
+    const document = {
+        body: {get innerText() { window.__reads = (window.__reads || 0) + 1; return text; }},
+        getElementsByTagName: () => ({length: load.elements}),
+    };
+    const fingerprint = eval(SCRIPT);
+    const values = [fingerprint()];
+    for (const change of load.changes || []) {
+        text = change;
+        if (load.counter) window.__domVersion++;
+        values.push(fingerprint());
+    }
+    values.push(fingerprint());
+    results.push({values, reads: window.__reads || 0});
+}
+console.log(JSON.stringify(results));
+"""
+
+
+def run_fingerprint(*loads):
+    script = "const SCRIPT = " + json.dumps(FINGERPRINT_SCRIPT) + ";\n" + FAKE_PAGE_JS
+    output = subprocess.run([NODE, "-e", script, json.dumps([list(loads)])],
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output)
+
+
+@pytest.mark.skipif(NODE is None, reason="needs node to run the page script")
+def test_revisited_unchanged_page_hits():
+    first, revisit = run_fingerprint({"text": "Inbox (3)", "elements": 40, "counter": True},
+                                     {"text": "Inbox (3)", "elements": 40, "counter": True})
+    assert first["values"][0] == revisit["values"][0]
+    cache = ExtractionCache()
+    cache.put("https://example.com", "text", result("https://example.com", fingerprint=first["values"][0]))
+    assert cache.get("https://example.com", "text", fingerprint=revisit["values"][0]) is not None
+
+
+@pytest.mark.skipif(NODE is None, reason="needs node to run the page script")
+def test_fingerprint_follows_content_and_hashes_once_per_dom_version():
+    with_counter, without_counter = run_fingerprint(
+        {"text": "Inbox (3)", "elements": 40, "counter": True, "changes": ["Inbox (4)"]},
+        {"text": "Inbox (3)", "elements": 40, "changes": ["Inbox (4)"]},
+    )
+    before, after, again = with_counter["values"]
+    assert before != after and after == again
+    # The repeat call on the unchanged DOM reused the remembered value
+    assert with_counter["reads"] == 2
+    assert without_counter["values"] == with_counter["values"]
+    assert without_counter["reads"] == 3
@@ -0,0 +1,69 @@
+from contextlib import contextmanager
+
+import pytest
+
+from tools.base import ToolError
+from tools.computer import ComputerTool
+
+
+class FakeKeyboard:
+    def __init__(self, fail=False):
+        self.fail = fail
+
+    def press(self, key):
+        if self.fail:
+            raise RuntimeError("page crashed")
+
+    def type(self, text, delay=None):
+        pass
+
+
+class FakePage:
+    def __init__(self, fail=False):
+        self.keyboard = FakeKeyboard(fail)
+
+    def screenshot(self, type="png"):
+        return b"\x89PNG fake"
+
+
+class FakeBrowserManager:
+    viewport = {"width": 1024, "height": 768}
+    screencast = None
+
+    def __init__(self, fail=False):
+        self.page = FakePage(fail)
+        self.checkpoints = 0
+
+    @contextmanager
+    def get_page(self):
+        yield self.page
+
+    def take_checkpoint(self):
+        self.checkpoints += 1
+
+
+def test_checkpoint_after_state_changing_actions():
+    manager = FakeBrowserManager()
+    tool = ComputerTool(browser_manager=manager)
+    tool(action="key", text="Return")
+    tool(action="type", text="hello")
+    assert manager.checkpoints == 2
+
+
+def test_no_checkpoint_for_read_only_or_failed_actions():
+    manager = FakeBrowserManager(fail=True)
+    tool = ComputerTool(browser_manager=manager)
+    assert tool(action="screenshot").image
+    assert tool(action="key", text="Return").error
+    with pytest.raises(ToolError):
+        tool(action="type")
+    assert manager.checkpoints == 0
+
+
+def test_last_frame_is_kept_only_for_the_action_that_captured_it():
+    manager = FakeBrowserManager(fail=True)
+    tool = ComputerTool(browser_manager=manager)
+    tool(action="screenshot")
+    assert tool.last_frame == b"\x89PNG fake"
+    tool(action="key", text="Return")
+    assert tool.last_frame is None
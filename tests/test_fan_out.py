@@ -0,0 +1,113 @@
+import time
+
+from utils.utils import NAVIGATE_SCRIPT, fan_out_extract
+
+
+class FakePage:
+    """
+    Takes `latency` seconds to load, or the time given in `slow`; a URL in `broken`
+    lands on Chromium's error page. goto() waits out the latency like a real one.
+    """
+
+    def __init__(self, context):
+        self.context = context
+        self.url = "about:blank"
+        self.ready_at = None
+        self.closed = False
+
+    def goto(self, url, wait_until=None, timeout=None):
+        self.evaluate(NAVIGATE_SCRIPT, url)
+        time.sleep(self.ready_at - time.monotonic())
+
+    def on(self, event, handler):
+        pass
+
+    def _land(self):
+        url = self.context.navigating_to[self]
+        self.url = "chrome-error://chromewebdata/" if url in self.context.broken else url
+
+    def wait_for_event(self, event, predicate=None, timeout=None):
+        self.context.timeouts.append(timeout)
+        delay = self.ready_at - time.monotonic()
+        if delay * 1000 > timeout:
+            time.sleep(timeout / 1000)
+            raise TimeoutError(f"Timeout {timeout:.0f}ms exceeded")
+        time.sleep(max(delay, 0))
+        self._land()
+        assert predicate(self)
+
+    def evaluate(self, script, *args):
+        if script == NAVIGATE_SCRIPT:
+            url = args[0]
+            self.context.navigations.append(url)
+            self.context.navigating_to[self] = url
+            self.ready_at = time.monotonic() + self.context.slow.get(url, self.context.latency)
+            return None
+        return f"text of {self.url}"
+
+    def title(self):
+        return f"title of {self.url}"
+
+    def close(self):
+        self.closed = True
+
+
+class FakeContext:
+    def __init__(self, slow=None, broken=(), latency=0.0):
+        self.slow = slow or {}
+        self.latency = latency
+        self.broken = set(broken)
+        self.navigating_to = {}
+        self.pages = []
+        self.navigations = []
+        self.timeouts = []
+
+    def new_page(self):
+        page = FakePage(self)
+        self.pages.append(page)
+        return page
+
+
+def test_extracts_each_url_in_order_and_closes_pages():
+    context = FakeContext()
+    results = fan_out_extract(context, ["https://a.example", "https://b.example"])
+    assert [result["url"] for result in results] == ["https://a.example", "https://b.example"]
+    assert results[1]["content"] == "text of https://b.example"
+    assert all(page.closed for page in context.pages)
+
+
+def test_one_bad_url_only_fails_its_own_entry():
+    context = FakeContext(broken={"https://bad.example"})
+    results = fan_out_extract(context, ["https://bad.example", "https://good.example"])
+    assert "navigation to https://bad.example failed" in results[0]["error"]
+    assert results[1]["title"] == "title of https://good.example"
+
+
+def test_only_http_urls_are_loaded():
+    context = FakeContext()
+    urls = ["javascript:alert(1)", "file:///etc/passwd", "https://ok.example"]
+    results = fan_out_extract(context, urls)
+    assert context.navigations == ["https://ok.example"]
+    assert "http" in results[0]["error"] and "http" in results[1]["error"]
+    assert "error" not in results[2]
+
+
+def test_batch_shares_one_deadline():
+    slow = {f"https://slow{i}.example": 5 for i in range(3)}
+    context = FakeContext(slow=slow)
+    start = time.monotonic()
+    results = fan_out_extract(context, list(slow), timeout=0.3)
+    # Three timed-out pages cost one timeout between them, not three
+    assert time.monotonic() - start < 0.6
+    assert all("Timeout" in result["error"] for result in results)
+    assert context.timeouts[1] < 300 and context.timeouts[2] > 0
+
+
+def test_navigations_overlap():
+    urls = [f"https://site{i}.example" for i in range(4)]
+    context = FakeContext(latency=0.3, slow={urls[2]: 0.5})
+    start = time.monotonic()
+    results = fan_out_extract(context, urls)
+    # Bounded by the slowest page, not the 1.4s the latencies add up to
+    assert time.monotonic() - start < 0.8
+    assert [result["title"] for result in results] == [f"title of {url}" for url in urls]
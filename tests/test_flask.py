@@ -0,0 +1,86 @@
+import importlib
+import threading
+
+import pytest
+
+
+@pytest.fixture(scope="module")
+def client():
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setenv("ANTHROPIC_API_KEY", "test")
+        monkeypatch.setenv("BROWSER_WORKER", "0")
+        mainflask = importlib.import_module("mainflask")
+    return mainflask.app.test_client()
+
+
+@pytest.mark.parametrize("limits", [
+    {"max_turns": "five"}, {"max_turns": -1}, {"max_tokens": 1.5}, {"max_seconds": "soon"}, {"max_seconds": [1]},
+])
+def test_chat_rejects_bad_limits(client, limits):
+    response = client.post("/api/chat", json={"message": "hi", **limits})
+    assert response.status_code == 400
+    assert response.json["status"] == "error"
+
+
+def test_stop_without_task(client):
+    response = client.post("/api/stop", json={"session_id": "nobody"})
+    assert response.status_code == 404
+
+
+@pytest.fixture
+def profile_token(monkeypatch):
+    from core import profiler
+
+    monkeypatch.setenv("PROFILE_TOKEN", "secret")
+    monkeypatch.setattr(profiler, "_armed", {})
+    return profiler
+
+
+@pytest.mark.parametrize("authorization", [None, "secret", "Token secret", "Bearer wrong", "Bearer  secret"])
+def test_profile_requires_exact_bearer_token(client, profile_token, authorization):
+    headers = {"Authorization": authorization} if authorization else {}
+    response = client.post("/api/profile", json={}, headers=headers)
+    assert response.status_code == 403
+    assert profile_token._armed == {}
+
+
+@pytest.mark.parametrize("body", [{"turns": "five"}, {"turns": 0}, {"turns": -2}, {"turns": 1.5},
+                                  {"turns": True}, {"session_id": ["a"]}])
+def test_profile_rejects_bad_arguments(client, profile_token, body):
+    response = client.post("/api/profile", json=body, headers={"Authorization": "Bearer secret"})
+    assert response.status_code == 400
+    assert profile_token._armed == {}
+
+
+def test_profile_arms_the_session(client, profile_token):
+    response = client.post("/api/profile", json={"session_id": "s1", "turns": 3},
+                           headers={"Authorization": "Bearer secret"})
+    assert response.status_code == 200
+    assert profile_token._armed == {"s1": 3}
+
+
+def test_chat_rejects_a_second_task_for_the_same_session(client, monkeypatch):
+    import mainflask
+
+    started, finish = threading.Event(), threading.Event()
+
+    def get_response(**kwargs):
+        started.set()
+        finish.wait(5)
+        return kwargs["conversation_history"]
+
+    monkeypatch.setattr(mainflask.get_chat_loop(), "get_response", get_response)
+    first = threading.Thread(target=client.post, args=("/api/chat",),
+                             kwargs={"json": {"message": "hi", "session_id": "busy"}})
+    first.start()
+    try:
+        assert started.wait(5)
+        response = client.post("/api/chat", json={"message": "again", "session_id": "busy"})
+        assert response.status_code == 409
+        assert response.json["status"] == "error"
+        # The running task keeps its token, so it can still be stopped
+        assert client.post("/api/stop", json={"session_id": "busy"}).status_code == 200
+    finally:
+        finish.set()
+        first.join(5)
+    assert "busy" not in mainflask.active_tasks
@@ -0,0 +1,115 @@
+from contextlib import contextmanager
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from core.budget import CancellationToken
+from utils.utils import FrameDiffer
+
+
+def png(marks=(), size=(200, 100)) -> bytes:
+    """A white frame with black squares at the given (x, y) positions."""
+    image = Image.new("RGB", size, (255, 255, 255))
+    for x, y in marks:
+        image.paste((0, 0, 0), (x, y, x + 10, y + 10))
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_first_frame_is_a_keyframe():
+    differ = FrameDiffer()
+    frame = png()
+    assert differ.diff(frame) == (frame, None)
+    assert differ.keyframe_image == frame
+
+
+def test_small_change_is_a_padded_delta():
+    differ = FrameDiffer(max_deltas=3)
+    differ.diff(png())
+    patch, box = differ.diff(png([(50, 40)]))
+    assert box == (42, 32, 26, 26)
+    assert Image.open(BytesIO(patch)).size == (26, 26)
+
+
+def test_unchanged_frame_is_an_empty_delta():
+    differ = FrameDiffer()
+    differ.diff(png())
+    assert differ.diff(png()) == (b"", (0, 0, 0, 0))
+
+
+def test_large_change_is_a_new_keyframe():
+    differ = FrameDiffer(max_changed_fraction=0.1)
+    differ.diff(png())
+    frame = png([(0, 0), (190, 90)])
+    assert differ.diff(frame) == (frame, None)
+    assert differ.keyframe_image == frame
+
+
+def test_resized_frame_is_a_new_keyframe():
+    differ = FrameDiffer()
+    differ.diff(png())
+    frame = png(size=(100, 100))
+    assert differ.diff(frame)[1] is None
+
+
+@pytest.mark.parametrize("max_deltas", [0, 1, 2])
+def test_full_frame_after_max_deltas(max_deltas):
+    differ = FrameDiffer(max_deltas=max_deltas)
+    differ.diff(png())
+    boxes = [differ.diff(png([(10 * step, 0)]))[1] for step in range(1, max_deltas + 2)]
+    assert [box is None for box in boxes] == [False] * max_deltas + [True]
+    assert differ.stats["full_frames"] == 2
+
+
+def test_reset_drops_the_keyframe():
+    differ = FrameDiffer()
+    differ.diff(png())
+    differ.reset()
+    assert differ.keyframe_image is None and differ.keyframe_base64 is None
+    assert differ.diff(png([(50, 40)]))[1] is None
+
+
+class FakeBrowserManager:
+    viewport = {"width": 1024, "height": 768}
+    screencast = None
+    is_started = True
+
+    @contextmanager
+    def get_page(self):
+        yield None
+
+    def recycle_if_needed(self):
+        return None
+
+    def release(self):
+        pass
+
+    def save_state(self):
+        pass
+
+
+def image_block(data: str) -> dict:
+    return {"type": "image", "source": {"type": "base64", "media_type": "image/png", "data": data}}
+
+
+def test_loop_resets_the_differ_when_history_lacks_the_keyframe(monkeypatch):
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test")
+    monkeypatch.setenv("DELTA_FRAMES", "1")
+    from core.loop import ChatLoop
+
+    chat_loop = ChatLoop(browser_manager=FakeBrowserManager())
+    differ = chat_loop.tool_collection.tool_map["computer"].frame_differ
+    differ.diff(png())
+    keyframe = differ.keyframe_base64
+    holding = [{"role": "user", "content": [
+        {"type": "tool_result", "tool_use_id": "t", "content": [image_block(keyframe)]}]}]
+    chat_loop._reset_orphaned_keyframe(holding)
+    assert differ.keyframe_image is not None
+
+    # A new task's history, e.g. another Flask session on the shared ChatLoop
+    token = CancellationToken()
+    token.cancel()
+    chat_loop.get_response([{"role": "user", "content": [{"type": "text", "text": "hi"}]}], cancel_token=token)
+    assert differ.keyframe_image is None
@@ -0,0 +1,124 @@
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import psutil
+import pytest
+
+from core import memory as memory_module
+from core.memory import MemoryWatchdog
+
+MB = 1024 * 1024
+
+
+class FakeProcess:
+    def __init__(self, name="python", rss_mb=100, children=(), gone=False):
+        self._name = name
+        self._rss = rss_mb * MB
+        self._children = list(children)
+        self._gone = gone
+
+    def name(self):
+        if self._gone:
+            raise psutil.NoSuchProcess(1)
+        return self._name
+
+    def memory_info(self):
+        if self._gone:
+            raise psutil.NoSuchProcess(1)
+        return SimpleNamespace(rss=self._rss)
+
+    def children(self, recursive=False):
+        return self._children
+
+
+@pytest.fixture
+def processes(monkeypatch):
+    """Sets the process tree the watchdog sees."""
+    tree = {"root": FakeProcess()}
+    monkeypatch.setattr(memory_module.psutil, "Process", lambda pid: tree["root"])
+    return tree
+
+
+def test_counts_only_browser_processes(processes):
+    processes["root"] = FakeProcess(rss_mb=200, children=[
+        FakeProcess("chrome", 300), FakeProcess("Chromium Helper (Renderer)", 400),
+        FakeProcess("headless_shell", 100), FakeProcess("bash", 900), FakeProcess("chrome", gone=True),
+    ])
+    sample = MemoryWatchdog().sample()
+    assert sample["browser_rss"] == 800 * MB
+    assert sample["python_rss"] == 200 * MB
+
+
+def test_recycles_an_old_context(processes):
+    watchdog = MemoryWatchdog(max_context_age=60)
+    assert watchdog.recycle_reason(time.time() - 30) is None
+    assert "old" in watchdog.recycle_reason(time.time() - 90)
+
+
+def test_recycles_above_the_rss_limit(processes):
+    processes["root"] = FakeProcess(children=[FakeProcess("chrome", 2000)])
+    watchdog = MemoryWatchdog(max_browser_rss_mb=1500, min_context_age=0)
+    assert "2000 MiB" in watchdog.recycle_reason(time.time())
+    processes["root"]._children = [FakeProcess("chrome", 1000)]
+    assert watchdog.recycle_reason(time.time()) is None
+
+
+def test_young_context_is_not_recycled_for_memory(processes):
+    processes["root"] = FakeProcess(children=[FakeProcess("chrome", 2000)])
+    watchdog = MemoryWatchdog(max_browser_rss_mb=1500, min_context_age=300)
+    assert watchdog.recycle_reason(time.time() - 10) is None
+    assert watchdog.recycle_reason(time.time() - 400) is not None
+
+
+def test_zero_disables_the_checks(processes):
+    processes["root"] = FakeProcess(children=[FakeProcess("chrome", 99999)])
+    watchdog = MemoryWatchdog(max_browser_rss_mb=0, max_context_age=0, min_context_age=0)
+    assert watchdog.recycle_reason(time.time() - 10 ** 6) is None
+
+
+class FakeBrowserManager:
+    viewport = {"width": 1024, "height": 768}
+    screencast = None
+    is_started = True
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.recycle_checks = 0
+        self.recovered = 0
+
+    @contextmanager
+    def get_page(self):
+        yield None
+
+    def recycle_if_needed(self):
+        self.recycle_checks += 1
+        if self.fail:
+            raise RuntimeError("context closed")
+
+    def recover(self):
+        self.recovered += 1
+
+    def release(self):
+        pass
+
+    def save_state(self):
+        pass
+
+
+@pytest.mark.parametrize("fail", [False, True])
+def test_loop_checks_for_recycling_every_turn(monkeypatch, fail):
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test")
+    from core.loop import ChatLoop
+    from tools.base import ToolResult
+
+    manager = FakeBrowserManager(fail=fail)
+    chat_loop = ChatLoop(browser_manager=manager)
+    tool_use = SimpleNamespace(type="tool_use", id="t", name="bash", input={"command": "true"})
+    script = [SimpleNamespace(content=[tool_use], usage=None) for _ in range(2)]
+    script.append(SimpleNamespace(content=[SimpleNamespace(type="text", text="done")], usage=None))
+    monkeypatch.setattr(chat_loop, "_call_claude", lambda conversation: script.pop(0))
+    monkeypatch.setattr(chat_loop.tool_collection, "run", lambda **kwargs: ToolResult(output="ok"))
+    chat_loop.get_response([{"role": "user", "content": [{"type": "text", "text": "hi"}]}])
+    assert manager.recycle_checks == 3
+    assert manager.recovered == (3 if fail else 0)
@@ -0,0 +1,138 @@
+import copy
+import json
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+
+from core.claude import ClaudeManager
+from core.messages import Conversation, ConversationCache
+
+
+def image(data: str) -> dict:
+    return {"type": "image", "source": {"type": "base64", "media_type": "image/png", "data": data}}
+
+
+def history(screenshots: int) -> list:
+    messages = [{"role": "user", "content": [{"type": "text", "text": "Go"}, image("c3RhcnQ=")]}]
+    for i in range(screenshots):
+        messages.append({"role": "assistant", "content": [
+            {"type": "tool_use", "id": f"toolu_{i}", "name": "computer", "input": {"action": "screenshot"}}]})
+        messages.append({"role": "user", "content": [{"type": "tool_result", "tool_use_id": f"toolu_{i}",
+                                                      "content": [{"type": "text", "text": "ok"}, image(f"aW1n{i}")],
+                                                      "is_error": False}]})
+    return messages
+
+
+def claude_manager() -> ClaudeManager:
+    # Skips __init__, which builds API clients
+    manager = ClaudeManager.__new__(ClaudeManager)
+    manager.min_removal_threshold = 2
+    return manager
+
+
+def count_images(messages: list) -> int:
+    return json.dumps(messages).count('"type": "image"')
+
+
+def test_round_trips_params():
+    messages = history(2)
+    conversation = Conversation.from_params(messages)
+    assert conversation.to_params() == messages
+    assert json.loads(conversation.to_json()) == messages
+
+
+@pytest.mark.parametrize("screenshots", [1, 2, 3, 6])
+@pytest.mark.parametrize("keep", [1, 3])
+def test_typed_and_dict_filters_drop_the_same_images(screenshots, keep):
+    messages = history(screenshots)
+    conversation = Conversation.from_params(copy.deepcopy(messages))
+    conversation.filter_recent_images(keep, min_removal_threshold=2)
+    claude_manager().filter_recent_images(messages, keep)
+    assert conversation.to_params() == messages
+    assert json.loads(conversation.to_json()) == messages
+
+
+def test_filter_keeps_history_bounded():
+    messages = history(10)
+    claude_manager().filter_recent_images(messages, 1)
+    assert count_images(messages) <= 2
+    # The newest screenshot is the one kept
+    assert messages[-1]["content"][0]["content"][-1] == image("aW1n9")
+
+
+def test_cache_reuses_matching_messages():
+    cache = ConversationCache()
+    messages = history(2)
+    first = cache.take("s1", messages)
+    first.to_json()
+    cache.put("s1", first)
+
+    # The frontend sends the history back as new dicts, with one more turn
+    sent = json.loads(json.dumps(messages)) + [{"role": "user", "content": [{"type": "text", "text": "More"}]}]
+    second = cache.take("s1", sent)
+    assert [message.id for message in second.messages[:5]] == [message.id for message in first.messages]
+    assert all(new is old for new, old in zip(second.messages, first.messages))
+    assert json.loads(second.to_json()) == sent
+
+
+def test_cache_rebuilds_from_the_first_edited_message():
+    cache = ConversationCache()
+    messages = history(2)
+    first = cache.take("s1", messages)
+    cache.put("s1", first)
+    edited = copy.deepcopy(messages)
+    edited[2]["content"][0]["content"][0]["text"] = "changed"
+    second = cache.take("s1", edited)
+    assert second.messages[:2] == first.messages[:2]
+    assert all(new is not old for new, old in zip(second.messages[2:], first.messages[2:]))
+    assert json.loads(second.to_json()) == edited
+
+
+def test_cache_hands_a_conversation_to_one_task_at_a_time():
+    cache = ConversationCache(max_sessions=1)
+    messages = history(1)
+    cache.put("s1", cache.take("s1", messages))
+    taken = cache.take("s1", messages)
+    assert all(new is not old for new, old in zip(cache.take("s1", messages).messages, taken.messages))
+    # Past max_sessions the least recently used session is dropped
+    cache.put("s1", taken)
+    cache.put("s2", cache.take("s2", messages))
+    assert cache.take("s1", messages).messages[0] is not taken.messages[0]
+
+
+def test_message_ids_last_across_requests(monkeypatch):
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test")
+    from core.loop import ChatLoop
+
+    class Manager:
+        viewport = {"width": 1024, "height": 768}
+        screencast = None
+        is_started = True
+
+        @contextmanager
+        def get_page(self):
+            yield None
+
+        def recycle_if_needed(self):
+            return None
+
+        def save_state(self):
+            pass
+
+    chat_loop = ChatLoop(browser_manager=Manager())
+    seen = []
+
+    def call_claude(conversation):
+        seen.append([(message.id, message.to_json()) for message in conversation])
+        return SimpleNamespace(content=[SimpleNamespace(type="text", text="done")], usage=None)
+
+    monkeypatch.setattr(chat_loop, "_call_claude", call_claude)
+    messages = chat_loop.get_response([{"role": "user", "content": [{"type": "text", "text": "Go"}]}],
+                                      session_id="s1")
+    messages = json.loads(json.dumps(messages))
+    messages.append({"role": "user", "content": [{"type": "text", "text": "Again"}]})
+    chat_loop.get_response(messages, session_id="s1")
+    assert len(seen[1]) == 3
+    # The first request's message kept its id and its serialized fragment
+    assert seen[1][0][0] == seen[0][0][0] and seen[1][0][1] is seen[0][0][1]
@@ -0,0 +1,68 @@
+from types import SimpleNamespace
+
+from core import metrics
+from core.metrics import Counter, Gauge, Histogram, Registry
+
+
+def test_counter_renders_help_type_and_labels():
+    counter = Counter("requests_total", "Requests.", ("path",))
+    counter.inc(path="/a")
+    counter.inc(2, path="/a")
+    counter.inc(path='quote"and\\slash\nline')
+    assert counter.render().splitlines() == [
+        "# HELP requests_total Requests.",
+        "# TYPE requests_total counter",
+        'requests_total{path="/a"} 3',
+        'requests_total{path="quote\\"and\\\\slash\\nline"} 1',
+    ]
+
+
+def test_unlabelled_gauge_reports_zero_before_first_value():
+    gauge = Gauge("busy", "Busy.")
+    assert gauge.samples() == ["busy 0"]
+    gauge.inc()
+    gauge.inc()
+    gauge.dec()
+    assert gauge.samples() == ["busy 1"]
+
+
+def test_gauge_function_read_at_scrape_time():
+    gauge = Gauge("depth", "Depth.")
+    value = [3]
+    gauge.set_function(lambda: value[0])
+    value[0] = 5
+    assert gauge.samples() == ["depth 5.0"]
+    gauge.set_function(lambda: 1 / 0)
+    assert gauge.samples() == []
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("latency_seconds", "Latency.", ("backend",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 3.0):
+        histogram.observe(value, backend="a")
+    assert histogram.samples() == [
+        'latency_seconds_bucket{backend="a",le="0.1"} 1',
+        'latency_seconds_bucket{backend="a",le="1.0"} 3',
+        'latency_seconds_bucket{backend="a",le="+Inf"} 4',
+        'latency_seconds_sum{backend="a"} 4.05',
+        'latency_seconds_count{backend="a"} 4',
+    ]
+
+
+def test_registry_renders_every_metric():
+    registry = Registry()
+    registry.register(Counter("a_total", "A."))
+    registry.register(Gauge("b", "B."))
+    text = registry.render()
+    assert text.endswith("\n")
+    assert "# TYPE a_total counter" in text and "b 0" in text
+
+
+def test_record_usage_counts_tokens_by_kind_only():
+    before = dict(metrics.TOKENS._values)
+    metrics.record_usage(SimpleNamespace(input_tokens=10, output_tokens=4, cache_read_input_tokens=None,
+                                         cache_creation_input_tokens=2))
+    metrics.record_usage(None)
+    added = {key: value - before.get(key, 0) for key, value in metrics.TOKENS._values.items()}
+    assert {key: value for key, value in added.items() if value} == {
+        ("input",): 10, ("output",): 4, ("cache_creation",): 2}
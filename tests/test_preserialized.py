@@ -0,0 +1,75 @@
+import json
+
+import httpx
+import pytest
+from anthropic import Anthropic, AnthropicBedrock, AnthropicVertex
+
+from core.messages import Conversation, ImageBlock, Message, TextBlock, ToolResultBlock, ToolUseBlock
+from core.router import Backend, BackendRouter, PreserializedHttpxClient, RawJSON, encode_body
+from core.sender import Sender
+
+RESPONSE = {
+    "id": "msg_1", "type": "message", "role": "assistant", "model": "model",
+    "content": [{"type": "text", "text": "Done"}], "stop_reason": "end_turn", "stop_sequence": None,
+    "usage": {"input_tokens": 1, "output_tokens": 1},
+}
+TOOLS = [{"name": "computer", "type": "computer_20241022", "display_width_px": 1024, "display_height_px": 768}]
+BETAS = ["computer-use-2024-10-22"]
+
+
+def conversation() -> Conversation:
+    return Conversation([
+        Message(Sender.USER, [TextBlock("Open the été \"report\"")]),
+        Message(Sender.ASSISSTANT, [TextBlock("Sure"), ToolUseBlock("toolu_1", "computer", {"action": "screenshot"})]),
+        Message(Sender.USER, [ToolResultBlock("toolu_1", [TextBlock("Screenshot taken"),
+                                                         ImageBlock(b"\x89PNG fake", "image/png")])]),
+        Message(Sender.USER, [ToolResultBlock("toolu_2", "Tool execution failed", is_error=True)]),
+    ])
+
+
+class RecordingTransport(httpx.MockTransport):
+    def __init__(self):
+        self.requests = []
+        super().__init__(self.handle)
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        return httpx.Response(200, json=RESPONSE)
+
+
+def make_client(provider: str, transport: httpx.MockTransport, monkeypatch):
+    http_client = PreserializedHttpxClient(transport=transport)
+    if provider == "anthropic":
+        return Anthropic(api_key="test", base_url="https://api.example.com", http_client=http_client)
+    if provider == "bedrock":
+        # Signing needs botocore and AWS credentials, and does not touch the body
+        monkeypatch.setattr(AnthropicBedrock, "_prepare_request", lambda self, request: None)
+        return AnthropicBedrock(aws_region="us-west-2", aws_access_key="key", aws_secret_key="secret",
+                                http_client=http_client)
+    return AnthropicVertex(region="us-east5", project_id="project", access_token="token", http_client=http_client)
+
+
+@pytest.mark.parametrize("provider", ["anthropic", "bedrock", "vertex"])
+def test_preserialized_body_matches_sdk_body(provider, monkeypatch):
+    transport = RecordingTransport()
+    router = BackendRouter([Backend(provider, make_client(provider, transport, monkeypatch), "model")])
+    history = conversation()
+
+    router.create(max_tokens=4096, system="system prompt", messages=history.to_params(),
+                  betas=BETAS, tools=TOOLS)
+    response = router.create_preserialized(messages_json=history.to_json(), betas=BETAS,
+                                           max_tokens=4096, system="system prompt", tools=TOOLS)
+
+    sdk_request, preserialized_request = transport.requests
+    assert response.content[0].text == "Done"
+    assert preserialized_request.url == sdk_request.url
+    assert preserialized_request.headers["content-type"] == "application/json"
+    assert preserialized_request.content == sdk_request.content
+
+
+def test_encode_body_splices_raw_json():
+    messages = [{"role": "user", "content": "hi"}]
+    raw = json.dumps(messages, separators=(",", ":")).encode()
+    assert json.loads(encode_body({"model": "m", "messages": RawJSON(raw), "max_tokens": 1})) == {
+        "model": "m", "messages": messages, "max_tokens": 1}
+    assert encode_body({"messages": RawJSON(raw)}) == b'{"messages":' + raw + b"}"
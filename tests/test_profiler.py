@@ -0,0 +1,127 @@
+import logging
+import threading
+import time
+
+import pytest
+
+from core import profiler
+from core.profiler import SamplingProfiler, TurnProfiler
+
+
+@pytest.fixture(autouse=True)
+def armed(monkeypatch, tmp_path):
+    monkeypatch.setattr(profiler, "_armed", {})
+    monkeypatch.setattr(profiler, "PROFILE_DIR", str(tmp_path))
+    return profiler._armed
+
+
+def busy(seconds: float) -> None:
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_take_turn_counts_down(armed):
+    profiler.arm("s1", 2)
+    assert [profiler._take_turn("s1") for _ in range(3)] == [True, True, False]
+    assert armed == {}
+
+
+def test_session_takes_precedence_over_wildcard(armed):
+    profiler.arm("*", 2)
+    profiler.arm("s1", 1)
+    assert profiler._take_turn("s1")
+    assert armed == {"*": 2}
+    # Once its own turns are used up, the session falls back to the wildcard
+    assert profiler._take_turn("s1")
+    assert profiler._take_turn("other")
+    assert not profiler._take_turn("other")
+
+
+def test_profiles_the_armed_turns_then_writes(tmp_path):
+    profiler.arm("s/1", 2)
+    turns = TurnProfiler("s/1")
+    for _ in range(2):
+        turns.begin_turn()
+        busy(0.05)
+        turns.tag("computer click")
+        busy(0.05)
+    assert turns.profiler is not None
+    turns.begin_turn()  # not armed: stops sampling and writes the profile
+    assert turns.profiler is None
+    [path] = tmp_path.iterdir()
+    assert path.name.startswith("s_1-") and path.name.endswith("-turns1-2.collapsed")
+
+    lines = path.read_text().splitlines()
+    tags, busy_samples = set(), 0
+    for line in lines:
+        # Collapsed stacks: frames joined by ";", then a space and the count
+        stack, count = line.rsplit(" ", 1)
+        assert int(count) > 0
+        frames = stack.split(";")
+        tags.add(tuple(frames[:2]))
+        assert frames[0] in ("turn 1", "turn 2")
+        if any(frame.startswith("busy (test_profiler.py:") for frame in frames):
+            busy_samples += int(count)
+    assert busy_samples > 0
+    assert ("turn 1", "model call") in tags and ("turn 2", "computer click") in tags
+    assert turns.finish() is None
+
+
+def test_unarmed_session_takes_no_samples():
+    turns = TurnProfiler("s1")
+    turns.begin_turn()
+    turns.tag("computer click")
+    assert turns.profiler is None and turns.finish() is None
+
+
+def test_sampler_writes_most_common_first(tmp_path):
+    sampler = SamplingProfiler(threading.get_ident())
+    sampler.samples.update({"turn 1;a;b": 2, "turn 1;a": 5})
+    path = tmp_path / "out.collapsed"
+    sampler.write_collapsed(str(path))
+    assert path.read_text() == "turn 1;a 5\nturn 1;a;b 2\n"
+
+
+@pytest.mark.parametrize("value", ["five", "0", "-3", "1.5"])
+def test_bad_profile_turns_only_warns(monkeypatch, caplog, armed, value):
+    monkeypatch.setenv("PROFILE_TURNS", value)
+    with caplog.at_level(logging.WARNING):
+        profiler._arm_from_env()
+    assert armed == {}
+    assert "PROFILE_TURNS" in caplog.text
+
+
+def test_profile_turns_arms_the_session(monkeypatch, armed):
+    monkeypatch.setenv("PROFILE_TURNS", "3")
+    monkeypatch.setenv("PROFILE_SESSION", "s1")
+    profiler._arm_from_env()
+    assert armed == {"s1": 3}
+
+
+@pytest.mark.parametrize("value", ["fast", "0", "nan", "inf"])
+def test_bad_interval_falls_back(monkeypatch, value):
+    monkeypatch.setenv("PROFILE_INTERVAL_MS", value)
+    assert profiler._interval_from_env() == profiler.DEFAULT_INTERVAL_MS / 1000
+
+
+def test_first_turn_tags_the_browser_launch(monkeypatch):
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test")
+    from core.loop import ChatLoop
+
+    class Manager:
+        viewport = {"width": 1024, "height": 768}
+        screencast = None
+
+        def start(self):
+            tags.append("start")
+
+    class Profile:
+        def tag(self, activity):
+            tags.append(activity)
+
+    tags = []
+    chat_loop = ChatLoop(browser_manager=Manager())
+    monkeypatch.setattr(chat_loop, "_call_claude", lambda conversation: "response")
+    assert chat_loop._call_claude_while_starting_browser(None, Profile()) == "response"
+    assert tags == ["browser launch", "start", "model call"]
@@ -0,0 +1,108 @@
+import httpx
+import pytest
+from anthropic import APIConnectionError, APIStatusError, BadRequestError
+
+from core.router import Backend, BackendRouter
+
+REQUEST = httpx.Request("POST", "https://api.example.com/v1/messages")
+
+
+def status_error(status_code: int) -> APIStatusError:
+    return APIStatusError(f"status {status_code}", response=httpx.Response(status_code, request=REQUEST), body=None)
+
+
+class FakeClient:
+    """Stands in for an SDK client; each call pops the next outcome (an exception or a value)."""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def send(self):
+        self.calls += 1
+        outcome = self.outcomes.pop(0) if self.outcomes else "ok"
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+def make_router(*clients, **kwargs) -> BackendRouter:
+    return BackendRouter([Backend(f"b{i}", client, "model") for i, client in enumerate(clients)], **kwargs)
+
+
+def call(router: BackendRouter):
+    return router._call(lambda backend: backend.client.send())
+
+
+def test_needs_a_backend():
+    with pytest.raises(ValueError):
+        BackendRouter([])
+
+
+def test_ranks_by_p50_latency():
+    router = make_router(FakeClient(), FakeClient(), FakeClient())
+    slow, fast, untried = router.backends
+    for latency in (2.0, 2.5, 3.0):
+        router.record(slow, latency, ok=True)
+    for latency in (0.5, 0.6, 0.4):
+        router.record(fast, latency, ok=True)
+    # A backend that was never tried ranks first so it gets probed
+    assert router.ranked() == [untried, fast, slow]
+
+
+def test_error_rate_weighs_latency():
+    router = make_router(FakeClient(), FakeClient())
+    flaky, steady = router.backends
+    for ok in (True, False, True, False):
+        router.record(flaky, 1.0, ok=ok)
+    for _ in range(4):
+        router.record(steady, 1.4, ok=True)
+    assert flaky.error_rate == 0.5
+    assert router.ranked()[0] is steady
+
+
+@pytest.mark.parametrize("error", [
+    status_error(500), status_error(529), status_error(408), status_error(409), status_error(429),
+    APIConnectionError(request=REQUEST),
+])
+def test_fails_over_on_retryable_errors(error):
+    first, second = FakeClient(error), FakeClient("second")
+    router = make_router(first, second)
+    assert call(router) == "second"
+    assert (first.calls, second.calls) == (1, 1)
+    assert list(router.backends[0].outcomes) == [False]
+
+
+def test_raises_client_errors_without_failing_over():
+    error = BadRequestError("bad request", response=httpx.Response(400, request=REQUEST), body=None)
+    first, second = FakeClient(error), FakeClient("second")
+    with pytest.raises(BadRequestError):
+        call(make_router(first, second))
+    assert second.calls == 0
+
+
+def test_raises_last_error_when_every_backend_fails():
+    router = make_router(FakeClient(status_error(503)), FakeClient(status_error(502)))
+    with pytest.raises(APIStatusError) as excinfo:
+        call(router)
+    assert excinfo.value.status_code == 502
+
+
+def test_cooldown_after_error_rate_threshold():
+    router = make_router(FakeClient(), FakeClient(), min_samples=3, max_error_rate=0.5, cooldown=60)
+    broken, other = router.backends
+    router.record(broken, 0.1, ok=False)
+    router.record(broken, 0.1, ok=False)
+    assert broken.is_healthy(0) and broken.cooldown_until == 0.0  # too few samples yet
+    router.record(broken, 0.1, ok=False)
+    assert broken.cooldown_until > 0
+    assert router.ranked() == [other, broken]
+    assert broken.stats()["cooling_down"]
+
+
+def test_cooling_backend_is_still_tried_last():
+    broken, other = FakeClient("recovered"), FakeClient(status_error(500))
+    router = make_router(broken, other, min_samples=1, cooldown=60)
+    router.record(router.backends[0], 0.1, ok=False)
+    assert call(router) == "recovered"
+    assert (other.calls, broken.calls) == (1, 1)
@@ -0,0 +1,74 @@
+import asyncio
+import os
+
+from tools.run import SPILLED_MESSAGE, TRUNCATED_MESSAGE, BoundedCapture, run
+
+
+def feed(capture: BoundedCapture, data: bytes, chunk_size: int = 7) -> None:
+    for start in range(0, len(data), chunk_size):
+        capture.feed(data[start:start + chunk_size])
+
+
+def test_short_output_is_kept_whole():
+    capture = BoundedCapture(limit=100)
+    feed(capture, b"hello world")
+    assert capture.text() == "hello world"
+    assert capture.total == 11
+
+
+def test_keeps_head_and_tail_of_long_output():
+    data = bytes(str(list(range(1000))), "ascii")
+    capture = BoundedCapture(limit=100)
+    feed(capture, data)
+    text = capture.text()
+    assert text.startswith(data[:50].decode())
+    assert f"\n<{len(data) - 100} bytes omitted>\n" in text
+    assert text.endswith(data[-50:].decode() + TRUNCATED_MESSAGE)
+    assert capture.total == len(data)
+
+
+def test_memory_stays_bounded():
+    capture = BoundedCapture(limit=100)
+    for _ in range(10000):
+        capture.feed(b"x" * 64)
+        assert len(capture.head) + len(capture.tail) <= 50 + 2 * 50 + 64
+
+
+def test_no_limit_keeps_everything():
+    capture = BoundedCapture(limit=None)
+    feed(capture, b"a" * 5000)
+    assert capture.text() == "a" * 5000
+
+
+def test_spill_file_holds_full_output_when_clipped():
+    data = b"line\n" * 200
+    capture = BoundedCapture(limit=100, spill=True, name="test")
+    feed(capture, data)
+    text = capture.text()
+    capture.close()
+    path = capture.spill_file.name
+    try:
+        assert text.endswith(SPILLED_MESSAGE.format(path=path))
+        with open(path, "rb") as f:
+            assert f.read() == data
+    finally:
+        os.unlink(path)
+
+
+def test_spill_file_removed_when_nothing_clipped():
+    capture = BoundedCapture(limit=100, spill=True)
+    feed(capture, b"short")
+    capture.close()
+    assert not os.path.exists(capture.spill_file.name)
+
+
+def test_run_captures_both_streams():
+    code, stdout, stderr = asyncio.run(run("echo out; echo err >&2; exit 3"))
+    assert (code, stdout, stderr) == (3, "out\n", "err\n")
+
+
+def test_run_truncates_large_output():
+    code, stdout, _ = asyncio.run(run("yes | head -c 100000", truncate_after=1000))
+    assert code == 0
+    assert "<99000 bytes omitted>" in stdout
+    assert stdout.endswith(TRUNCATED_MESSAGE)
@@ -0,0 +1,60 @@
+import copy
+import pickle
+from dataclasses import FrozenInstanceError
+
+import pytest
+
+from tools.base import CLIResult, ToolFailure, ToolResult
+
+PNG = b"\x89PNG\r\n\x1a\nfake"
+
+
+@pytest.mark.parametrize("duplicate", [
+    copy.copy,
+    copy.deepcopy,
+    lambda result: pickle.loads(pickle.dumps(result)),
+])
+@pytest.mark.parametrize("cls", [ToolResult, CLIResult, ToolFailure])
+def test_copies_and_pickles(cls, duplicate):
+    result = cls(output="done", error="warning", image=PNG, media_type="image/png", system="note")
+    duplicated = duplicate(result)
+    assert duplicated.__class__ is cls
+    assert duplicated == result
+    with pytest.raises(FrozenInstanceError):
+        duplicated.output = "changed"
+
+
+def test_pickles_memoryview_image_as_bytes():
+    result = ToolResult(image=memoryview(PNG), media_type="image/png")
+    restored = pickle.loads(pickle.dumps(result))
+    assert restored.image == PNG
+    assert restored.base64_image == result.base64_image
+
+
+def test_immutable():
+    result = ToolResult(output="done")
+    with pytest.raises(FrozenInstanceError):
+        result.output = "changed"
+    with pytest.raises(FrozenInstanceError):
+        del result.output
+
+
+def test_base64_image_is_decoded_once():
+    result = ToolResult(base64_image="aGVsbG8=")
+    assert result.image == b"hello"
+    assert result.base64_image == "aGVsbG8="
+    assert result.replace(output="x").image == b"hello"
+
+
+def test_base64_image_is_encoded_once(monkeypatch):
+    from tools import base
+
+    calls = []
+    encode = base.base64.b64encode
+    monkeypatch.setattr(base.base64, "b64encode", lambda data: calls.append(data) or encode(data))
+    result = ToolResult(image=PNG, media_type="image/png")
+    assert result.base64_image == result.base64_image == encode(PNG).decode()
+    assert len(calls) == 1
+    # Copies start without the cached string but encode to the same value
+    assert pickle.loads(pickle.dumps(result)).base64_image == result.base64_image
+    assert ToolResult(base64_image="aGVsbG8=").base64_image == "aGVsbG8=" and len(calls) == 2
@@ -0,0 +1,223 @@
+from contextlib import contextmanager
+from io import BytesIO
+from types import SimpleNamespace
+
+import pytest
+from PIL import Image
+
+from core.budget import CancellationToken
+from core.messages import Conversation
+from core.trajectory import TrajectoryCache, normalize_task
+from tools.base import ToolResult
+from utils.utils import perceptual_hash
+
+
+def png(screen: str) -> bytes:
+    """A frame whose white half is on the left or the right; the two hash far apart."""
+    buffer = BytesIO()
+    image = Image.new("RGB", (64, 48), (0, 0, 0))
+    image.paste((255, 255, 255), (0, 0, 32, 48) if screen == "left" else (32, 0, 64, 48))
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class FakePage:
+    url = "https://example.com/login"
+
+    def __init__(self):
+        self.screen = "left"
+        self.screenshots = 0
+
+    def screenshot(self, type="png"):
+        self.screenshots += 1
+        return png(self.screen)
+
+
+class FakeBrowserManager:
+    viewport = {"width": 1024, "height": 768}
+    screencast = None
+    is_started = True
+
+    def __init__(self):
+        self.page = FakePage()
+
+    @contextmanager
+    def get_page(self):
+        yield self.page
+
+    def recycle_if_needed(self):
+        return None
+
+    def release(self):
+        pass
+
+    def save_state(self):
+        pass
+
+
+def tool_use(id: str, text: str):
+    return SimpleNamespace(type="tool_use", id=id, name="computer", input={"action": "key", "text": text})
+
+
+def response(*content):
+    return SimpleNamespace(content=list(content), usage=None)
+
+
+def make_loop(monkeypatch, turns=(), actions=None):
+    """A ChatLoop whose model answers with the given turns and whose key presses move the page."""
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test")
+    from core.loop import ChatLoop
+
+    chat_loop = ChatLoop(browser_manager=FakeBrowserManager())
+    chat_loop.trajectory_cache = TrajectoryCache()
+    script = list(turns)
+    chat_loop.model_calls = 0
+
+    def call_claude(conversation):
+        chat_loop.model_calls += 1
+        return script.pop(0)
+
+    pressed = []
+
+    def run(*, name, tool_input, session_id="default"):
+        pressed.append(tool_input["text"])
+        chat_loop.browser_manager.page.screen = (actions or {}).get(tool_input["text"], "left")
+        return ToolResult(output="ok")
+
+    monkeypatch.setattr(chat_loop, "_call_claude", call_claude)
+    monkeypatch.setattr(chat_loop.tool_collection, "run", run)
+    chat_loop.pressed = pressed
+    return chat_loop
+
+
+def task(text="Log in"):
+    return [{"role": "user", "content": [{"type": "text", "text": text}]}]
+
+
+def live_turns(*keys, final="done"):
+    return [response(tool_use(f"t{index}", key)) for index, key in enumerate(keys)] + \
+        [response(SimpleNamespace(type="text", text=final))]
+
+
+KEY = TrajectoryCache.key("Log in", "https://example.com/login")
+
+
+def test_records_only_when_asked(monkeypatch):
+    chat_loop = make_loop(monkeypatch, live_turns("Tab"))
+    chat_loop.get_response(task())
+    assert chat_loop.trajectory_cache.stats()["trajectories"] == 0
+
+    chat_loop = make_loop(monkeypatch, live_turns("Tab", "Return"), actions={"Return": "right"})
+    chat_loop.get_response(task(), record_trajectory=True)
+    trajectory = chat_loop.trajectory_cache.get(KEY)
+    assert [step["input"]["text"] for step in trajectory["steps"]] == ["Tab", "Return"]
+    assert trajectory["steps"][0]["screen_hash"] == perceptual_hash(png("left"))
+    assert trajectory["final_text"] == "done"
+
+
+def test_full_hit_replays_without_the_model(monkeypatch):
+    recording = make_loop(monkeypatch, live_turns("Tab", "Return"), actions={"Return": "right"})
+    recording.get_response(task(), record_trajectory=True)
+
+    chat_loop = make_loop(monkeypatch)
+    chat_loop.trajectory_cache = recording.trajectory_cache
+    messages = chat_loop.get_response(task())
+    assert chat_loop.model_calls == 0
+    assert chat_loop.pressed == ["Tab", "Return"]
+    assert messages[-1]["content"] == [{"type": "text", "text": "done"}]
+    assert chat_loop.trajectory_cache.stats()["hits"] == 1
+
+
+def test_divergence_drops_the_stale_recording_and_records_again(monkeypatch):
+    cache = TrajectoryCache(tolerance=8)
+    stale_steps = [
+        {"input": {"action": "key", "text": "Tab"}, "screen_hash": perceptual_hash(png("left")), "seconds": 2.0},
+        {"input": {"action": "key", "text": "Old"}, "screen_hash": perceptual_hash(png("left")), "seconds": 2.0},
+    ]
+    cache.put(KEY, {"steps": stale_steps, "final_text": "done", "final_seconds": 1.0})
+
+    # The site changed: after Tab the screen no longer matches the second step
+    chat_loop = make_loop(monkeypatch, live_turns("Return", final="logged in"),
+                          actions={"Tab": "right", "Return": "left"})
+    chat_loop.trajectory_cache = cache
+    chat_loop.get_response(task(), record_trajectory=True)
+    assert chat_loop.pressed == ["Tab", "Return"]
+    assert chat_loop.model_calls == 2
+    assert cache.stats()["partial_hits"] == 1
+    trajectory = cache.get(KEY)
+    assert [step["input"]["text"] for step in trajectory["steps"]] == ["Tab", "Return"]
+    assert trajectory["steps"][1]["screen_hash"] == perceptual_hash(png("right"))
+    assert trajectory["final_text"] == "logged in"
+
+
+def test_divergence_without_recording_leaves_no_entry(monkeypatch):
+    cache = TrajectoryCache(tolerance=8)
+    step = {"input": {"action": "key", "text": "Tab"}, "screen_hash": perceptual_hash(png("right")), "seconds": 1.0}
+    cache.put(KEY, {"steps": [step], "final_text": "done", "final_seconds": 1.0})
+    chat_loop = make_loop(monkeypatch, live_turns())
+    chat_loop.trajectory_cache = cache
+    chat_loop.get_response(task())
+    assert chat_loop.pressed == []
+    assert cache.get(KEY) is None
+
+
+def test_replay_hands_over_when_an_action_raises(monkeypatch):
+    chat_loop = make_loop(monkeypatch)
+    screen = perceptual_hash(png("left"))
+    steps = [{"input": {"action": "key", "text": "Tab"}, "screen_hash": screen, "seconds": 1.0},
+             {"input": {"action": "key", "text": "Return"}, "screen_hash": screen, "seconds": 1.0}]
+    trajectory = {"steps": steps, "final_text": "done", "final_seconds": 1.0}
+    chat_loop.trajectory_cache.put("key", trajectory)
+
+    def run(*, name, tool_input, session_id="default"):
+        if tool_input["text"] == "Return":
+            raise RuntimeError("page crashed")
+        return ToolResult(output="ok")
+
+    monkeypatch.setattr(chat_loop.tool_collection, "run", run)
+    messages = task()
+    steps_left = chat_loop._replay_trajectory("key", trajectory, messages, Conversation.from_params(messages),
+                                              None, CancellationToken())
+    assert steps_left == steps[:1]
+    # The failed step left no tool use without its result behind
+    assert [message["role"] for message in messages] == ["user", "assistant", "user"]
+    assert chat_loop.trajectory_cache.get("key") is None
+
+
+def test_screen_hash_reuses_the_last_captured_frame(monkeypatch):
+    chat_loop = make_loop(monkeypatch)
+    page = chat_loop.browser_manager.page
+    assert chat_loop._screen_hash() == perceptual_hash(png("left"))
+    assert page.screenshots == 1
+    chat_loop.tool_collection.tool_map["computer"].last_frame = png("right")
+    assert chat_loop._screen_hash() == perceptual_hash(png("right"))
+    assert page.screenshots == 1
+
+
+def test_key_normalization():
+    assert normalize_task("  Log in\n now!  ") == "log in now"
+    assert (TrajectoryCache.key("Log in now.", "https://Example.com/login?b=2&a=1#top")
+            == TrajectoryCache.key("log in  NOW", "https://example.com/login?a=1&b=2"))
+    assert TrajectoryCache.key("Log in", "https://example.com/a") != TrajectoryCache.key("Log in", "https://example.com/b")
+
+
+def test_stats_count_hits_and_time_saved():
+    cache = TrajectoryCache()
+    trajectory = {"steps": [{"seconds": 3.0}, {"seconds": 5.0}], "final_text": "done", "final_seconds": 2.0}
+    cache.record_replay(trajectory, steps_replayed=2, replay_seconds=1.0)
+    cache.record_replay(trajectory, steps_replayed=1, replay_seconds=0.5)
+    cache.get("missing")
+    stats = cache.stats()
+    assert (stats["hits"], stats["partial_hits"], stats["misses"]) == (1, 1, 1)
+    assert stats["hit_rate"] == pytest.approx(1 / 3)
+    assert stats["steps_replayed"] == 3
+    # (3 + 5 + 2 - 1) for the full replay plus (3 - 0.5) for the partial one
+    assert stats["time_saved_seconds"] == pytest.approx(11.5)
+
+
+def test_cache_persists_to_a_file(tmp_path):
+    path = str(tmp_path / "trajectories.json")
+    TrajectoryCache(path=path).put("key", {"steps": [], "final_text": "", "final_seconds": 0.0})
+    assert TrajectoryCache(path=path).get("key") is not None
+    (tmp_path / "broken.json").write_text("{")
+    assert TrajectoryCache(path=str(tmp_path / "broken.json")).stats()["trajectories"] == 0
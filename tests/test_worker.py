@@ -0,0 +1,74 @@
+import gc
+import os
+import subprocess
+import sys
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+
+from core.worker import RemoteBrowserManager
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class FakePage:
+    url = "about:blank"
+
+    def screenshot(self, size=16, **kwargs):
+        return bytes(range(256)) * (size // 256) + bytes(size % 256)
+
+
+class FakeManager:
+    """Stands in for BrowserManager in the worker process, which cannot launch Chromium here."""
+
+    is_started = True
+
+    def __init__(self, headless, lazy_start, profile):
+        self.page = FakePage()
+
+    @contextmanager
+    def get_page(self):
+        yield self.page
+
+    def cleanup(self):
+        pass
+
+
+def buffer_exists(name: str) -> bool:
+    try:
+        shared_memory.SharedMemory(name=name).close()
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def test_screenshot_through_the_shared_buffer_and_shutdown():
+    manager = RemoteBrowserManager(frame_buffer_size=1024, manager_class=FakeManager)
+    process, buffer_name = manager._process, manager._frames.name
+    try:
+        with manager.get_page() as page:
+            assert page.url == "about:blank"
+            assert page.screenshot(size=600) == FakePage().screenshot(size=600)
+            # Too big for the buffer: sent through the pipe instead
+            assert page.screenshot(size=5000) == FakePage().screenshot(size=5000)
+    finally:
+        manager.shutdown()
+    assert not process.is_alive()
+    assert not buffer_exists(buffer_name)
+    manager.shutdown()  # a second call does nothing
+
+
+def test_worker_stops_when_the_manager_is_collected():
+    manager = RemoteBrowserManager(frame_buffer_size=1024, manager_class=FakeManager)
+    process, buffer_name = manager._process, manager._frames.name
+    assert manager.is_started
+    del manager
+    gc.collect()
+    assert not process.is_alive()
+    assert not buffer_exists(buffer_name)
+
+
+def test_flask_app_starts_no_worker_at_import():
+    # A fresh interpreter, as the spawned worker re-imports the module on its own
+    env = {**os.environ, "ANTHROPIC_API_KEY": "test", "BROWSER_WORKER": "1"}
+    code = "import mainflask, sys; sys.exit(mainflask._chat_loop is not None)"
+    assert subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, timeout=120).returncode == 0
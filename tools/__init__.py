@@ -1,6 +1,10 @@
 from .computer import ComputerTool
+from .bash import BashTool
+from .browsertools import BrowserTool
 from .collection import ToolCollection
 
 __ALL__ = [
-    ComputerTool
+    ComputerTool,
+    BashTool,
+    BrowserTool
 ]
\ No newline at end of file
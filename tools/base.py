@@ -1,5 +1,6 @@
 from abc import ABCMeta, abstractmethod
-from dataclasses import dataclass, fields, replace
+import base64
+from dataclasses import FrozenInstanceError
 from typing import Any
 
 from anthropic.types.beta import BetaToolUnionParam
@@ -8,6 +9,9 @@ from anthropic.types.beta import BetaToolUnionParam
 class BaseAnthropicTool(metaclass=ABCMeta):
     """Abstract base class for Anthropic-defined tools."""
 
+    # Tools that keep state per session receive the caller's session_id as a keyword
+    per_session: bool = False
+
     @abstractmethod
     def __call__(self, **kwargs) -> Any:
         """Executes the tool with the given arguments."""
@@ -20,17 +24,83 @@ class BaseAnthropicTool(metaclass=ABCMeta):
         raise NotImplementedError
 
 
-@dataclass(kw_only=True, frozen=True)
 class ToolResult:
-    """Represents the result of a tool execution."""
+    """
+    Represents the result of a tool execution.
+
+    Images are held as raw bytes (or a memoryview) with their media type and are only
+    base64 encoded when first read through `base64_image`; the encoded string is kept,
+    so later reads cost nothing. Instances are immutable.
+    """
 
-    output: str | None = None
-    error: str | None = None
-    base64_image: str | None = None
-    system: str | None = None
+    _fields = ("output", "error", "image", "media_type", "system")
+    __slots__ = _fields + ("_base64",)
+
+    def __init__(
+        self,
+        *,
+        output: str | None = None,
+        error: str | None = None,
+        image: bytes | memoryview | None = None,
+        media_type: str | None = None,
+        system: str | None = None,
+        base64_image: str | None = None,
+    ):
+        # base64_image is accepted for backward compatibility and stored decoded
+        if base64_image is not None and image is None:
+            image = base64.b64decode(base64_image)
+        else:
+            base64_image = None
+        set_field = object.__setattr__
+        set_field(self, "_base64", base64_image)
+        set_field(self, "output", output)
+        set_field(self, "error", error)
+        set_field(self, "image", image)
+        set_field(self, "media_type", media_type)
+        set_field(self, "system", system)
+
+    @property
+    def base64_image(self) -> str | None:
+        if self.image is None:
+            return None
+        if self._base64 is None:
+            object.__setattr__(self, "_base64", base64.b64encode(self.image).decode("utf-8"))
+        return self._base64
+
+    def __setattr__(self, name, value):
+        raise FrozenInstanceError(f"cannot assign to field '{name}'")
+
+    def __delattr__(self, name):
+        raise FrozenInstanceError(f"cannot delete field '{name}'")
+
+    def __getstate__(self):
+        # A memoryview cannot be pickled, so copies and pickles hold the image as bytes
+        state = {name: getattr(self, name) for name in ToolResult._fields}
+        if isinstance(state["image"], memoryview):
+            state["image"] = bytes(state["image"])
+        return state
+
+    def __setstate__(self, state):
+        for name in ToolResult._fields:
+            object.__setattr__(self, name, state.get(name))
+        object.__setattr__(self, "_base64", None)
 
     def __bool__(self):
-        return any(getattr(self, field.name) for field in fields(self))
+        return any(getattr(self, name) for name in ToolResult._fields)
+
+    def __eq__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in ToolResult._fields)
+
+    def __hash__(self):
+        return hash(tuple(bytes(self.image) if name == "image" and self.image is not None else getattr(self, name)
+                          for name in ToolResult._fields))
+
+    def __repr__(self):
+        image = f"<{len(self.image)} bytes>" if self.image is not None else None
+        return (f"{self.__class__.__name__}(output={self.output!r}, error={self.error!r}, "
+                f"image={image}, media_type={self.media_type!r}, system={self.system!r})")
 
     def __add__(self, other: "ToolResult"):
         def combine_fields(
@@ -45,22 +115,30 @@ class ToolResult:
         return ToolResult(
             output=combine_fields(self.output, other.output),
             error=combine_fields(self.error, other.error),
-            base64_image=combine_fields(self.base64_image, other.base64_image, False),
+            image=combine_fields(self.image, other.image, False),
+            media_type=self.media_type if self.image else other.media_type,
             system=combine_fields(self.system, other.system),
         )
 
     def replace(self, **kwargs):
         """Returns a new ToolResult with the given fields replaced."""
-        return replace(self, **kwargs)
+        if "base64_image" in kwargs:
+            kwargs["image"] = None
+        values = {name: getattr(self, name) for name in ToolResult._fields}
+        return self.__class__(**{**values, **kwargs})
 
 
 class CLIResult(ToolResult):
     """A ToolResult that can be rendered as a CLI output."""
 
+    __slots__ = ()
+
 
 class ToolFailure(ToolResult):
     """A ToolResult that represents a failure."""
 
+    __slots__ = ()
+
 
 class ToolError(Exception):
     """Raised when a tool encounters an error."""
@@ -0,0 +1,181 @@
+import asyncio
+import os
+import signal
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Literal, Optional
+
+from anthropic.types.beta import BetaToolBash20241022Param
+
+from .base import BaseAnthropicTool, CLIResult, ToolError
+from .run import MAX_RESPONSE_LEN, BoundedCapture
+
+# Shells kept at once; past this the least recently used idle one is stopped
+MAX_SESSIONS = int(os.getenv("BASH_MAX_SESSIONS", 16))
+
+
+class _BashSession:
+    """A long-lived bash process that runs commands through sentinel-delimited stdin."""
+
+    command: str = "/bin/bash"
+    _read_size: int = 64 * 1024
+
+    def __init__(self, timeout: float = 120.0):
+        self._timeout = timeout
+        self._process: Optional[asyncio.subprocess.Process] = None
+        # Unique per session so command output can't end a read early by accident
+        self._sentinel = f"<<exit-{uuid.uuid4().hex}>>"
+
+    @property
+    def started(self) -> bool:
+        return self._process is not None and self._process.returncode is None
+
+    async def start(self) -> None:
+        if self.started:
+            return
+        self._process = await asyncio.create_subprocess_exec(
+            self.command,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=True,  # own process group, so a hung command can be killed with it
+        )
+
+    def stop(self) -> None:
+        """Kill the shell and anything it started."""
+        if not self.started:
+            return
+        try:
+            os.killpg(self._process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        self._process = None
+
+    async def _read_until_sentinel(self, stream: asyncio.StreamReader) -> str:
+        """Read a stream incrementally until the sentinel, keeping memory bounded."""
+        marker = self._sentinel.encode()
+        capture = BoundedCapture(MAX_RESPONSE_LEN)
+        # Hold back the last few bytes, which may be the start of a sentinel
+        pending = b""
+        while True:
+            chunk = await stream.read(self._read_size)
+            if not chunk:
+                raise ToolError("bash has exited")
+            data = pending + chunk
+            index = data.find(marker)
+            if index != -1:
+                capture.feed(data[:index])
+                return capture.text()
+            keep = len(marker) - 1
+            capture.feed(data[:-keep])
+            pending = data[-keep:]
+
+    async def run(self, command: str) -> CLIResult:
+        if not self.started:
+            raise ToolError("bash has not started")
+
+        # Print the sentinel on both streams once the command is done
+        self._process.stdin.write(
+            f"{command}\necho '{self._sentinel}'; echo '{self._sentinel}' >&2\n".encode()
+        )
+        await self._process.stdin.drain()
+
+        try:
+            output, error = await asyncio.wait_for(
+                asyncio.gather(
+                    self._read_until_sentinel(self._process.stdout),
+                    self._read_until_sentinel(self._process.stderr),
+                ),
+                timeout=self._timeout,
+            )
+        except asyncio.TimeoutError:
+            # Leftover output of the hung command would corrupt the next read, so start over
+            self.stop()
+            await self.start()
+            raise ToolError(
+                f"timed out: bash did not return in {self._timeout} seconds and has been restarted"
+            )
+
+        return CLIResult(output=output.rstrip("\n"), error=error.rstrip("\n"))
+
+
+class BashTool(BaseAnthropicTool):
+    """
+    A tool that runs shell commands in a persistent bash session per session id, so
+    state such as the working directory and environment carries over between calls of
+    one session but never leaks into another.
+    """
+
+    name: Literal["bash"] = "bash"
+    api_type: Literal["bash_20241022"] = "bash_20241022"
+    per_session = True
+
+    def __init__(self, timeout: float = 120.0, max_sessions: int = MAX_SESSIONS):
+        super().__init__()
+        self._timeout = timeout
+        self._max_sessions = max_sessions
+        # Least recently used first, so the shell of an abandoned session is the one stopped
+        self._sessions: OrderedDict[str, _BashSession] = OrderedDict()
+        self._session_locks: dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        # ToolCollection.run is synchronous and called from many threads, so every shell
+        # lives on one event loop running in a thread of its own
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _run(self, coroutine):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="bash-sessions", daemon=True).start()
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def _session_lock(self, session_id: str) -> threading.Lock:
+        with self._lock:
+            return self._session_locks.setdefault(session_id, threading.Lock())
+
+    def _start_session(self, session_id: str) -> _BashSession:
+        session = _BashSession(timeout=self._timeout)
+        self._run(session.start())
+        with self._lock:
+            self._sessions[session_id] = session
+            excess = max(len(self._sessions) - self._max_sessions, 0)
+            idle = [key for key in self._sessions
+                    if key != session_id and not self._session_locks[key].locked()]
+            evicted = [self._sessions.pop(key) for key in idle[:excess]]
+        for old_session in evicted:
+            old_session.stop()
+        return session
+
+    def __call__(self, command: str | None = None, restart: bool = False,
+                 session_id: str = "default", **kwargs) -> CLIResult:
+        # One command at a time per shell; other sessions run alongside
+        with self._session_lock(session_id):
+            with self._lock:
+                session = self._sessions.get(session_id)
+                if session is not None:
+                    self._sessions.move_to_end(session_id)
+            if restart:
+                if session is not None:
+                    session.stop()
+                self._start_session(session_id)
+                return CLIResult(system="tool has been restarted.")
+
+            if session is None or not session.started:
+                session = self._start_session(session_id)
+
+            if command is None:
+                raise ToolError("no command provided.")
+
+            return self._run(session.run(command))
+
+    def stop(self, session_id: Optional[str] = None) -> None:
+        """Kill the shell of one session, or of every session."""
+        with self._lock:
+            keys = list(self._sessions) if session_id is None else [session_id]
+            sessions = [self._sessions.pop(key) for key in keys if key in self._sessions]
+        for session in sessions:
+            session.stop()
+
+    def to_params(self) -> BetaToolBash20241022Param:
+        return {"name": self.name, "type": self.api_type}
@@ -1,24 +1,99 @@
-from .base import BaseAnthropicTool
-from typing import Dict, Any
-from playwright.sync_api import Page
-from anthropic.types.beta import BetaToolUnionParam
+from .base import BaseAnthropicTool, ToolResult, ToolError
+from typing import Dict, Any, List, Literal, Optional
+from anthropic.types.beta import BetaToolParam
+from utils.cache import ExtractionCache
+from utils.utils import extract_page, page_fingerprint
 
-class BrowserTool():
-    name = "BrowserTool"
-    description = "Manages the playwright browser. This tool is used to navigate the web and extract information from the page."
+MAX_FAN_OUT = 8  # pages opened at once by a single fan_out call
+
+
+class BrowserTool(BaseAnthropicTool):
+    name: Literal["browser"] = "browser"
+    description = (
+        "Reads web pages as text without taking screenshots. "
+        "Use 'extract' to read the page currently open in the browser. "
+        "Use 'fan_out' to read several URLs at once in parallel tabs when a task needs "
+        "information from multiple sites, e.g. comparing prices; give each target the "
+        "sub-goal it serves. The results of all targets come back together."
+    )
     input_schema = {
         "type": "object",
         "properties": {
-            "ticker": {
-                "type": "string", 
-                "description": "The stock ticker symbol, e.g. AAPL for Apple Inc."
+            "action": {
+                "type": "string",
+                "enum": ["extract", "fan_out"],
+                "description": "extract: read the current page. fan_out: read the given targets in parallel."
+            },
+            "targets": {
+                "type": "array",
+                "description": f"Pages to read with fan_out, at most {MAX_FAN_OUT}.",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "url": {"type": "string", "description": "Absolute URL to load."},
+                        "goal": {"type": "string", "description": "What to look for on this page."}
+                    },
+                    "required": ["url"]
+                }
+            },
+            "mode": {
+                "type": "string",
+                "enum": ["text", "outline"],
+                "description": "text: the visible text of the page. outline: headings and links only."
             }
         },
-        "required": ["ticker"]
+        "required": ["action"]
     }
-  
-    def __call__(self, page: Page, command: str) -> Dict[str, Any]:
-        pass
 
-    def to_params(self) -> BetaToolUnionParam:
-        return {"name": self.name, "description": self.description, "input_schema": self.input_schema}
\ No newline at end of file
+    def __init__(self, browser_manager: "BrowserManager", cache: Optional[ExtractionCache] = None):
+        super().__init__()
+        self.browser_manager = browser_manager
+        self.cache = cache if cache is not None else ExtractionCache.from_env()
+
+    def __call__(self, action: str, targets: Optional[List[Dict[str, str]]] = None,
+                 mode: str = "text", **kwargs) -> ToolResult:
+        if mode not in ("text", "outline"):
+            raise ToolError(f"Invalid mode: {mode}")
+        if action == "extract":
+            with self.browser_manager.get_page() as page:
+                # The page is already loaded, so a hit must match its current DOM version
+                url = page.url
+                fingerprint = page_fingerprint(page)
+                result = self.cache.get(url, mode, fingerprint=fingerprint)
+                if result is None:
+                    result = extract_page(page, mode, fingerprint=fingerprint)
+                    self.cache.put(url, mode, result)
+            return ToolResult(output=self._format(result))
+        if action == "fan_out":
+            if not targets:
+                raise ToolError("targets is required for fan_out")
+            if len(targets) > MAX_FAN_OUT:
+                raise ToolError(f"fan_out takes at most {MAX_FAN_OUT} targets, got {len(targets)}")
+            # Cached pages are answered without navigating; only the rest are loaded
+            results = [self.cache.get(target["url"], mode) for target in targets]
+            misses = [i for i, result in enumerate(results) if result is None]
+            if misses:
+                urls = [targets[i]["url"] for i in misses]
+                for i, result in zip(misses, self.browser_manager.fan_out(urls, mode=mode)):
+                    self.cache.put(targets[i]["url"], mode, result)
+                    results[i] = result
+            sections = [
+                self._format(result, index=index, goal=target.get("goal"))
+                for index, (target, result) in enumerate(zip(targets, results), start=1)
+            ]
+            return ToolResult(output="\n\n".join(sections))
+        raise ToolError(f"Invalid action: {action}")
+
+    @staticmethod
+    def _format(result: Dict[str, Any], index: Optional[int] = None, goal: Optional[str] = None) -> str:
+        prefix = f"[{index}] " if index is not None else ""
+        if "error" in result:
+            return f"## {prefix}{result['url']}\nFailed to load: {result['error']}"
+        lines = [f"## {prefix}{result['title']} ({result['url']})"]
+        if goal:
+            lines.append(f"Goal: {goal}")
+        lines.append(result["content"])
+        return "\n".join(lines)
+
+    def to_params(self) -> BetaToolParam:
+        return {"name": self.name, "description": self.description, "input_schema": self.input_schema}
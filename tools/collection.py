@@ -23,10 +23,13 @@ class ToolCollection:
     ) -> list[BetaToolUnionParam]:
         return [tool.to_params() for tool in self.tools]
     
-    def run(self, *, name: str, tool_input: dict[str, Any]) -> ToolResult:
+    def run(self, *, name: str, tool_input: dict[str, Any], session_id: str = "default") -> ToolResult:
         tool = self.tool_map.get(name)
         if not tool:
             return ToolFailure(error=f"Tool {name} is invalid")
+        if tool.per_session:
+            # Set last, so the model's input can never pick another session
+            tool_input = {**tool_input, "session_id": session_id}
         try:
             return tool(**tool_input)
         except ToolError as e:
@@ -47,12 +50,13 @@ class ToolCollection:
                 "text": tool_result.output
             })
         
-        if tool_result.base64_image:
+        if tool_result.image:
+            # The only place the image gets base64 encoded
             tool_result_content.append({
                 "type": "image",
                 "source": {
                     "type": "base64",
-                    "media_type": "image/png",
+                    "media_type": tool_result.media_type or "image/png",
                     "data": tool_result.base64_image
                 }
             })
@@ -3,9 +3,12 @@ from typing_extensions import TypedDict
 from enum import StrEnum
 from anthropic.types.beta import BetaToolComputerUse20241022Param
 from .base import BaseAnthropicTool, ToolResult, ToolError
-from utils.utils import screenshot_helper
+from utils.utils import FrameDiffer, screenshot_bytes
 import os
+import time
 TYPING_DELAY_MS = 12
+# How long an action waits for the repaint it caused before using the latest screencast frame
+FRAME_WAIT_SECONDS = 0.15
 
 class Action(StrEnum):
     KEY = "key"
@@ -47,10 +50,9 @@ class ComputerTool(BaseAnthropicTool):
         super().__init__()
         self.browser_manager = browser_manager
         
-        # Get viewport dimensions
-        with self.browser_manager.get_page() as page:
-            viewport = page.viewport_size
-            self.width, self.height = viewport["width"], viewport["height"]
+        # Get viewport dimensions from the configured context so the browser need not be running yet
+        viewport = self.browser_manager.viewport
+        self.width, self.height = viewport["width"], viewport["height"]
         
         assert self.width and self.height, "Browser viewport dimensions must be set"
         
@@ -58,6 +60,11 @@ class ComputerTool(BaseAnthropicTool):
         self.display_num = int(os.getenv("DISPLAY_NUM", -1))
         self._screenshot_delay = 2.0
         self._scaling_enabled = True
+        # Opt-in: after actions, send only the region that changed since the last full frame
+        self.frame_differ = FrameDiffer() if os.getenv("DELTA_FRAMES", "0") == "1" else None
+        self._action_started = 0.0
+        # The full frame the last action captured, before any delta cropping; None if it took none
+        self.last_frame: Optional[bytes] = None
     
     @property
     def options(self) -> ComputerToolOptions:
@@ -109,6 +116,15 @@ class ComputerTool(BaseAnthropicTool):
     def __call__(self, *, action: Action, text: Optional[str] = None, 
                 coordinate: Optional[Tuple[int, int]] = None, **kwargs) -> ToolResult:
         """Execute computer action."""
+        self._action_started = time.time()
+        self.last_frame = None
+        result = self._run_action(action, text, coordinate)
+        # Keep the recovery checkpoint current after every action that can change the page
+        if action not in (Action.SCREENSHOT, Action.CURSOR_POSITION) and not result.error:
+            self.browser_manager.take_checkpoint()
+        return result
+
+    def _run_action(self, action: Action, text: Optional[str], coordinate: Optional[Tuple[int, int]]) -> ToolResult:
         # Validate action and parameters
         if action in (Action.MOUSE_MOVE, Action.LEFT_CLICK_DRAG):
             if coordinate is None:
@@ -151,14 +167,50 @@ class ComputerTool(BaseAnthropicTool):
         """Take a screenshot of the current page."""
         try:
             with self.browser_manager.get_page() as page:
-                screenshot_base64 = screenshot_helper(page)
-                return ToolResult(
-                    output="Screenshot taken",
-                    base64_image=screenshot_base64
-                )
+                # An explicit screenshot is always a full frame
+                if self.frame_differ:
+                    self.frame_differ.reset()
+                return self._screenshot_result(page, "Screenshot taken", wait_for_repaint=False)
         except Exception as e:
             return ToolResult(error=f"Failed to take screenshot: {str(e)}")
 
+    def _capture(self, page, wait_for_repaint: bool = True) -> tuple[bytes, str]:
+        """Grab the newest screencast frame, or a PNG screenshot when there is no screencast."""
+        screencast = self.browser_manager.screencast
+        if screencast:
+            frame = None
+            if wait_for_repaint:
+                frame = screencast.wait_for_frame(after=self._action_started, timeout=FRAME_WAIT_SECONDS)
+            # No newer frame means the page has not repainted, so the latest frame still shows it
+            frame = frame or screencast.latest()
+            if frame:
+                return frame.data, frame.media_type
+        return screenshot_bytes(page), "image/png"
+
+    def _screenshot_result(self, page, output: str, wait_for_repaint: bool = True) -> ToolResult:
+        """Screenshot the page, cropped to the changed region when delta frames are on."""
+        image_bytes, media_type = self._capture(page, wait_for_repaint)
+        self.last_frame = image_bytes
+        if self.frame_differ is None:
+            return ToolResult(output=output, image=image_bytes, media_type=media_type)
+
+        patch_bytes, box = self.frame_differ.diff(image_bytes)
+        if box is None:
+            return ToolResult(output=output, image=patch_bytes, media_type=media_type)
+        if not patch_bytes:
+            return ToolResult(output=f"{output}\nThe screen has not changed since the last screenshot.")
+
+        x, y, width, height = box
+        left, top = self.scale_coordinates(ScalingSource.COMPUTER, x, y)
+        right, bottom = self.scale_coordinates(ScalingSource.COMPUTER, x + width, y + height)
+        return ToolResult(
+            output=(f"{output}\nOnly the changed region is shown, at full resolution. It covers "
+                    f"x={left}..{right}, y={top}..{bottom} in screen coordinates; the rest of the "
+                    f"screen is the same as in the last full screenshot."),
+            image=patch_bytes,
+            media_type="image/png"
+        )
+
     def page_move_to_coordinates(self, x: int, y: int, take_screenshot: bool = True) -> ToolResult:
         """Move mouse to specified coordinates."""
         try:
@@ -167,8 +219,7 @@ class ComputerTool(BaseAnthropicTool):
                 result = f"Moved mouse to coordinates x={x}, y={y}"
                 
                 if take_screenshot:
-                    screenshot_base64 = screenshot_helper(page)
-                    return ToolResult(output=result, base64_image=screenshot_base64)
+                    return self._screenshot_result(page, result)
                 return ToolResult(output=result)
         except Exception as e:
             return ToolResult(error=f"Failed to move mouse: {str(e)}")
@@ -196,8 +247,7 @@ class ComputerTool(BaseAnthropicTool):
                 result = f"Dragged from {start_pos} to ({x}, {y})"
                 
                 if take_screenshot:
-                    screenshot_base64 = screenshot_helper(page)
-                    return ToolResult(output=result, base64_image=screenshot_base64)
+                    return self._screenshot_result(page, result)
                 return ToolResult(output=result)
         except Exception as e:
             return ToolResult(error=f"Failed to drag: {str(e)}")
@@ -208,8 +258,7 @@ class ComputerTool(BaseAnthropicTool):
                 page.keyboard.press(key)
                 
                 if take_screenshot:
-                    screenshot_base64 = screenshot_helper(page)
-                    return ToolResult(output=f"Pressed key: {key}", base64_image=screenshot_base64)
+                    return self._screenshot_result(page, f"Pressed key: {key}")
                 return ToolResult(output=f"Pressed key: {key}")
         except Exception as e:
             return ToolResult(error=f"Failed to press key: {str(e)}")
@@ -221,8 +270,7 @@ class ComputerTool(BaseAnthropicTool):
                 page.keyboard.type(text, delay=TYPING_DELAY_MS)
                 
                 if take_screenshot:
-                    screenshot_base64 = screenshot_helper(page)
-                    return ToolResult(output=f"Typed text: {text}", base64_image=screenshot_base64)
+                    return self._screenshot_result(page, f"Typed text: {text}")
                 return ToolResult(output=f"Typed text: {text}")
         except Exception as e:
             return ToolResult(error=f"Failed to type text: {str(e)}")
@@ -253,8 +301,7 @@ class ComputerTool(BaseAnthropicTool):
                     page.mouse.dblclick(pos[0], pos[1])
                 
                 if take_screenshot:
-                    screenshot_base64 = screenshot_helper(page)
-                    return ToolResult(output=f"Performed {action} at coordinates ({pos[0]}, {pos[1]})", base64_image=screenshot_base64)
+                    return self._screenshot_result(page, f"Performed {action} at coordinates ({pos[0]}, {pos[1]})")
                 return ToolResult(output=f"Performed {action} at coordinates ({pos[0]}, {pos[1]})")
         except Exception as e:
             return ToolResult(error=f"Failed to perform {action}: {str(e)}")
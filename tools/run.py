@@ -1,9 +1,13 @@
 """Utility to run shell commands asynchronously with a timeout."""
 
 import asyncio
+import os
+import tempfile
 
 TRUNCATED_MESSAGE: str = "<response clipped><NOTE>To save on context only part of this file has been shown to you. You should retry this tool after you have searched inside the file with `grep -n` in order to find the line numbers of what you are looking for.</NOTE>"
+SPILLED_MESSAGE: str = "<response clipped><NOTE>The full output was saved to {path}. Search inside it with `grep -n` to find what you are looking for.</NOTE>"
 MAX_RESPONSE_LEN: int = 16000
+READ_SIZE: int = 64 * 1024
 
 
 def maybe_truncate(content: str, truncate_after: int | None = MAX_RESPONSE_LEN):
@@ -15,22 +19,113 @@ def maybe_truncate(content: str, truncate_after: int | None = MAX_RESPONSE_LEN):
     )
 
 
+class BoundedCapture:
+    """
+    Collects a stream while keeping at most `limit` bytes in memory.
+
+    The first half of the limit is kept as the head and the last half as a rolling
+    tail; everything in between is counted and dropped. With spill=True the full
+    output also goes to a temporary file the model can grep later.
+    """
+
+    def __init__(self, limit: int | None = MAX_RESPONSE_LEN, spill: bool = False, name: str = "output"):
+        self.limit = limit
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.dropped = 0
+        self.total = 0
+        self.spill_file = (
+            tempfile.NamedTemporaryFile(prefix=f"run-{name}-", suffix=".log", delete=False)
+            if spill else None
+        )
+
+    def feed(self, chunk: bytes) -> None:
+        self.total += len(chunk)
+        if self.spill_file:
+            self.spill_file.write(chunk)
+        if not self.limit:
+            self.head += chunk
+            return
+
+        head_limit = self.limit // 2
+        if len(self.head) < head_limit:
+            taken = head_limit - len(self.head)
+            self.head += chunk[:taken]
+            chunk = chunk[taken:]
+        if not chunk:
+            return
+
+        tail_limit = self.limit - head_limit
+        self.tail += chunk
+        # Trim in batches so the tail isn't copied on every chunk
+        if len(self.tail) > 2 * tail_limit:
+            excess = len(self.tail) - tail_limit
+            del self.tail[:excess]
+            self.dropped += excess
+
+    def close(self) -> None:
+        if self.spill_file:
+            self.spill_file.close()
+            # Nothing was clipped, so the model has no reason to look at the file
+            if not self.limit or self.total <= self.limit:
+                os.unlink(self.spill_file.name)
+
+    def text(self) -> str:
+        """The captured output, with a notice in place of anything dropped."""
+        tail_limit = self.limit - self.limit // 2 if self.limit else 0
+        tail, dropped = self.tail, self.dropped
+        if self.limit and len(tail) > tail_limit:
+            dropped += len(tail) - tail_limit
+            tail = tail[-tail_limit:]
+
+        head = self.head.decode(errors="replace")
+        if not dropped:
+            return head + tail.decode(errors="replace")
+        notice = (
+            SPILLED_MESSAGE.format(path=self.spill_file.name)
+            if self.spill_file else TRUNCATED_MESSAGE
+        )
+        return (
+            f"{head}\n<{dropped} bytes omitted>\n{tail.decode(errors='replace')}{notice}"
+        )
+
+
+async def _pump(stream: asyncio.StreamReader, capture: BoundedCapture) -> None:
+    while chunk := await stream.read(READ_SIZE):
+        capture.feed(chunk)
+
+
 async def run(
     cmd: str,
     timeout: float | None = 120.0,  # seconds
     truncate_after: int | None = MAX_RESPONSE_LEN,
+    spill: bool = False,
 ):
-    """Run a shell command asynchronously with a timeout."""
+    """
+    Run a shell command asynchronously with a timeout.
+
+    Output is streamed into bounded captures, so memory stays bounded however much the
+    command prints. With spill=True the full output is also written to temp files.
+    """
     process = await asyncio.create_subprocess_shell(
         cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
     )
+    stdout = BoundedCapture(truncate_after, spill=spill, name="stdout")
+    stderr = BoundedCapture(truncate_after, spill=spill, name="stderr")
 
     try:
-        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=timeout)
+        await asyncio.wait_for(
+            asyncio.gather(
+                _pump(process.stdout, stdout),
+                _pump(process.stderr, stderr),
+                process.wait(),
+            ),
+            timeout=timeout,
+        )
         return (
             process.returncode or 0,
-            maybe_truncate(stdout.decode(), truncate_after=truncate_after),
-            maybe_truncate(stderr.decode(), truncate_after=truncate_after),
+            stdout.text(),
+            stderr.text(),
         )
     except asyncio.TimeoutError as exc:
         try:
@@ -39,4 +134,7 @@ async def run(
             pass
         raise TimeoutError(
             f"Command '{cmd}' timed out after {timeout} seconds"
-        ) from exc
\ No newline at end of file
+        ) from exc
+    finally:
+        stdout.close()
+        stderr.close()
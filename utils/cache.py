@@ -0,0 +1,142 @@
+import os
+import json
+import time
+import atexit
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# Query parameters that only track where a visit came from, never change the page
+TRACKING_PARAMS = ("utm_", "fbclid", "gclid", "mc_cid", "mc_eid")
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def normalize_url(url: str) -> str:
+    """Canonical form of a URL for cache keys: lowercase host, no fragment, sorted query."""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith(TRACKING_PARAMS)
+    )
+    return urlunsplit((scheme, host, parts.path or "/", urlencode(query), ""))
+
+
+class ExtractionCache:
+    """
+    LRU cache of page extraction results with a per-entry TTL and a memory cap.
+
+    Entries are keyed by normalized URL and extraction mode and remember the DOM
+    fingerprint of the page they came from. Callers that have the page loaded pass
+    its fingerprint, so a changed page misses; callers that want to skip navigation
+    look up by URL alone and rely on the TTL. With a path, entries are loaded at
+    startup and written back at exit.
+    """
+
+    def __init__(self, ttl: float = 600.0, max_bytes: int = 32 * 1024 * 1024, path: Optional[str] = None):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.path = path
+        self._entries: OrderedDict[tuple, dict] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        if path:
+            self.load()
+            atexit.register(self.save)
+
+    @classmethod
+    def from_env(cls) -> "ExtractionCache":
+        return cls(
+            ttl=float(os.getenv("EXTRACT_CACHE_TTL", 600)),
+            max_bytes=int(os.getenv("EXTRACT_CACHE_MAX_BYTES", 32 * 1024 * 1024)),
+            path=os.getenv("EXTRACT_CACHE_PATH") or None,
+        )
+
+    @staticmethod
+    def _size(result: dict) -> int:
+        return len(result.get("content", "").encode("utf-8"))
+
+    def _drop(self, key: tuple) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= self._size(entry["result"])
+
+    def get(self, url: str, mode: str, fingerprint: Optional[str] = None) -> Optional[dict]:
+        """Cached result for the URL, or None if missing, expired or from another DOM version."""
+        key = (normalize_url(url), mode)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry["stored"] > self.ttl:
+                self._drop(key)
+                entry = None
+            if entry is None or (fingerprint is not None and entry["result"].get("fingerprint") != fingerprint):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.bytes_saved += self._size(entry["result"])
+            return entry["result"]
+
+    def put(self, url: str, mode: str, result: dict) -> None:
+        if "error" in result:
+            return
+        size = self._size(result)
+        if size > self.max_bytes:
+            return
+        key = (normalize_url(url), mode)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = {"stored": time.time(), "result": result}
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "bytes_saved": self.bytes_saved,
+            }
+
+    def load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Failed to load extraction cache: {str(e)}")
+            return
+        now = time.time()
+        # Stored oldest first, so LRU order survives the round trip
+        for url, mode, stored, result in entries:
+            if now - stored <= self.ttl:
+                self.put(url, mode, result)
+                entry = self._entries.get((normalize_url(url), mode))
+                if entry is not None:
+                    entry["stored"] = stored
+
+    def save(self) -> None:
+        with self._lock:
+            entries = [[url, mode, entry["stored"], entry["result"]]
+                       for (url, mode), entry in self._entries.items()]
+        try:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logging.warning(f"Failed to save extraction cache: {str(e)}")
@@ -1,27 +1,297 @@
-import pyautogui
-import os
-from datetime import datetime
+from io import BytesIO
+from urllib.parse import urlparse
 from playwright.sync_api import Page
+from PIL import Image
+import numpy as np
 import base64
-    
-def screenshot_helper(page: Page) -> str:
+import time
+from typing import Optional
+
+
+def screenshot_bytes(page: Page) -> bytes:
     """
-    Take a screenshot and return it as a base64 string.
+    Take a screenshot and return the raw PNG bytes.
     
     Args:
         page: Playwright Page object
     
     Returns:
-        str: Base64 encoded screenshot
+        bytes: PNG encoded screenshot
     """
     try:
         # Take screenshot as bytes with png format
-        screenshot_bytes = page.screenshot(type="png")
-        # Convert bytes to base64 string
-        base64_string = base64.b64encode(screenshot_bytes).decode('utf-8')
+        png_bytes = page.screenshot(type="png")
         print("screnshot taken")
         
-        return base64_string
+        return png_bytes
     except Exception as e:
         print(f"Failed to take screenshot: {str(e)}")
-        raise
\ No newline at end of file
+        raise
+
+
+def screenshot_helper(page: Page) -> str:
+    """
+    Take a screenshot and return it as a base64 string.
+    
+    Args:
+        page: Playwright Page object
+    
+    Returns:
+        str: Base64 encoded screenshot
+    """
+    # Convert bytes to base64 string
+    return base64.b64encode(screenshot_bytes(page)).decode('utf-8')
+
+
+def perceptual_hash(image_bytes: bytes, hash_size: int = 16) -> int:
+    """
+    Difference hash of a screenshot: one bit per neighbouring pixel pair of a small
+    grayscale thumbnail. Similar screens give hashes a few bits apart.
+    """
+    image = Image.open(BytesIO(image_bytes)).convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = np.asarray(image, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int("".join("1" if bit else "0" for bit in bits), 2)
+
+
+def hash_distance(a: int, b: int) -> int:
+    """Number of differing bits between two perceptual hashes."""
+    return bin(a ^ b).count("1")
+
+
+class FrameDiffer:
+    """
+    Crops screenshots down to the region that changed since the last full frame.
+
+    The last full frame sent (the keyframe) is kept as raw pixels. A new frame is
+    compared against it and, when the changed bounding box is small, only that region
+    is returned at full resolution together with its offset. After max_deltas
+    consecutive deltas the next frame is sent in full, so the keyframe the deltas
+    refer to is still among the images kept in the conversation.
+    """
+
+    def __init__(self, max_changed_fraction: float = 0.3, max_deltas: int = 1,
+                 threshold: int = 8, padding: int = 8):
+        self.max_changed_fraction = max_changed_fraction
+        self.max_deltas = max_deltas
+        self.threshold = threshold  # per-channel difference that counts as a change
+        self.padding = padding
+        self.keyframe: np.ndarray | None = None
+        # The keyframe as sent, so callers can tell whether the conversation still holds it
+        self.keyframe_image: bytes | None = None
+        self._keyframe_base64: str | None = None
+        self.deltas_since_keyframe = 0
+        self.stats = {"full_frames": 0, "delta_frames": 0, "bytes_sent": 0, "bytes_full": 0}
+
+    def reset(self) -> None:
+        self.keyframe = None
+        self.keyframe_image = None
+        self._keyframe_base64 = None
+        self.deltas_since_keyframe = 0
+
+    @property
+    def keyframe_base64(self) -> str | None:
+        """The keyframe image base64 encoded, as it appears in messages; encoded once."""
+        if self._keyframe_base64 is None and self.keyframe_image is not None:
+            self._keyframe_base64 = base64.b64encode(self.keyframe_image).decode("utf-8")
+        return self._keyframe_base64
+
+    def diff(self, png_bytes: bytes) -> tuple[bytes, tuple[int, int, int, int] | None]:
+        """
+        Return (png_bytes, None) for a full frame or (patch_png_bytes, (x, y, width, height))
+        for a cropped region of the changed pixels. The patch is empty if nothing changed.
+        """
+        frame = np.asarray(Image.open(BytesIO(png_bytes)).convert("RGB"))
+        self.stats["bytes_full"] += len(png_bytes)
+        box = self._changed_box(frame)
+
+        if box is None:
+            self.keyframe = frame
+            self.keyframe_image = png_bytes
+            self._keyframe_base64 = None
+            self.deltas_since_keyframe = 0
+            self.stats["full_frames"] += 1
+            self.stats["bytes_sent"] += len(png_bytes)
+            return png_bytes, None
+
+        x, y, width, height = box
+        patch = b""
+        if width and height:
+            buffer = BytesIO()
+            Image.fromarray(frame[y:y + height, x:x + width]).save(buffer, format="PNG")
+            patch = buffer.getvalue()
+        self.deltas_since_keyframe += 1
+        self.stats["delta_frames"] += 1
+        self.stats["bytes_sent"] += len(patch)
+        return patch, box
+
+    def _changed_box(self, frame: np.ndarray) -> tuple[int, int, int, int] | None:
+        """Bounding box of the pixels that changed, or None if a full frame should be sent."""
+        if (self.keyframe is None or self.keyframe.shape != frame.shape
+                or self.deltas_since_keyframe >= self.max_deltas):
+            return None
+
+        changed = (np.abs(frame.astype(np.int16) - self.keyframe.astype(np.int16)) > self.threshold).any(axis=2)
+        rows = np.flatnonzero(changed.any(axis=1))
+        cols = np.flatnonzero(changed.any(axis=0))
+        if rows.size == 0:
+            return 0, 0, 0, 0
+
+        frame_height, frame_width = changed.shape
+        top = max(int(rows[0]) - self.padding, 0)
+        bottom = min(int(rows[-1]) + 1 + self.padding, frame_height)
+        left = max(int(cols[0]) - self.padding, 0)
+        right = min(int(cols[-1]) + 1 + self.padding, frame_width)
+        if (bottom - top) * (right - left) > self.max_changed_fraction * frame_height * frame_width:
+            return None
+        return left, top, right - left, bottom - top
+
+
+MAX_EXTRACT_LEN = 8000  # characters of page text returned per page
+
+# Headings and links, which is usually enough to decide where to go next
+OUTLINE_SCRIPT = """
+() => {
+    const lines = [];
+    for (const e of document.querySelectorAll('h1, h2, h3, h4, a[href]')) {
+        const text = (e.innerText || '').trim().replace(/\\s+/g, ' ');
+        if (!text) continue;
+        if (e.tagName === 'A') {
+            lines.push(`[${text}](${e.href})`);
+        } else {
+            lines.push(`${'#'.repeat(Number(e.tagName[1]))} ${text}`);
+        }
+    }
+    return lines.join('\\n');
+}
+"""
+
+# Installed in every page of the browser context: counts DOM mutations, so the
+# fingerprint of a page that has not changed is reused instead of hashed again
+DOM_VERSION_SCRIPT = """
+window.__domVersion = 0;
+new MutationObserver(() => { window.__domVersion++; })
+    .observe(document, {childList: true, subtree: true, characterData: true});
+"""
+
+# Content version of the page: the element count plus a 32-bit FNV-1a hash of the
+# visible text, so a revisited page that has not changed matches its cached entry.
+# Where the mutation counter is installed the value is remembered per DOM version,
+# so asking again about an unchanged page costs no hashing.
+FINGERPRINT_SCRIPT = """
+() => {
+    const version = window.__domVersion;
+    const memo = window.__fingerprint;
+    if (version !== undefined && memo && memo.version === version) {
+        return memo.value;
+    }
+    const text = document.body ? document.body.innerText : '';
+    let hash = 0x811c9dc5;
+    for (let i = 0; i < text.length; i++) {
+        hash ^= text.charCodeAt(i);
+        hash = Math.imul(hash, 0x01000193) >>> 0;
+    }
+    const value = `${document.getElementsByTagName('*').length}-${hash.toString(16)}`;
+    if (version !== undefined) {
+        window.__fingerprint = {version, value};
+    }
+    return value;
+}
+"""
+
+
+def page_fingerprint(page: Page) -> str:
+    """A short string that changes whenever the page content does."""
+    return page.evaluate(FINGERPRINT_SCRIPT)
+
+
+def extract_page(page: Page, mode: str = "text", max_length: int = MAX_EXTRACT_LEN,
+                 fingerprint: Optional[str] = None) -> dict:
+    """
+    Extract the readable content of a loaded page.
+
+    Args:
+        page: Playwright Page object
+        mode: "text" for the visible text, "outline" for headings and links
+        max_length: characters of content to keep
+        fingerprint: the page's DOM fingerprint, if the caller already has it
+
+    Returns:
+        dict: url, title, content and DOM fingerprint of the page
+    """
+    if mode == "outline":
+        content = page.evaluate(OUTLINE_SCRIPT)
+    else:
+        content = page.evaluate("() => document.body ? document.body.innerText : ''")
+    if len(content) > max_length:
+        content = content[:max_length] + "\n<content clipped>"
+    if fingerprint is None:
+        fingerprint = page_fingerprint(page)
+    return {"url": page.url, "title": page.title(), "content": content, "fingerprint": fingerprint}
+
+
+# Starts a navigation without waiting for it; deferred so evaluate() returns before the page unloads
+NAVIGATE_SCRIPT = "url => { setTimeout(() => { window.location.href = url; }, 0); }"
+
+
+def fan_out_extract(context, urls: list[str], mode: str = "text", timeout: float = 30.0) -> list[dict]:
+    """
+    Load several URLs in parallel pages of a browser context and extract each one.
+
+    Navigations are all started before waiting on any of them, and the whole batch
+    shares one deadline, so the wall-clock time is close to that of the slowest site
+    rather than the sum. Only http(s) URLs are loaded. The pages are closed afterwards.
+
+    Returns:
+        list[dict]: one result per URL, in order, with an "error" key on failure
+    """
+    deadline = time.monotonic() + timeout
+
+    def remaining_ms() -> float:
+        # Playwright reads a timeout of 0 as no timeout at all
+        return max(deadline - time.monotonic(), 0.001) * 1000
+
+    def navigated(page) -> bool:
+        return page.url != "about:blank"
+
+    pages = []
+    try:
+        # Per URL: the loading page and the URLs it has loaded, or the error that kept it from starting
+        loading = []
+        for url in urls:
+            if urlparse(url).scheme not in ("http", "https"):
+                loading.append((url, None, None, "only http and https URLs can be loaded"))
+                continue
+            try:
+                page = context.new_page()
+                pages.append(page)
+                # Events are only delivered during Playwright calls, so one that fires while
+                # other pages are being started is caught here instead of waited for later
+                loaded = []
+                page.on("domcontentloaded", lambda loaded_page, loaded=loaded: loaded.append(loaded_page.url))
+                # goto() would block until the server responds; this returns at once
+                page.evaluate(NAVIGATE_SCRIPT, url)
+                loading.append((url, page, loaded, None))
+            except Exception as e:
+                loading.append((url, None, None, str(e)))
+
+        results = []
+        for url, page, loaded, error in loading:
+            if page is None:
+                results.append({"url": url, "error": error})
+                continue
+            try:
+                if not any(loaded_url != "about:blank" for loaded_url in loaded):
+                    page.wait_for_event("domcontentloaded", predicate=navigated, timeout=remaining_ms())
+                if page.url.startswith("chrome-error://"):
+                    raise RuntimeError(f"navigation to {url} failed")
+                results.append(extract_page(page, mode))
+            except Exception as e:
+                results.append({"url": url, "error": str(e)})
+        return results
+    finally:
+        for page in pages:
+            try:
+                page.close()
+            except Exception as e:
+                print(f"Failed to close page: {str(e)}")